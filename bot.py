@@ -1,13 +1,19 @@
 """Main bot entry point."""
 import asyncio
 import logging
+from datetime import datetime
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
 from config import settings
-from src.database.session import init_db, async_session
+from src.database.session import init_db, engine, LazySession
+from src.database.fsm_storage import SQLAlchemyStorage
+from src.services.id_generator import IdGenerator
+from src.services.outbox_service import OutboxWorker
+from src.services.scheduler import TaskScheduler
+from src.services.user_cache import user_cache
 from sqlalchemy import select
 
 # Import handlers
@@ -52,8 +58,19 @@ async def main():
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
     
-    # Create dispatcher with FSM storage
-    dp = Dispatcher(storage=MemoryStorage())
+    # Create dispatcher with FSM storage (persistent by default)
+    if settings.fsm_storage == "memory":
+        storage = MemoryStorage()
+    else:
+        storage = SQLAlchemyStorage(
+            engine,
+            cache_ttl=settings.fsm_cache_ttl,
+            flush_interval=settings.fsm_flush_interval
+        )
+    dp = Dispatcher(storage=storage)
+    
+    user_cache.ttl = settings.user_cache_ttl
+    user_cache.max_size = settings.user_cache_size
     
     # Register routers
     # GLOBAL NAVIGATION (Must be first to catch commands/states)
@@ -85,61 +102,90 @@ async def main():
     # Middleware to inject database session and handle user registration
     @dp.update.middleware()
     async def db_session_middleware(handler, event, data):
-        async with async_session() as session:
-            data['session'] = session
+        # Lazy session: connection is checked out only if a handler uses the DB
+        session = LazySession()
+        data['session'] = session
+        
+        # Get Telegram user info
+        tg_user = None
+        if hasattr(event, "from_user") and event.from_user:
+            tg_user = event.from_user
+        elif hasattr(event, "message") and event.message and event.message.from_user:
+            tg_user = event.message.from_user
+        elif hasattr(event, "callback_query") and event.callback_query and event.callback_query.from_user:
+            tg_user = event.callback_query.from_user
             
-            # Get Telegram user info
-            tg_user = None
-            if hasattr(event, "from_user") and event.from_user:
-                tg_user = event.from_user
-            elif hasattr(event, "message") and event.message and event.message.from_user:
-                tg_user = event.message.from_user
-            elif hasattr(event, "callback_query") and event.callback_query and event.callback_query.from_user:
-                tg_user = event.callback_query.from_user
-                
-            if tg_user:
-                logger.info(f"Update from ID: {tg_user.id} ({tg_user.full_name}) | Admin list: {settings.admin_id_list}")
-                from src.database.models import User
-                # Get or create user
+        if tg_user:
+            logger.info(f"Update from ID: {tg_user.id} ({tg_user.full_name}) | Admin list: {settings.admin_id_list}")
+            from src.database.models import User
+            # Get or create user (cached identity first, SELECT on miss)
+            user = user_cache.get_detached(tg_user.id)
+            if user:
+                session.adopt(user)
+            else:
                 query = select(User).where(User.id == tg_user.id)
                 result = await session.execute(query)
                 user = result.scalar_one_or_none()
-                
-                
-                if not user:
-                    user = User(
-                        id=tg_user.id,
-                        username=tg_user.username,
-                        first_name=tg_user.first_name,
-                        last_name=tg_user.last_name
-                    )
-                    session.add(user)
+            
+            if not user:
+                user = User(
+                    id=tg_user.id,
+                    referral_code=await IdGenerator.next_referral_code(session),
+                    username=tg_user.username,
+                    first_name=tg_user.first_name,
+                    last_name=tg_user.last_name
+                )
+                session.add(user)
+                await session.commit()
+                await session.refresh(user)
+                logger.info(f"Auto-registered new user: {tg_user.id}")
+            else:
+                changed = False
+                # Sync info if changed
+                if (user.username != tg_user.username or 
+                    user.first_name != tg_user.first_name or 
+                    user.last_name != tg_user.last_name):
+                    user.username = tg_user.username
+                    user.first_name = tg_user.first_name
+                    user.last_name = tg_user.last_name
+                    changed = True
+                # Record activity explicitly, at most once per interval
+                now = datetime.utcnow()
+                if (user.last_active_at is None or
+                        (now - user.last_active_at).total_seconds() >= settings.user_activity_interval):
+                    user.last_active_at = now
+                    changed = True
+                if changed:
                     await session.commit()
-                    await session.refresh(user)
-                    logger.info(f"Auto-registered new user: {tg_user.id}")
-                else:
-                    # Sync info if changed
-                    if (user.username != tg_user.username or 
-                        user.first_name != tg_user.first_name or 
-                        user.last_name != tg_user.last_name):
-                        user.username = tg_user.username
-                        user.first_name = tg_user.first_name
-                        user.last_name = tg_user.last_name
-                        await session.commit()
-                
-                data['user'] = user
+            
+            data['user'] = user
+            
+            if session.started:
+                # Don't hold the connection while the handler talks to Telegram
+                await session.commit()
 
-            # DEBUG LOGGING FOR ALL MESSAGES
-            if hasattr(event, "message") and event.message and event.message.text:
-                state = data.get('state')
-                current_state = await state.get_state() if state else "Unknown"
-                logger.info(f"📨 MESSAGE RECEIVED: '{event.message.text}' | User: {tg_user.id if tg_user else 'None'} | State: {current_state}")
-            elif hasattr(event, "callback_query") and event.callback_query:
-                state = data.get('state')
-                current_state = await state.get_state() if state else "Unknown"
-                logger.info(f"🔘 CALLBACK RECEIVED: '{event.callback_query.data}' | User: {tg_user.id if tg_user else 'None'} | State: {current_state}")
+        # DEBUG LOGGING FOR ALL MESSAGES
+        if hasattr(event, "message") and event.message and event.message.text:
+            state = data.get('state')
+            current_state = await state.get_state() if state else "Unknown"
+            logger.info(f"📨 MESSAGE RECEIVED: '{event.message.text}' | User: {tg_user.id if tg_user else 'None'} | State: {current_state}")
+        elif hasattr(event, "callback_query") and event.callback_query:
+            state = data.get('state')
+            current_state = await state.get_state() if state else "Unknown"
+            logger.info(f"🔘 CALLBACK RECEIVED: '{event.callback_query.data}' | User: {tg_user.id if tg_user else 'None'} | State: {current_state}")
 
-            return await handler(event, data)
+        try:
+            result = await handler(event, data)
+        except Exception:
+            await session.finish(commit=False)
+            raise
+        else:
+            await session.finish()
+        finally:
+            # Refresh cached identity with whatever the handler committed
+            if tg_user and data.get('user') is not None:
+                user_cache.put(data['user'])
+        return result
     
     # Run startup
     await on_startup()
@@ -147,16 +193,30 @@ async def main():
     # Set bot commands
     await setup_bot_commands(bot)
     
-    # Start polling
-    logger.info("Bot started successfully! 🚀")
+    # Cron jobs (each run takes a database lease, so several workers are fine)
+    scheduler = TaskScheduler(bot)
+    if settings.scheduler_enabled:
+        scheduler.start()
     
-    # FORCE DELETE WEBHOOK
-    logger.info("Deleting webhook to force polling...")
-    await bot.delete_webhook(drop_pending_updates=True)
+    # Delivers queued notifications (scheduler campaigns, admin alerts)
+    outbox_worker = OutboxWorker(bot)
+    outbox_worker.start()
     
+    logger.info("Bot started successfully! 🚀")
+
     try:
-        await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+        if settings.use_webhook:
+            # Webhook mode: Telegram pushes updates to our aiohttp server
+            from src.utils.webhook import run_webhook
+            await run_webhook(bot, dp)
+        else:
+            # FORCE DELETE WEBHOOK
+            logger.info("Deleting webhook to force polling...")
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
     finally:
+        await scheduler.stop()
+        await outbox_worker.stop()
         await bot.session.close()
 
 
@@ -20,9 +20,37 @@ class Settings(BaseSettings):
     openai_api_key: str = ""
     payment_provider_token: str = ""
     
+    # Webhook (leave webhook_url empty to use long polling)
+    webhook_url: str = ""  # Public base URL, e.g. https://bot.monkeyscoffee.com.ua
+    webhook_path: str = "/webhook"
+    webhook_secret: str = ""
+    webhook_host: str = "0.0.0.0"
+    webhook_port: int = 8080
+    webhook_max_concurrency: int = 50
+
     # Database
     database_url: str
     
+    # FSM storage: 'database' (persistent, shared between workers) or 'memory'
+    fsm_storage: str = "database"
+    # Per-worker read cache (seconds); not shared, so keep 0 with several workers
+    fsm_cache_ttl: float = 0.0
+    # Delay for batching FSM data writes (state is written at once); 0 with several workers
+    fsm_flush_interval: float = 0.2
+
+    # User identity cache used by the update middleware
+    user_cache_ttl: float = 60.0
+    user_cache_size: int = 10000
+    # Seconds between last_active_at updates of one user (activity segments)
+    user_activity_interval: int = 3600
+
+    # Catalog snapshot lifetime (admin edits invalidate it immediately)
+    catalog_cache_ttl: float = 300.0
+
+    # Admin analytics: per-query timeout (seconds) and parallel queries
+    analytics_query_timeout: float = 5.0
+    analytics_max_concurrency: int = 4
+
     # Payment
     liqpay_public_key: str = ""
     liqpay_private_key: str = ""
@@ -38,7 +66,27 @@ class Settings(BaseSettings):
     # Notifications
     enable_notifications: bool = True
     replenishment_reminder_days: int = 18
+    # Broadcast pacing (Telegram allows ~30 messages/s per bot)
+    broadcast_rate: float = 25.0
+    broadcast_concurrency: int = 10
     
+    # Notification outbox: drain interval (seconds) and attempts before giving up
+    outbox_poll_interval: float = 2.0
+    outbox_max_attempts: int = 5
+    outbox_retention_days: int = 30
+    
+    # Scheduled jobs: run in this worker, lease length (longest expected job run)
+    scheduler_enabled: bool = True
+    scheduler_lease_seconds: int = 3600
+    
+    # Cart housekeeping: carts with nothing added for this many days are purged
+    cart_idle_days: int = 30
+    
+    @property
+    def use_webhook(self) -> bool:
+        """Webhook mode is enabled when a public URL is configured."""
+        return bool(self.webhook_url)
+
     @property
     def admin_id_list(self) -> List[int]:
         """Parse admin IDs from comma-separated string."""
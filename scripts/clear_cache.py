@@ -64,12 +64,11 @@ async def clear_cache(clear_local_images: bool = False):
         print("📋 Cache cleared successfully!")
         print(f"   - Category file_ids: {cat_count}")
         print(f"   - Module image file_ids: {mod_count}")
-        print("   - FSM state: Will clear on bot restart")
+        print("   - FSM state: Persisted in fsm_records (not touched)")
         print("="*50)
         
-        print("\n💡 Note: FSM state (button states) is stored in memory")
-        print("   and will be automatically cleared when bot restarts.")
-        print("   Just restart the bot to clear FSM cache.")
+        print("\n💡 Note: FSM state (button states) is stored in the fsm_records table")
+        print("   and survives bot restarts. Set FSM_STORAGE=memory to keep it in memory.")
 
 
 async def main():
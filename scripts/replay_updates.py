@@ -0,0 +1,126 @@
+"""Replay recorded Telegram updates against the local webhook server (load testing).
+
+Accepted input formats:
+    * JSON array of Update objects
+    * raw getUpdates response: {"ok": true, "result": [...]}
+    * JSON Lines - one Update per line
+
+Example:
+    python scripts/replay_updates.py updates.json --repeat 20 --concurrency 100
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from collections import Counter
+from typing import List
+
+import aiohttp
+
+sys.path.append(os.getcwd())
+
+
+def load_updates(path: str) -> List[dict]:
+    """Load recorded updates from file."""
+    with open(path, "r", encoding="utf-8") as f:
+        raw = f.read().strip()
+
+    if not raw:
+        return []
+
+    if raw[0] in "[{":
+        try:
+            data = json.loads(raw)
+            if isinstance(data, dict):
+                data = data.get("result", [data])
+            return list(data)
+        except json.JSONDecodeError:
+            pass  # Probably JSON Lines
+
+    return [json.loads(line) for line in raw.splitlines() if line.strip()]
+
+
+async def replay(
+    url: str,
+    secret: str,
+    updates: List[dict],
+    repeat: int,
+    concurrency: int
+) -> None:
+    """POST updates to webhook and print latency/throughput summary."""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+
+    # Unique update_id per request so the dispatcher treats every copy as new
+    base_id = int(time.time()) * 1000
+    payloads = []
+    for i in range(repeat):
+        for j, update in enumerate(updates):
+            payload = dict(update)
+            payload["update_id"] = base_id + i * len(updates) + j
+            payloads.append(payload)
+
+    async with aiohttp.ClientSession(headers=headers) as http:
+
+        async def send(payload: dict):
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    async with http.post(url, json=payload) as resp:
+                        await resp.read()
+                        statuses[resp.status] += 1
+                except aiohttp.ClientError as e:
+                    statuses[type(e).__name__] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(send(p) for p in payloads))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+
+    def pct(p: float) -> float:
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000
+
+    print("=" * 50)
+    print(f"📨 Sent: {len(payloads)} updates in {elapsed:.2f}s ({len(payloads) / elapsed:.1f} upd/s)")
+    print(f"📊 Statuses: {dict(statuses)}")
+    print(f"⏱  Latency p50={pct(0.5):.1f}ms p95={pct(0.95):.1f}ms p99={pct(0.99):.1f}ms")
+    print("=" * 50)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded updates to local webhook")
+    parser.add_argument("file", help="File with recorded Update JSON")
+    parser.add_argument("--url", help="Webhook URL (default: local server from settings)")
+    parser.add_argument("--secret", help="Secret token (default: WEBHOOK_SECRET)")
+    parser.add_argument("--repeat", type=int, default=1, help="Replay the whole file N times")
+    parser.add_argument("--concurrency", type=int, default=20, help="Max in-flight requests")
+    args = parser.parse_args()
+
+    url = args.url
+    secret = args.secret
+    if url is None or secret is None:
+        from config import settings
+        if url is None:
+            url = f"http://127.0.0.1:{settings.webhook_port}{settings.webhook_path}"
+        if secret is None:
+            secret = settings.webhook_secret
+
+    updates = load_updates(args.file)
+    if not updates:
+        print("❌ No updates found in file")
+        return
+
+    print(f"🔁 Replaying {len(updates)} updates x{args.repeat} to {url}")
+    asyncio.run(replay(url, secret, updates, args.repeat, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
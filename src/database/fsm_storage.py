@@ -0,0 +1,235 @@
+"""Persistent aiogram FSM storage on top of the shared SQLAlchemy engine.
+
+State and data live in the ``fsm_records`` table, so checkout / admin flows
+survive restarts and several bot workers can serve the same users.
+
+* Reads hit the database unless ``fsm_cache_ttl`` enables a per-process
+  cache. It isn't invalidated by other workers, so only enable it when a
+  single worker serves the bot.
+* ``set_state`` writes through at once (together with any buffered data of
+  the process), so another worker never sees an old state.
+* ``set_data`` / ``update_data`` are buffered and flushed by a background task
+  after ``fsm_flush_interval`` seconds as one multi-row upsert, so a handler
+  doing five ``update_data`` calls costs one write. Until then other workers
+  see the previous data, and a crash loses it; with several workers serving
+  the same chats set ``fsm_flush_interval`` to 0 to write data at once too.
+* A failed flush keeps the records and is retried after ``FLUSH_RETRY_DELAY``.
+* On PostgreSQL + asyncpg the flush goes straight to the driver's
+  ``executemany``; other dialects (SQLite) use a SQLAlchemy upsert.
+"""
+import asyncio
+import json
+import logging
+import time
+from copy import deepcopy
+from typing import Any, Dict, Optional, Tuple
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, DefaultKeyBuilder, KeyBuilder, StateType, StorageKey
+from sqlalchemy import delete, func, select
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from src.database.models import FSMRecord
+
+logger = logging.getLogger(__name__)
+
+_PG_UPSERT = (
+    "INSERT INTO fsm_records (key, state, data, updated_at) "
+    "VALUES ($1, $2, $3, now()) "
+    "ON CONFLICT (key) DO UPDATE SET "
+    "state = EXCLUDED.state, data = EXCLUDED.data, updated_at = EXCLUDED.updated_at"
+)
+
+
+class SQLAlchemyStorage(BaseStorage):
+    """FSM storage backed by the ``fsm_records`` table."""
+
+    MAX_CACHE_SIZE = 10_000
+    FLUSH_RETRY_DELAY = 1.0  # seconds before a failed flush is retried
+
+    def __init__(
+        self,
+        engine: AsyncEngine,
+        key_builder: Optional[KeyBuilder] = None,
+        cache_ttl: float = 0.0,
+        flush_interval: float = 0.2,
+    ) -> None:
+        """
+        Args:
+            engine: Shared async engine (from src.database.session)
+            key_builder: Builder for record keys
+            cache_ttl: How long a record read from DB is trusted (seconds);
+                0 disables the cache. Keep it 0 when several workers serve the bot.
+            flush_interval: Delay for batching buffered data writes (seconds);
+                0 writes data at once, like state
+        """
+        self.engine = engine
+        self.key_builder = key_builder or DefaultKeyBuilder(with_bot_id=True, with_destiny=True)
+        self.cache_ttl = cache_ttl
+        self.flush_interval = flush_interval
+
+        # key -> (state, data, loaded_at)
+        self._cache: Dict[str, Tuple[Optional[str], Dict[str, Any], float]] = {}
+        # key -> (state, data) waiting to be written
+        self._pending: Dict[str, Tuple[Optional[str], Dict[str, Any]]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    # ---------- record access ----------
+
+    async def _load(self, key: StorageKey) -> Tuple[Optional[str], Dict[str, Any]]:
+        """Return (state, data) for key: pending write → cache → database."""
+        db_key = self.key_builder.build(key)
+
+        if db_key in self._pending:
+            return self._pending[db_key]
+
+        cached = self._cache.get(db_key)
+        if cached and time.monotonic() - cached[2] < self.cache_ttl:
+            return cached[0], cached[1]
+
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(FSMRecord.state, FSMRecord.data).where(FSMRecord.key == db_key)
+            )
+            row = result.first()
+
+        state, data = (row[0], row[1] or {}) if row else (None, {})
+        if self.cache_ttl > 0:
+            if len(self._cache) > self.MAX_CACHE_SIZE:
+                self._evict_expired()
+            self._cache[db_key] = (state, data, time.monotonic())
+        return state, data
+
+    def _evict_expired(self) -> None:
+        now = time.monotonic()
+        expired = [k for k, v in self._cache.items() if now - v[2] >= self.cache_ttl]
+        for k in expired:
+            self._cache.pop(k, None)
+
+    async def _store(
+        self,
+        key: StorageKey,
+        state: Optional[str],
+        data: Dict[str, Any],
+        write_through: bool = False
+    ) -> None:
+        """Buffer write and flush it now (write_through) or schedule a flush."""
+        db_key = self.key_builder.build(key)
+        self._pending[db_key] = (state, data)
+        if self.cache_ttl > 0:
+            self._cache[db_key] = (state, data, time.monotonic())
+
+        if write_through or self.flush_interval <= 0:
+            try:
+                await self.flush()
+                return
+            except Exception:
+                # Records are back in _pending; retry in the background as well
+                self._schedule_flush(self.FLUSH_RETRY_DELAY)
+                raise
+        self._schedule_flush(self.flush_interval)
+
+    def _schedule_flush(self, delay: float) -> None:
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush(delay))
+
+    async def _delayed_flush(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing FSM records, retrying in {self.FLUSH_RETRY_DELAY}s: {e}")
+            # Records were put back into _pending; don't wait for the next write
+            self._flush_task = asyncio.create_task(self._delayed_flush(self.FLUSH_RETRY_DELAY))
+
+    async def flush(self) -> int:
+        """Write all buffered records in one round trip.
+
+        Returns:
+            Number of records written
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return 0
+
+            batch, self._pending = self._pending, {}
+            # Cleared records (state.clear()) are deleted instead of stored empty
+            upserts = {k: v for k, v in batch.items() if v[0] is not None or v[1]}
+            deletes = [k for k in batch if k not in upserts]
+            try:
+                if upserts:
+                    if self.engine.dialect.name == "postgresql" and self.engine.dialect.driver == "asyncpg":
+                        await self._flush_asyncpg(upserts)
+                    else:
+                        await self._flush_sqlalchemy(upserts)
+                if deletes:
+                    async with self.engine.begin() as conn:
+                        await conn.execute(delete(FSMRecord).where(FSMRecord.key.in_(deletes)))
+            except Exception:
+                # Put records back unless they were overwritten meanwhile
+                for db_key, value in batch.items():
+                    self._pending.setdefault(db_key, value)
+                raise
+
+            return len(batch)
+
+    async def _flush_asyncpg(self, batch: Dict[str, Tuple[Optional[str], Dict[str, Any]]]) -> None:
+        """Fast path: driver-level executemany (atomic in asyncpg)."""
+        rows = [(db_key, state, json.dumps(data)) for db_key, (state, data) in batch.items()]
+        async with self.engine.connect() as conn:
+            raw = await conn.get_raw_connection()
+            await raw.driver_connection.executemany(_PG_UPSERT, rows)
+
+    async def _flush_sqlalchemy(self, batch: Dict[str, Tuple[Optional[str], Dict[str, Any]]]) -> None:
+        """Fallback: dialect upsert through SQLAlchemy (SQLite / psycopg)."""
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        rows = [
+            {"key": db_key, "state": state, "data": data}
+            for db_key, (state, data) in batch.items()
+        ]
+        stmt = insert(FSMRecord)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[FSMRecord.key],
+            set_={"state": stmt.excluded.state, "data": stmt.excluded.data, "updated_at": func.now()},
+        )
+        async with self.engine.begin() as conn:
+            await conn.execute(stmt, rows)
+
+    # ---------- BaseStorage API ----------
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        _, data = await self._load(key)
+        new_state = state.state if isinstance(state, State) else state
+        await self._store(key, new_state, data, write_through=True)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        state, _ = await self._load(key)
+        return state
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        state, _ = await self._load(key)
+        await self._store(key, state, deepcopy(data))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        _, data = await self._load(key)
+        return deepcopy(data)
+
+    async def update_data(self, key: StorageKey, data: Dict[str, Any]) -> Dict[str, Any]:
+        state, current = await self._load(key)
+        merged = {**current, **deepcopy(data)}
+        await self._store(key, state, merged)
+        return deepcopy(merged)
+
+    async def close(self) -> None:
+        """Flush buffered writes before shutdown."""
+        if self._flush_task and not self._flush_task.done():
+            self._flush_task.cancel()
+        try:
+            await self.flush()
+        except Exception as e:
+            logger.error(f"Error flushing FSM records on close: {e}")
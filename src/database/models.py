@@ -1,11 +1,11 @@
 """SQLAlchemy database models for Monkeys Coffee Roasters bot."""
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 import secrets
 import string
 
 from sqlalchemy import (
-    BigInteger, String, Integer, Float, Boolean, DateTime,
+    BigInteger, String, Integer, Float, Boolean, Date, DateTime,
     Text, JSON, ForeignKey, Index
 )
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
@@ -73,7 +73,10 @@ class User(Base):
     
     @staticmethod
     def _generate_referral_code(length: int = 8) -> str:
-        """Generate unique referral code."""
+        """Generate random referral code.
+        
+        Fallback only - new users get codes from IdGenerator.
+        """
         chars = string.ascii_uppercase + string.digits
         return ''.join(secrets.choice(chars) for _ in range(length))
     
@@ -124,6 +127,8 @@ class Product(Base):
     __table_args__ = (
         Index('idx_product_profile', 'profile'),
         Index('idx_product_active', 'is_active'),
+        # Keyset pagination of catalog pages: (sort_order, id) within a category
+        Index('idx_product_catalog_page', 'category', 'is_active', 'sort_order', 'id'),
     )
     
     def __repr__(self):
@@ -211,6 +216,9 @@ class Order(Base):
     
     # Relationships
     user: Mapped["User"] = relationship(back_populates="orders")
+    lines: Mapped[List["OrderLine"]] = relationship(
+        back_populates="order", cascade="all, delete-orphan"
+    )
     
     # Indexes
     __table_args__ = (
@@ -226,7 +234,10 @@ class Order(Base):
     
     @staticmethod
     def _generate_order_number() -> str:
-        """Generate order number in format MC-XXXX."""
+        """Generate order number in format MC-XXXX.
+        
+        Fallback only - OrderService assigns numbers from IdGenerator.
+        """
         import random
         return f"MC-{random.randint(1000, 9999)}"
     
@@ -234,6 +245,58 @@ class Order(Base):
         return f"<Order {self.order_number} user={self.user_id} total={self.total}>"
 
 
+class OrderLine(Base):
+    """Order item as a row (copy of Order.items for analytics queries)."""
+    __tablename__ = 'order_lines'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    order_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey('orders.id', ondelete='CASCADE'), nullable=False
+    )
+    # No FK: lines keep history when a product is deleted
+    product_id: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    name: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    
+    format: Mapped[str] = mapped_column(String(20))  # 300g, 1kg, unit
+    quantity: Mapped[int] = mapped_column(Integer)
+    price: Mapped[int] = mapped_column(Integer, default=0)
+    total: Mapped[int] = mapped_column(Integer, default=0)
+    weight_kg: Mapped[float] = mapped_column(Float, default=0.0)  # Whole line
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    
+    # Relationships
+    order: Mapped["Order"] = relationship(back_populates="lines")
+    
+    # Indexes
+    __table_args__ = (
+        Index('idx_order_line_order', 'order_id'),
+        Index('idx_order_line_product', 'product_id', 'created_at'),
+        Index('idx_order_line_format', 'format', 'created_at'),
+        Index('idx_order_line_created', 'created_at'),
+    )
+    
+    FORMAT_WEIGHT_KG = {"300g": 0.3, "1kg": 1.0}
+    
+    @classmethod
+    def values_from_item(cls, item: dict) -> dict:
+        """Column values for an Order.items entry."""
+        quantity = item.get('quantity', 0) or 0
+        price = item.get('price', 0) or 0
+        return {
+            'product_id': item.get('product_id'),
+            'name': item.get('name'),
+            'format': item.get('format') or 'unit',
+            'quantity': quantity,
+            'price': price,
+            'total': item.get('total', price * quantity) or 0,
+            'weight_kg': cls.FORMAT_WEIGHT_KG.get(item.get('format'), 0.0) * quantity,
+        }
+    
+    def __repr__(self):
+        return f"<OrderLine order={self.order_id} product={self.product_id} {self.format}x{self.quantity}>"
+
+
 class PromoCode(Base):
     """Promotional code model."""
     __tablename__ = 'promo_codes'
@@ -279,6 +342,180 @@ class PromoCode(Base):
         return f"<PromoCode {self.code} -{self.discount_percent}%>"
 
 
+class DailyMetric(Base):
+    """Per-day rollup for admin dashboards (by order creation date).
+    
+    Status counters cover all orders created that day; sales figures only
+    paid/shipped/delivered ones. Maintained by metrics_service.
+    """
+    __tablename__ = 'daily_metrics'
+    
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    
+    new_users: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Orders by current status
+    orders_pending: Mapped[int] = mapped_column(Integer, default=0)
+    orders_paid: Mapped[int] = mapped_column(Integer, default=0)
+    orders_shipped: Mapped[int] = mapped_column(Integer, default=0)
+    orders_delivered: Mapped[int] = mapped_column(Integer, default=0)
+    orders_cancelled: Mapped[int] = mapped_column(Integer, default=0)
+    
+    # Sales (paid, shipped, delivered)
+    sold_orders: Mapped[int] = mapped_column(Integer, default=0)
+    revenue: Mapped[int] = mapped_column(BigInteger, default=0)
+    subtotal: Mapped[int] = mapped_column(BigInteger, default=0)
+    kg: Mapped[float] = mapped_column(Float, default=0.0)
+    discount_volume: Mapped[int] = mapped_column(BigInteger, default=0)
+    discount_loyalty: Mapped[int] = mapped_column(BigInteger, default=0)
+    discount_promo: Mapped[int] = mapped_column(BigInteger, default=0)
+    orders_with_discount: Mapped[int] = mapped_column(Integer, default=0)
+    
+    def __repr__(self):
+        return f"<DailyMetric {self.day} orders={self.sold_orders} revenue={self.revenue}>"
+
+
+class UserFeature(Base):
+    """Precomputed per-user targeting features.
+    
+    Order columns are recomputed when one of the user's orders becomes (or
+    stops being) paid/shipped/delivered; cart columns are refreshed in one
+    pass before cart-based campaigns. Maintained by feature_service.
+    """
+    __tablename__ = 'user_features'
+    
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey('users.id', ondelete='CASCADE'), primary_key=True
+    )
+    
+    # Sold orders (paid, shipped, delivered)
+    orders_count: Mapped[int] = mapped_column(Integer, default=0)
+    favorite_profile: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    avg_packs: Mapped[float] = mapped_column(Float, default=0.0)  # 300g packs per order
+    avg_order_value: Mapped[int] = mapped_column(Integer, default=0)
+    first_order_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    last_order_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    order_cadence_days: Mapped[Optional[float]] = mapped_column(Float, nullable=True)  # Avg days between orders
+    
+    # Current cart
+    cart_packs: Mapped[int] = mapped_column(Integer, default=0)
+    cart_weight_kg: Mapped[float] = mapped_column(Float, default=0.0)
+    cart_value: Mapped[int] = mapped_column(Integer, default=0)
+    cart_refreshed_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    __table_args__ = (
+        Index('idx_user_features_orders', 'orders_count', 'favorite_profile'),
+        Index('idx_user_features_cart', 'cart_packs', 'cart_weight_kg'),
+        Index('idx_user_features_last_order', 'last_order_at'),
+    )
+    
+    def __repr__(self):
+        return f"<UserFeature {self.user_id} orders={self.orders_count} profile={self.favorite_profile}>"
+
+
+class IdSequence(Base):
+    """Named counter for block-allocated IDs (order numbers, referral codes)."""
+    __tablename__ = 'id_sequences'
+    
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    next_value: Mapped[int] = mapped_column(BigInteger, nullable=False)
+
+
+class OutboxMessage(Base):
+    """Rendered notification waiting to be sent (durable outbox).
+    
+    ``idempotency_key`` is '<campaign>:<scope>:<chat_id>' (scope is usually the
+    date), so enqueueing the same notification again is a no-op. Drained by
+    outbox_service.
+    """
+    __tablename__ = 'outbox'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    idempotency_key: Mapped[str] = mapped_column(String(255), unique=True, nullable=False)
+    campaign: Mapped[str] = mapped_column(String(50), nullable=False)
+    chat_id: Mapped[int] = mapped_column(BigInteger, nullable=False)
+    text: Mapped[str] = mapped_column(Text, nullable=False)
+    parse_mode: Mapped[Optional[str]] = mapped_column(String(20), nullable=True)
+    reply_markup: Mapped[Optional[dict]] = mapped_column(JSON, nullable=True)  # Serialized keyboard
+    
+    # pending, sent, blocked, failed
+    status: Mapped[str] = mapped_column(String(20), default='pending')
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    next_attempt_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    sent_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_outbox_due', 'status', 'next_attempt_at'),
+    )
+    
+    def __repr__(self):
+        return f"<OutboxMessage {self.idempotency_key} {self.status}>"
+
+
+class JobLease(Base):
+    """Cross-worker lock of a scheduled job (one row per job)."""
+    __tablename__ = 'job_leases'
+    
+    name: Mapped[str] = mapped_column(String(100), primary_key=True)
+    owner: Mapped[str] = mapped_column(String(255), nullable=False)  # host:pid:run token
+    acquired_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    locked_until: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+
+
+class JobRun(Base):
+    """Run history of scheduled jobs."""
+    __tablename__ = 'job_runs'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    job_name: Mapped[str] = mapped_column(String(100), nullable=False)
+    owner: Mapped[str] = mapped_column(String(255), nullable=False)
+    
+    # running, success, failed, cancelled
+    status: Mapped[str] = mapped_column(String(20), default='running')
+    result: Mapped[Optional[str]] = mapped_column(Text, nullable=True)  # Summary or error
+    
+    started_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
+    finished_at: Mapped[Optional[datetime]] = mapped_column(DateTime, nullable=True)
+    duration_ms: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+    
+    __table_args__ = (
+        Index('idx_job_run_name_started', 'job_name', 'started_at'),
+    )
+    
+    def __repr__(self):
+        return f"<JobRun {self.job_name} {self.status}>"
+
+
+class PromoRedemption(Base):
+    """Promo code use by a user (one row per order that redeemed a code)."""
+    __tablename__ = 'promo_redemptions'
+    
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
+    promo_code_id: Mapped[int] = mapped_column(
+        Integer, ForeignKey('promo_codes.id', ondelete='CASCADE'), nullable=False
+    )
+    user_id: Mapped[int] = mapped_column(
+        BigInteger, ForeignKey('users.id', ondelete='CASCADE'), nullable=False
+    )
+    order_id: Mapped[Optional[int]] = mapped_column(
+        Integer, ForeignKey('orders.id', ondelete='SET NULL'), nullable=True
+    )
+    
+    created_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now())
+    
+    __table_args__ = (
+        Index('idx_promo_redemption_code_user', 'promo_code_id', 'user_id'),
+        Index('idx_promo_redemption_order', 'order_id'),
+    )
+    
+    def __repr__(self):
+        return f"<PromoRedemption promo={self.promo_code_id} user={self.user_id} order={self.order_id}>"
+
+
 class TastingSet(Base):
     """Pre-configured tasting sets."""
     __tablename__ = 'tasting_sets'
@@ -363,3 +600,17 @@ class Category(Base):
 
     def __repr__(self):
         return f"<Category {self.slug}>"
+
+
+class FSMRecord(Base):
+    """Persistent aiogram FSM state/data (shared between bot workers)."""
+    __tablename__ = 'fsm_records'
+    
+    key: Mapped[str] = mapped_column(String(255), primary_key=True)  # Built by DefaultKeyBuilder
+    state: Mapped[Optional[str]] = mapped_column(String(255), nullable=True)
+    data: Mapped[dict] = mapped_column(JSON, default=dict)
+    
+    updated_at: Mapped[datetime] = mapped_column(DateTime, server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<FSMRecord {self.key} state={self.state}>"
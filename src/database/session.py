@@ -1,5 +1,6 @@
 """Database session management."""
-from typing import AsyncGenerator
+import logging
+from typing import Any, AsyncGenerator, List, Optional
 from sqlalchemy.ext.asyncio import (
     AsyncSession,
     AsyncEngine,
@@ -9,6 +10,8 @@ from sqlalchemy.ext.asyncio import (
 from config import settings
 from src.database.models import Base
 
+logger = logging.getLogger(__name__)
+
 
 # Create async engine
 # Create async engine
@@ -40,10 +43,98 @@ async_session = async_sessionmaker(
 )
 
 
+class LazySession:
+    """AsyncSession proxy for the update middleware.
+
+    The real session is created on first attribute access, so updates that
+    never touch the database (recipes, info screens, unhandled updates) don't
+    hold a pooled connection. Objects passed to ``adopt`` are attached to the
+    session when it is created.
+    """
+
+    def __init__(self, factory: async_sessionmaker = async_session):
+        self._factory = factory
+        self._session: Optional[AsyncSession] = None
+        self._adopted: List[Any] = []
+
+    @property
+    def started(self) -> bool:
+        """True if a real session was created."""
+        return self._session is not None
+
+    def adopt(self, instance: Any) -> None:
+        """Attach a detached ORM instance once the session is created (no SQL)."""
+        if self._session is not None:
+            self._session.add(instance)
+        else:
+            self._adopted.append(instance)
+
+    def _get_session(self) -> AsyncSession:
+        if self._session is None:
+            self._session = self._factory()
+            for instance in self._adopted:
+                self._session.add(instance)
+            self._adopted.clear()
+        return self._session
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self._get_session(), name)
+
+    async def finish(self, commit: bool = True) -> None:
+        """Commit (or roll back) and close the session if it was used."""
+        session, self._session = self._session, None
+        self._adopted.clear()
+        if session is None:
+            return
+        try:
+            if commit:
+                await session.commit()
+            else:
+                await session.rollback()
+        finally:
+            await session.close()
+
+
+def _create_missing_indexes(sync_conn) -> None:
+    """Create indexes added to models after their table already existed.
+
+    ``create_all`` only creates indexes together with new tables.
+    """
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            if index.unique:
+                # Unique indexes may fail on legacy data - leave them to migrations
+                continue
+            try:
+                with sync_conn.begin_nested():
+                    index.create(sync_conn, checkfirst=True)
+            except Exception as e:
+                logger.warning(f"Could not create index {index.name}: {e}")
+
+
 async def init_db():
     """Initialize database - create all tables."""
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_missing_indexes)
+        
+        # Order lines for orders created before order_lines existed
+        from src.services.order_service import OrderService
+        backfilled = await conn.run_sync(OrderService.backfill_order_lines)
+        if backfilled:
+            logger.info(f"Backfilled {backfilled} order lines")
+        
+        # Full-text product search index (FTS5 / tsvector + pg_trgm)
+        from src.services.search_service import SearchService
+        await conn.run_sync(SearchService.setup)
+    
+    # Dashboard rollup (built from history on first start)
+    from src.services.metrics_service import MetricsService
+    from src.services.feature_service import FeatureService
+    async with async_session() as session:
+        await MetricsService.ensure_built(session)
+        # Targeting features (maintained on order payment afterwards)
+        await FeatureService.ensure_built(session)
 
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
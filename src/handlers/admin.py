@@ -1,6 +1,7 @@
 """Admin panel handler."""
 import logging
 import asyncio
+import html
 from aiogram import Router, F, Bot
 from aiogram.filters import Command, StateFilter
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, FSInputFile
@@ -15,6 +16,11 @@ from sqlalchemy.orm import selectinload
 from src.database.models import Order, Product, User, PromoCode
 from src.services.order_service import OrderService
 from src.services.analytics_service import AnalyticsService
+from src.services.metrics_service import MetricsService
+from src.services.job_lease import JobLeaseService
+from src.services.segment_service import SEGMENT_NAMES
+from src.services.catalog_service import CatalogService
+from src.services.promo_service import PromoService
 from src.keyboards.admin_kb import (
     get_admin_panel_keyboard,
     get_order_management_keyboard,
@@ -165,7 +171,7 @@ async def show_admin_panel(message: Message, session: AsyncSession):
         await message.answer("❌ У вас немає доступу до адмін-панелі")
         return
     
-    stats = await AnalyticsService.get_general_statistics(session)
+    stats = await AnalyticsService.get_general_report()
     
     text = f"""
 <b>Адмін-Панель</b>
@@ -236,21 +242,65 @@ async def cmd_clear_cache(message: Message, session: AsyncSession):
             mod_count += 1
     
     await session.commit()
+    CatalogService.invalidate()
     
     # Clear in-memory image cache
     from src.utils.ui_utils import clear_module_image_cache
     await clear_module_image_cache()
     
+    # Clear user identity cache (report hit rate before reset)
+    from src.services.user_cache import user_cache
+    user_stats = user_cache.stats()
+    user_cache.invalidate()
+    
     await message.answer(
         f"🧹 <b>Кеш очищено!</b>\n\n"
         f"• Категорії: {cat_count} зображень\n"
         f"• Модулі: {mod_count} зображень\n"
+        f"• Користувачі: {user_stats['size']} (влучань {user_stats['hits']}, "
+        f"промахів {user_stats['misses']}, {user_stats['hit_rate']}%)\n"
         f"• Кеш в пам'яті: очищено\n\n"
-        f"<i>Примітка: Стан FSM очиститься при перезапуску бота.</i>",
+        f"<i>Примітка: Стан FSM зберігається в БД і не скидається при перезапуску.</i>",
         parse_mode="HTML"
     )
 
 
+@router.message(Command("rebuildmetrics"))
+async def cmd_rebuild_metrics(message: Message, session: AsyncSession):
+    """Recompute the daily dashboard rollup from order history."""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас немає доступу")
+        return
+    
+    days = await MetricsService.rebuild(session)
+    await message.answer(f"📊 Статистику перераховано: {days} днів.")
+
+
+@router.message(Command("jobs"))
+async def cmd_job_runs(message: Message, session: AsyncSession):
+    """Show recent scheduled job runs."""
+    if not is_admin(message.from_user.id):
+        await message.answer("❌ У вас немає доступу")
+        return
+    
+    runs = await JobLeaseService.get_recent_runs(session)
+    if not runs:
+        await message.answer("⏱ Фонові задачі ще не запускались.")
+        return
+    
+    status_icons = {'running': '⏳', 'success': '✅', 'failed': '❌', 'cancelled': '⛔'}
+    text = "<b>⏱ Останні запуски задач</b>\n\n"
+    for run in runs:
+        duration = f"{run.duration_ms / 1000:.1f} с" if run.duration_ms is not None else "—"
+        text += (
+            f"{status_icons.get(run.status, '•')} <b>{run.job_name}</b> "
+            f"{run.started_at.strftime('%d.%m %H:%M')} ({duration})\n"
+        )
+        if run.result:
+            text += f"<i>{html.escape(run.result[:200])}</i>\n"
+    await message.answer(text, parse_mode="HTML")
+
+
 @router.callback_query(F.data == "admin_main")
 async def show_admin_main(callback: CallbackQuery, session: AsyncSession):
     """Show admin panel main menu from callback."""
@@ -258,7 +308,7 @@ async def show_admin_main(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("❌ Доступ заборонено", show_alert=True)
         return
     
-    stats = await AnalyticsService.get_general_statistics(session)
+    stats = await AnalyticsService.get_general_report()
     
     text = f"""
 <b>Адмін-Панель</b>
@@ -634,7 +684,7 @@ async def show_general_statistics(callback: CallbackQuery, session: AsyncSession
         await callback.answer("❌ Доступ заборонено", show_alert=True)
         return
     
-    stats = await AnalyticsService.get_general_statistics(session)
+    stats = await AnalyticsService.get_general_report()
     
     text = """
 <b>📊 Загальна статистика</b>
@@ -675,14 +725,17 @@ async def show_general_statistics(callback: CallbackQuery, session: AsyncSession
         active_products=stats['active_products']
     )
     
-    # Check for alerts
-    alerts = await AnalyticsService.get_pending_orders_alerts(session)
+    # Alerts (queried together with the statistics)
+    alerts = stats['alerts']
     if alerts:
         text += "\n━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
         text += "<b>⚠️ УВАГА:</b>\n\n"
         for alert in alerts:
             text += f"• {alert['message']}\n"
     
+    if stats['unavailable']:
+        text += "\n<i>⏱ Частина даних тимчасово недоступна, спробуйте оновити пізніше.</i>\n"
+    
     keyboard = get_analytics_keyboard()
     
     await callback.message.edit_text(text, reply_markup=keyboard, parse_mode="HTML")
@@ -744,7 +797,11 @@ async def show_loyalty_distribution(callback: CallbackQuery, session: AsyncSessi
     
     text += "━━━━━━━━━━━━━━━━━━━━━━━━━━━\n"
     text += f"<b>💡 Інсайти:</b>\n\n"
-    text += f"Близько до рівня 2: {distribution['insights']['close_to_level_2']} клієнтів"
+    text += f"Близько до рівня 2: {distribution['insights']['close_to_level_2']} клієнтів\n\n"
+    
+    text += "<b>📊 Сегменти:</b>\n\n"
+    for name, count in distribution['segments'].items():
+        text += f"{SEGMENT_NAMES[name]}: {count}\n"
     
     keyboard = get_analytics_keyboard()
     
@@ -779,6 +836,10 @@ async def show_sales_statistics(callback: CallbackQuery, session: AsyncSession):
 • Замовлень/день: ~{round(stats['total_orders'] / 30, 1)}
 • Виручка/день: ~{format_currency(stats['total_revenue'] // 30)}
 """
+    if stats['top_products']:
+        text += "\n<b>Топ товарів:</b>\n"
+        for product in stats['top_products']:
+            text += f"• {product['name'] or product['product_id']} — {format_currency(product['revenue'])}, {product['kg']} кг\n"
     
     keyboard = get_analytics_keyboard()
     
@@ -928,6 +989,7 @@ async def cmd_init_categories(message: Message, session: AsyncSession):
         logger.info("CMD_INIT_CATEGORIES: Created 'equipment' as 'Магазин'.")
     
     await session.commit()
+    CatalogService.invalidate()
     logger.info("CMD_INIT_CATEGORIES: Committed changes.")
     await message.answer("✅ Категорії оновлено: тільки 'Кава' та 'Магазин'. Всі інші приховані.")
 
@@ -1332,6 +1394,7 @@ async def finalize_product_add(message: Message, state: FSMContext, session: Asy
         
         session.add(new_product)
         await session.commit()
+        CatalogService.invalidate()
         
         await message.answer(
             f"✅ <b>Товар успішно додано!</b>\n\n"
@@ -1355,6 +1418,7 @@ async def finalize_product_add(message: Message, state: FSMContext, session: Asy
             # Update product with path relative to assets if needed, but get_product_image handles it
             new_product.image_url = str(photo_path)
             await session.commit()
+            CatalogService.invalidate()
             
         await state.clear()
         
@@ -1385,6 +1449,7 @@ async def toggle_product_status(callback: CallbackQuery, session: AsyncSession):
     
     product.is_active = not product.is_active
     await session.commit()
+    CatalogService.invalidate()
     
     status = "активовано" if product.is_active else "деактивовано"
     await callback.answer(f"✅ Товар {status}!")
@@ -1528,6 +1593,7 @@ async def admin_toggle_product_status(callback: CallbackQuery, session: AsyncSes
     if product:
         product.is_active = not product.is_active
         await session.commit()
+        CatalogService.invalidate()
         await callback.answer(f"✅ Статус {product.name_ua} змінено")
         await show_products_list(callback, session)
     else:
@@ -1635,6 +1701,7 @@ async def show_promos_list(callback: CallbackQuery, session: AsyncSession):
     query = select(PromoCode).order_by(PromoCode.created_at.desc())
     result = await session.execute(query)
     promos = result.scalars().all()
+    unique_users = await PromoService.get_unique_users(session, [promo.id for promo in promos])
     
     text = "<b>🎫 Список промокодів</b>\n\n"
     
@@ -1643,7 +1710,7 @@ async def show_promos_list(callback: CallbackQuery, session: AsyncSession):
     for promo in promos:
         status = "✅" if promo.is_active else "🚫"
         text += f"{status} <b>{promo.code}</b> (-{promo.discount_percent}%)\n"
-        text += f"   Використано: {promo.used_count}/{promo.usage_limit or '∞'}\n"
+        text += f"   Використано: {promo.used_count}/{promo.usage_limit or '∞'} (клієнтів: {unique_users.get(promo.id, 0)})\n"
         text += f"   Мін. сума: {format_currency(promo.min_order_amount)}\n\n"
         
         # Add toggle button
@@ -1797,6 +1864,7 @@ async def process_promo_min_amount(message: Message, state: FSMContext, session:
     
     session.add(promo)
     await session.commit()
+    PromoService.invalidate(promo.code)
     
     await message.answer(
         f"✅ <b>Промокод створено!</b>\n\n"
@@ -1831,6 +1899,7 @@ async def toggle_promo_status(callback: CallbackQuery, session: AsyncSession):
     
     promo.is_active = not promo.is_active
     await session.commit()
+    PromoService.invalidate(promo.code)
     
     await show_promos_list(callback, session)
 
@@ -2067,6 +2136,7 @@ async def process_admin_product_ai_apply(callback: CallbackQuery, state: FSMCont
         if product:
             product.description = description
             await session.commit()
+            CatalogService.invalidate()
             await callback.answer("✅ Опис оновлено!")
             await callback.message.answer(f"✅ <b>Опис товару оновлено:</b>\n\n{description}", parse_mode="HTML")
             
@@ -2148,6 +2218,7 @@ async def process_product_edit_category(callback: CallbackQuery, state: FSMConte
                 if not product.profile or product.profile not in COFFEE_CATEGORIES:
                     product.profile = "universal"
                     await session.commit()  # Commit the profile change
+                    CatalogService.invalidate()
             else:
                 # If changing to non-coffee category, profile doesn't apply
                 # Keep existing or clear
@@ -2180,6 +2251,7 @@ async def process_product_edit_image(message: Message, state: FSMContext, sessio
     if product:
         product.image_url = str(photo_path)
         await session.commit()
+        CatalogService.invalidate()
         await message.answer(f"✅ Зображення для <b>{product.name_ua}</b> оновлено!", parse_mode="HTML")
         await admin_view_product_after_edit(message, product)
     
@@ -2244,6 +2316,7 @@ async def save_product_edit(event, state: FSMContext, session: AsyncSession, val
             setattr(product, field, value)
             
         await session.commit()
+        CatalogService.invalidate()
         await message.answer(f"✅ Поле <b>{field}</b> оновлено до: <code>{value}</code>", parse_mode="HTML")
         
         # Show updated product
@@ -2317,6 +2390,7 @@ async def admin_product_delete_confirm(callback: CallbackQuery, session: AsyncSe
         name = product.name_ua
         await session.delete(product)
         await session.commit()
+        CatalogService.invalidate()
         await callback.answer(f"🗑 {name} видалено", show_alert=True)
         await show_products_list(callback, session)
     else:
@@ -2753,6 +2827,7 @@ async def generate_product_image_ai(callback: CallbackQuery, session: AsyncSessi
             # Save to database
             product.image_url = str(local_path)
             await session.commit()
+            CatalogService.invalidate()
             
             await callback.message.answer_photo(
                 FSInputFile(local_path),
@@ -2904,6 +2979,7 @@ async def process_product_image_enhance(message: Message, state: FSMContext, ses
             if product:
                 product.image_url = str(local_path)
                 await session.commit()
+                CatalogService.invalidate()
             
             await message.answer_photo(
                 FSInputFile(local_path),
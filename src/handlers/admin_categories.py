@@ -13,6 +13,7 @@ from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Category, Product
+from src.services.catalog_service import CatalogService
 from src.states.admin_states import AdminStates
 from src.keyboards.main_menu import get_cancel_keyboard, get_admin_main_menu_keyboard
 from src.keyboards.admin_kb import get_image_management_keyboard
@@ -290,6 +291,7 @@ async def handle_category_sort(callback: CallbackQuery, session: AsyncSession):
         for i, cat in enumerate(categories):
             cat.sort_order = (i + 1) * 10
         await session.commit()
+        CatalogService.invalidate()
         await callback.answer("🔄 Категорії перемішано!")
         await show_category_management(callback, session)
         return
@@ -304,6 +306,7 @@ async def handle_category_sort(callback: CallbackQuery, session: AsyncSession):
         cat.sort_order = (i + 1) * 10
     
     await session.commit()
+    CatalogService.invalidate()
     await callback.answer("✅ Сортування застосовано!")
     await show_category_management(callback, session)
 
@@ -464,6 +467,7 @@ async def process_category_slug(message: Message, state: FSMContext, session: As
             )
             
             await session.commit()
+            CatalogService.invalidate()
             
             await message.answer(
                 f"✅ <b>Slug оновлено!</b>\n\n"
@@ -507,6 +511,7 @@ async def create_category(message: Message, state: FSMContext, session: AsyncSes
         )
         session.add(new_category)
         await session.commit()
+        CatalogService.invalidate()
         
         # Refresh session to get the new category ID
         await session.refresh(new_category)
@@ -641,6 +646,7 @@ async def move_category(callback: CallbackQuery, session: AsyncSession):
     target_cat.sort_order = current_order
     
     await session.commit()
+    CatalogService.invalidate()
     
     direction_text = "⬆️ Вгору" if direction == "up" else "⬇️ Вниз"
     await callback.answer(f"✅ Переміщено {direction_text}")
@@ -722,6 +728,7 @@ async def final_delete_category(callback: CallbackQuery, session: AsyncSession):
     # Delete the category
     await session.delete(category)
     await session.commit()
+    CatalogService.invalidate()
     
     await callback.answer("🗑 Категорію видалено!")
     
@@ -819,6 +826,7 @@ async def process_category_rename_final(message: Message, state: FSMContext, ses
             category.name_en = new_name
             
         await session.commit()
+        CatalogService.invalidate()
         
         # Return to category edit view
         await message.answer(f"✅ Назву оновлено!")
@@ -856,6 +864,7 @@ async def toggle_category(callback: CallbackQuery, session: AsyncSession):
     if category:
         category.is_active = not category.is_active
         await session.commit()
+        CatalogService.invalidate()
         await callback.answer(f"Статус змінено на: {'✅' if category.is_active else '🚫'}")
         
         # Refresh view
@@ -896,6 +905,7 @@ async def process_reorder(message: Message, state: FSMContext, session: AsyncSes
     if category:
         category.sort_order = new_order
         await session.commit()
+        CatalogService.invalidate()
         await message.answer(f"✅ Порядок змінено на {new_order}.", reply_markup=get_admin_main_menu_keyboard())
     else:
         await message.answer("❌ Категорію не знайдено.")
@@ -1020,6 +1030,7 @@ async def generate_category_image_ai(callback: CallbackQuery, session: AsyncSess
                 # Try to make path relative to project root
                 category.image_path = str(local_path)
                 await session.commit()
+                CatalogService.invalidate()
             except Exception as db_error:
                 logger.error(f"Error saving image path to DB: {db_error}")
                 # Still show the image even if DB save fails
@@ -1103,6 +1114,7 @@ async def process_category_image_upload(message: Message, state: FSMContext, ses
     # Save to database (file_id for Telegram)
     category.image_file_id = file_id
     await session.commit()
+    CatalogService.invalidate()
     
     await message.answer(
         f"✅ <b>Зображення для {category.name_ua} завантажено!</b>",
@@ -1132,6 +1144,7 @@ async def delete_category_image(callback: CallbackQuery, session: AsyncSession):
     category.image_file_id = None
     category.image_path = None
     await session.commit()
+    CatalogService.invalidate()
     
     await callback.answer("🗑 Зображення видалено")
     await callback.message.edit_text(
@@ -1,6 +1,6 @@
 """Wholesale discount management handlers."""
 import logging
-from typing import Optional
+from typing import List, Optional, Tuple
 
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
@@ -10,13 +10,27 @@ from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import VolumeDiscount
+from src.services.cart_service import CartService
+from src.services.discount_engine import DiscountEngine, PricingColumns, VolumeRuleSet
+from src.services.order_service import OrderService
 from src.states.admin_states import AdminStates
 from src.keyboards.main_menu import get_cancel_keyboard, get_admin_main_menu_keyboard
+from src.utils.formatters import format_currency
 from config import settings
 
 router = Router()
 logger = logging.getLogger(__name__)
 
+# Order history used by the what-if simulation
+SIMULATION_DAYS = 90
+
+# Rule types accepted in candidate rule sets (admin message)
+RULE_TYPES = {
+    'packs': 'packs', 'шт': 'packs',
+    'weight': 'weight', 'кг': 'weight',
+    'price': 'price', 'грн': 'price',
+}
+
 
 def is_admin(user_id: int) -> bool:
     """Check if user is admin."""
@@ -47,6 +61,7 @@ def get_discount_management_keyboard(discounts: list) -> InlineKeyboardBuilder:
         ))
         
     builder.row(InlineKeyboardButton(text="➕ Додати знижку", callback_data="admin_disc_add"))
+    builder.row(InlineKeyboardButton(text="🧪 Симуляція", callback_data="admin_disc_sim"))
     builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_content_main"))
     
     return builder.as_markup()
@@ -222,6 +237,7 @@ async def create_discount(message: Message, state: FSMContext, session: AsyncSes
         )
         session.add(new_discount)
         await session.commit()
+        DiscountEngine.invalidate_volume_rules()
         
         if new_discount.discount_type == 'weight':
             unit = "кг"
@@ -299,6 +315,7 @@ async def toggle_discount(callback: CallbackQuery, session: AsyncSession):
     if discount:
         discount.is_active = not discount.is_active
         await session.commit()
+        DiscountEngine.invalidate_volume_rules()
         await callback.answer(f"Статус змінено")
         
         # Refresh view
@@ -320,7 +337,172 @@ async def delete_discount(callback: CallbackQuery, session: AsyncSession):
     if discount:
         await session.delete(discount)
         await session.commit()
+        DiscountEngine.invalidate_volume_rules()
         await callback.answer("🗑 Знижку видалено")
         await show_discount_management(callback, session)
     else:
         await callback.answer("❌ Не знайдено", show_alert=True)
+
+
+# --- WHAT-IF SIMULATION ---
+
+def _compile_rules(discounts: list, toggled_id: Optional[int] = None) -> VolumeRuleSet:
+    """Compile discounts as if discount toggled_id was switched on/off."""
+    rules = [
+        (d.discount_type, d.threshold, d.discount_percent)
+        for d in discounts
+        if d.is_active != (d.id == toggled_id)
+    ]
+    return VolumeRuleSet.compile(rules) if rules else VolumeRuleSet.legacy()
+
+
+def _parse_rules(text: str) -> List[Tuple[str, float, int]]:
+    """Parse a candidate rule set: one '<тип> <поріг> <відсоток>' rule per line.
+    
+    Raises:
+        ValueError: With a message for the admin
+    """
+    rules = []
+    for number, line in enumerate(text.strip().splitlines(), start=1):
+        parts = line.replace(",", ".").replace("%", "").split()
+        if not parts:
+            continue
+        if len(parts) != 3 or parts[0].lower() not in RULE_TYPES:
+            raise ValueError(f"рядок {number}: очікується '<тип> <поріг> <відсоток>'")
+        try:
+            threshold, percent = float(parts[1]), int(parts[2])
+        except ValueError:
+            raise ValueError(f"рядок {number}: поріг і відсоток мають бути числами")
+        if threshold <= 0 or not (1 <= percent <= 99):
+            raise ValueError(f"рядок {number}: поріг більше 0, відсоток від 1 до 99")
+        rules.append((RULE_TYPES[parts[0].lower()], threshold, percent))
+    if not rules:
+        raise ValueError("немає жодного правила")
+    return rules
+
+
+def _format_delta(amount: int) -> str:
+    sign = "+" if amount >= 0 else "−"
+    return f"{sign}{format_currency(abs(amount))}"
+
+
+async def _load_simulation_data(session: AsyncSession):
+    """Discounts, open carts and recent orders for the what-if simulation."""
+    query = select(VolumeDiscount).order_by(VolumeDiscount.threshold.asc())
+    result = await session.execute(query)
+    discounts = result.scalars().all()
+    
+    carts = PricingColumns.from_rows(await CartService.get_open_cart_metrics(session))
+    orders = PricingColumns.from_rows(await OrderService.get_order_metrics(session, SIMULATION_DAYS))
+    return discounts, carts, orders
+
+
+@router.callback_query(F.data == "admin_disc_sim")
+async def simulate_discounts(callback: CallbackQuery, session: AsyncSession):
+    """Show revenue impact of switching each discount on/off."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ заборонено", show_alert=True)
+        return
+    
+    discounts, carts, orders = await _load_simulation_data(session)
+    current = _compile_rules(discounts)
+    baseline = DiscountEngine.simulate(current, current, orders)
+    
+    text = (
+        "<b>🧪 Симуляція оптових знижок</b>\n\n"
+        f"Дані: {len(carts)} відкритих кошиків, {len(orders)} оплачених замовлень за {SIMULATION_DAYS} днів.\n"
+        f"Оптові знижки за період: {format_currency(baseline.current_discount)} з {format_currency(baseline.gross)}.\n\n"
+        "Зміна виручки, якщо перемкнути знижку:\n\n"
+    )
+    
+    elapsed_ms = baseline.elapsed_ms
+    for discount in discounts:
+        candidate = _compile_rules(discounts, toggled_id=discount.id)
+        cart_result = DiscountEngine.simulate(current, candidate, carts)
+        order_result = DiscountEngine.simulate(current, candidate, orders)
+        elapsed_ms += cart_result.elapsed_ms + order_result.elapsed_ms
+        
+        if discount.discount_type == 'weight':
+            unit = "кг"
+        elif discount.discount_type == 'packs':
+            unit = "шт"
+        else:
+            unit = "грн"
+        status_icon = "✅" if discount.is_active else "🚫"
+        action = "вимкнути" if discount.is_active else "увімкнути"
+        
+        text += (
+            f"{status_icon} > {discount.threshold}{unit} (-{discount.discount_percent}%) → <b>{action}</b>\n"
+            f"   Кошики: {_format_delta(cart_result.revenue_delta)} ({cart_result.carts_changed} змін)\n"
+            f"   Замовлення: {_format_delta(order_result.revenue_delta)} ({order_result.carts_changed} змін)\n"
+        )
+    
+    if not discounts:
+        text += "Знижок ще немає.\n"
+    
+    text += f"\n<i>Розрахунок: {elapsed_ms:.1f} мс.</i>"
+    
+    builder = InlineKeyboardBuilder()
+    builder.row(InlineKeyboardButton(text="✍️ Свій набір правил", callback_data="admin_disc_sim_rules"))
+    builder.row(InlineKeyboardButton(text="🔙 Назад", callback_data="admin_content_discounts"))
+    
+    await callback.message.edit_text(text, reply_markup=builder.as_markup(), parse_mode="HTML")
+    await callback.answer()
+
+
+@router.callback_query(F.data == "admin_disc_sim_rules")
+async def start_rules_simulation(callback: CallbackQuery, state: FSMContext):
+    """Ask for a candidate rule set to compare with the current one."""
+    if not is_admin(callback.from_user.id):
+        await callback.answer("❌ Доступ заборонено", show_alert=True)
+        return
+    
+    await state.set_state(AdminStates.waiting_for_discount_simulation_rules)
+    await callback.message.answer(
+        "✍️ <b>Свій набір правил</b>\n\n"
+        "Надішліть правила, по одному в рядку: <code>тип поріг відсоток</code>\n"
+        "Типи: <code>шт</code> (пачки), <code>кг</code> (вага), <code>грн</code> (сума).\n\n"
+        "Наприклад:\n<code>шт 3 5\nшт 5 10\nкг 2 12</code>\n\n"
+        "Набір повністю замінює поточні знижки; нічого не зберігається.",
+        reply_markup=get_cancel_keyboard(),
+        parse_mode="HTML"
+    )
+    await callback.answer()
+
+
+@router.message(AdminStates.waiting_for_discount_simulation_rules)
+async def simulate_rule_set(message: Message, state: FSMContext, session: AsyncSession):
+    """Compare the current discounts with a candidate rule set."""
+    if not is_admin(message.from_user.id):
+        return
+    
+    try:
+        rules = _parse_rules(message.text or "")
+    except ValueError as e:
+        await message.answer(f"❌ {e}. Спробуйте ще раз або /cancel")
+        return
+    
+    discounts, carts, orders = await _load_simulation_data(session)
+    current = _compile_rules(discounts)
+    candidate = VolumeRuleSet.compile(rules)
+    cart_result = DiscountEngine.simulate(current, candidate, carts)
+    order_result = DiscountEngine.simulate(current, candidate, orders)
+    
+    units = {'packs': "шт", 'weight': "кг", 'price': "грн"}
+    rules_text = "\n".join(
+        f"• > {threshold}{units[discount_type]} (-{percent}%)" for discount_type, threshold, percent in rules
+    )
+    text = (
+        "<b>🧪 Симуляція набору правил</b>\n\n"
+        f"{rules_text}\n\n"
+        f"Кошики ({len(carts)}): {_format_delta(cart_result.revenue_delta)} "
+        f"({cart_result.carts_changed} змін)\n"
+        f"Замовлення за {SIMULATION_DAYS} днів ({len(orders)}): {_format_delta(order_result.revenue_delta)} "
+        f"({order_result.carts_changed} змін)\n"
+        f"Оптові знижки за період: {format_currency(order_result.current_discount)} → "
+        f"{format_currency(order_result.candidate_discount)}\n\n"
+        f"<i>Розрахунок: {cart_result.elapsed_ms + order_result.elapsed_ms:.1f} мс.</i>"
+    )
+    
+    await state.clear()
+    await message.answer(text, reply_markup=get_admin_main_menu_keyboard(), parse_mode="HTML")
@@ -8,7 +8,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import Product, User
 from src.services.cart_service import CartService
-from src.utils.formatters import format_currency
+from src.utils.formatters import format_currency, format_skipped_items
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 from src.utils.image_constants import MODULE_TASTING_SETS
@@ -197,19 +197,14 @@ async def add_bundle_to_cart(callback: CallbackQuery, session: AsyncSession):
     product_ids = [int(pid) for pid in callback.data.split(":")[1].split(",")]
     user_id = callback.from_user.id
     
-    added_count = 0
-    for product_id in product_ids:
-        await CartService.add_to_cart(
-            session=session,
-            user_id=user_id,
-            product_id=product_id,
-            format="300g",
-            quantity=1
-        )
-        added_count += 1
+    added = await CartService.bulk_add_to_cart(
+        session,
+        user_id,
+        [{"product_id": product_id, "format": "300g", "quantity": 1} for product_id in product_ids]
+    )
     
     await callback.answer(
-        f"✅ Набір додано! ({added_count} позицій)",
+        f"✅ Набір додано! ({added.added} позицій){format_skipped_items(added.skipped)}",
         show_alert=True
     )
     
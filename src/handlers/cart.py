@@ -7,9 +7,10 @@ from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import User, PromoCode
+from src.database.models import User
 from src.services.cart_service import CartService
 from src.services.discount_engine import DiscountEngine
+from src.services.promo_service import PromoService
 from src.keyboards.cart_kb import get_cart_keyboard, get_empty_cart_keyboard
 from src.keyboards.main_menu import get_cancel_keyboard
 from src.utils.formatters import format_currency, format_order_items, format_discount_info
@@ -28,14 +29,15 @@ logger = logging.getLogger(__name__)
 # Fallbacks: match any message containing the word 'Кошик' (case-insensitive)
 @router.message(F.text.lower().contains("кошик"))
 @router.callback_query(F.data == CallbackPrefix.CART_VIEW)
-async def show_cart(event: Message | CallbackQuery, session: AsyncSession, state: FSMContext = None):
+async def show_cart(event: Message | CallbackQuery, session: AsyncSession, state: FSMContext = None, user: User = None):
     """Display shopping cart with full discount breakdown."""
     user_id = event.from_user.id if isinstance(event, Message) else event.from_user.id
     
-    # Get user for loyalty level
-    user_query = select(User).where(User.id == user_id)
-    user_result = await session.execute(user_query)
-    user = user_result.scalar_one_or_none()
+    # Get user for loyalty level (injected by middleware when available)
+    if user is None or user.id != user_id:
+        user_query = select(User).where(User.id == user_id)
+        user_result = await session.execute(user_query)
+        user = user_result.scalar_one_or_none()
     
     if not user:
         text = "Помилка: користувач не знайдений"
@@ -94,18 +96,13 @@ async def show_cart(event: Message | CallbackQuery, session: AsyncSession, state
             await event.answer()
         return
     
-    # Get active volume discounts
-    from src.database.models import VolumeDiscount
-    query_dist = select(VolumeDiscount).where(VolumeDiscount.is_active == True)
-    res_dist = await session.execute(query_dist)
-    active_rules = res_dist.scalars().all()
+    # Get active volume discounts (compiled, cached)
+    active_rules = await DiscountEngine.get_volume_rules(session)
     
     # Load active promo code from user record
     promo_code_obj = None
     if user.active_promo_code:
-        promo_query = select(PromoCode).where(PromoCode.code == user.active_promo_code)
-        promo_result = await session.execute(promo_query)
-        promo_code_obj = promo_result.scalar_one_or_none()
+        promo_code_obj = await PromoService.get_promo(session, user.active_promo_code)
         # If promo is no longer valid, clear it
         if promo_code_obj and not promo_code_obj.is_valid():
             user.active_promo_code = None
@@ -193,7 +190,7 @@ async def show_cart(event: Message | CallbackQuery, session: AsyncSession, state
 
 
 @router.callback_query(F.data.startswith(CallbackPrefix.CART_INCREASE))
-async def increase_quantity(callback: CallbackQuery, session: AsyncSession):
+async def increase_quantity(callback: CallbackQuery, session: AsyncSession, user: User = None):
     """Increase cart item quantity."""
     cart_item_id = int(callback.data.replace(CallbackPrefix.CART_INCREASE, ""))
     
@@ -203,11 +200,11 @@ async def increase_quantity(callback: CallbackQuery, session: AsyncSession):
     await callback.answer("✅ Кількість збільшено")
     
     # Refresh cart display
-    await show_cart(callback, session)
+    await show_cart(callback, session, user=user)
 
 
 @router.callback_query(F.data.startswith(CallbackPrefix.CART_DECREASE))
-async def decrease_quantity(callback: CallbackQuery, session: AsyncSession):
+async def decrease_quantity(callback: CallbackQuery, session: AsyncSession, user: User = None):
     """Decrease cart item quantity."""
     cart_item_id = int(callback.data.replace(CallbackPrefix.CART_DECREASE, ""))
     
@@ -220,11 +217,11 @@ async def decrease_quantity(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("✅ Товар видалено з кошика")
     
     # Refresh cart display
-    await show_cart(callback, session)
+    await show_cart(callback, session, user=user)
 
 
 @router.callback_query(F.data.startswith(CallbackPrefix.CART_REMOVE))
-async def remove_from_cart(callback: CallbackQuery, session: AsyncSession):
+async def remove_from_cart(callback: CallbackQuery, session: AsyncSession, user: User = None):
     """Remove item from cart."""
     cart_item_id = int(callback.data.replace(CallbackPrefix.CART_REMOVE, ""))
     
@@ -236,7 +233,7 @@ async def remove_from_cart(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("❌ Товар не знайдено", show_alert=True)
     
     # Refresh cart display
-    await show_cart(callback, session)
+    await show_cart(callback, session, user=user)
 
 
 @router.callback_query(F.data == CallbackPrefix.CART_PROMO)
@@ -254,22 +251,20 @@ async def enter_promo_code(callback: CallbackQuery, state: FSMContext):
 
 
 @router.message(PromoCodeStates.waiting_for_code)
-async def process_promo_code(message: Message, state: FSMContext, session: AsyncSession):
+async def process_promo_code(message: Message, state: FSMContext, session: AsyncSession, user: User = None):
     """Process entered promo code."""
     text = message.text.strip()
     
     if text == "❌ Скасувати" or text == "/cancel" or text == "🪵 Скасувати":
         await state.clear()
         await message.answer("❌ Введення промокоду скасовано")
-        await show_cart(message, session)
+        await show_cart(message, session, user=user)
         return
 
     code = text.upper()
     
     # Validate and check promo code
-    query = select(PromoCode).where(PromoCode.code == code)
-    result = await session.execute(query)
-    promo_code = result.scalar_one_or_none()
+    promo_code = await PromoService.get_promo(session, code)
     
     if not promo_code:
         await message.answer("❌ Промокод не знайдено. Спробуйте інший або /cancel")
@@ -280,9 +275,10 @@ async def process_promo_code(message: Message, state: FSMContext, session: Async
         return
     
     # Save promo code to user record in DB (persists across FSM state resets)
-    user_query = select(User).where(User.id == message.from_user.id)
-    user_result = await session.execute(user_query)
-    user = user_result.scalar_one_or_none()
+    if user is None:
+        user_query = select(User).where(User.id == message.from_user.id)
+        user_result = await session.execute(user_query)
+        user = user_result.scalar_one_or_none()
     if user:
         user.active_promo_code = code
         await session.commit()
@@ -296,7 +292,7 @@ async def process_promo_code(message: Message, state: FSMContext, session: Async
         parse_mode="HTML"
     )
     # Refresh cart to show updated price
-    await show_cart(message, session)
+    await show_cart(message, session, user=user)
 
 
 
@@ -2,12 +2,12 @@
 import logging
 from aiogram import Router, F
 from aiogram.filters import Command
-from aiogram.types import Message, CallbackQuery, FSInputFile, InputMediaPhoto
+from aiogram.types import Message, CallbackQuery, FSInputFile, InputMediaPhoto, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Product, User, Category
+from src.database.models import Product, User
 from src.keyboards.catalog_kb import (
     get_format_selection_keyboard,
     get_profile_filter_keyboard,
@@ -16,9 +16,11 @@ from src.keyboards.catalog_kb import (
     get_product_details_keyboard
 )
 from src.services.cart_service import CartService
+from src.services.catalog_service import CatalogService, CatalogPage
+from src.services.search_service import SearchService
 from src.utils.formatters import format_tasting_notes, format_date, format_currency
 from src.utils.constants import CallbackPrefix
-from src.utils.image_constants import get_category_image, get_category_image_async, get_product_image, CATEGORY_UNIVERSAL, MODULE_CATALOG_MAP
+from src.utils.image_constants import get_category_image, get_product_image, CATEGORY_UNIVERSAL, MODULE_CATALOG_MAP
 
 router = Router()
 logger = logging.getLogger(__name__)
@@ -105,80 +107,28 @@ async def select_profile(callback: CallbackQuery, session: AsyncSession):
     # Format: cat_prof:slug
     slug = callback.data.replace(CallbackPrefix.CATALOG_PROFILE, "")
     
-    # Check if this slug is a known coffee sub-profile (espresso/filter/universal)
-    # These filter within the 'coffee' category by Product.profile
-    COFFEE_PROFILES = {"espresso", "filter", "universal"}
+    # First page (rows + total count in one query, cached in catalog snapshot)
+    catalog_page = await CatalogService.get_page(session, slug)
     
-    if slug == "all":
-        # All coffee products (any category that is NOT equipment)
-        # First try to get all non-equipment categories from DB
-        cat_query = select(Category).where(
-            Category.is_active == True,
-            Category.slug != "equipment"
-        )
-        cat_result = await session.execute(cat_query)
-        non_equip_cats = [c.slug for c in cat_result.scalars().all()]
-        
-        if non_equip_cats:
-            query = select(Product).where(
-                Product.category.in_(non_equip_cats),
-                Product.is_active == True
-            ).order_by(Product.sort_order)
-        else:
-            # Fallback: hardcoded 'coffee' category
-            query = select(Product).where(
-                Product.category == "coffee",
-                Product.is_active == True
-            ).order_by(Product.sort_order)
-    elif slug in COFFEE_PROFILES:
-        # Sub-profile filter within coffee: show matching profile + universal
-        from src.utils.constants import CoffeeProfile
-        # Try to find products with this profile in any non-equipment category
-        query = select(Product).where(
-            ((Product.profile == slug) | (Product.profile == CoffeeProfile.UNIVERSAL)),
-            Product.category != "equipment",
-            Product.is_active == True
-        ).order_by(Product.sort_order)
-    else:
-        # Dynamic category slug — filter directly by Product.category == slug
-        query = select(Product).where(
-            Product.category == slug,
-            Product.is_active == True
-        ).order_by(Product.sort_order)
-    
-    result = await session.execute(query)
-    products = result.scalars().all()
-    
-    if not products:
+    if not catalog_page.products:
         await callback.answer("Пусто... Мабуть, все випили. Зазирни пізніше!", show_alert=True)
         return
     
     # Show first page
-    await show_product_page(callback.message, products, 0, slug, session, callback.from_user.id, is_edit=True)
+    await show_product_page(callback.message, catalog_page, slug, session, callback.from_user.id, is_edit=True)
     await callback.answer()
 
 
 
 async def show_product_page(
     message,
-    products: list,
-    page: int,
+    catalog_page: CatalogPage,
     selected_profile: str,
     session: AsyncSession,
     user_id: int,
     is_edit: bool = False
 ):
     """Show a page of products (Interactive Menu)."""
-    total_products = len(products)
-    # Increase items per page for list view (e.g. 5)
-    ITEMS_PER_PAGE = 5
-    total_pages = (total_products + ITEMS_PER_PAGE - 1) // ITEMS_PER_PAGE
-    
-    start_idx = page * ITEMS_PER_PAGE
-    end_idx = min(start_idx + ITEMS_PER_PAGE, total_products)
-    
-    page_products = products[start_idx:end_idx]
-    
     # Get cart count for display
     cart_count = await CartService.get_cart_count(session, user_id)
     cart_text = f"🟠 У кошику: {cart_count} лотів\n\n" if cart_count > 0 else ""
@@ -200,10 +150,17 @@ async def show_product_page(
     
     # Get interactive menu keyboard
     from src.keyboards.catalog_kb import get_product_list_keyboard
-    keyboard = get_product_list_keyboard(page_products, page, total_pages, selected_profile)
+    keyboard = get_product_list_keyboard(
+        catalog_page.products,
+        catalog_page.page,
+        catalog_page.total_pages,
+        selected_profile,
+        first_key=catalog_page.first_key,
+        last_key=catalog_page.last_key
+    )
     
     # Get category image (from DB first, then static fallback)
-    image_path = await get_category_image_async(selected_profile, session)
+    image_path = await CatalogService.get_category_image(session, selected_profile)
     if not image_path:
         image_path = get_category_image(selected_profile)
     logger.info(f"Selected profile: {selected_profile}, Image path: {image_path}, Exists: {image_path.exists() if image_path else 'None'}")
@@ -240,61 +197,35 @@ async def show_product_page(
 @router.callback_query(F.data.startswith(CallbackPrefix.CATALOG_PAGE))
 async def change_page(callback: CallbackQuery, session: AsyncSession):
     """Handle pagination (switches pages in List View)."""
-    # Format: cat_page:page:profile
+    # Format: cat_page:page:profile[:cursor] (cursor: a<sort>_<id> / b<sort>_<id>)
     parts = callback.data.replace(CallbackPrefix.CATALOG_PAGE, "").split(":")
     page = int(parts[0])
     selected_profile = parts[1]
     
-    # Reload products using same logic as select_profile
-    logger.info(f"Changing page to {page} for slug {selected_profile}")
-    COFFEE_PROFILES = {"espresso", "filter", "universal"}
-    
-    if selected_profile == "all":
-        cat_query = select(Category).where(
-            Category.is_active == True,
-            Category.slug != "equipment"
-        )
-        cat_result = await session.execute(cat_query)
-        non_equip_cats = [c.slug for c in cat_result.scalars().all()]
-        
-        if non_equip_cats:
-            query = select(Product).where(
-                Product.category.in_(non_equip_cats),
-                Product.is_active == True
-            ).order_by(Product.sort_order)
-        else:
-            query = select(Product).where(
-                Product.category == "coffee",
-                Product.is_active == True
-            ).order_by(Product.sort_order)
-    elif selected_profile in COFFEE_PROFILES:
-        from src.utils.constants import CoffeeProfile
-        query = select(Product).where(
-            ((Product.profile == selected_profile) | (Product.profile == CoffeeProfile.UNIVERSAL)),
-            Product.category != "equipment",
-            Product.is_active == True
-        ).order_by(Product.sort_order)
-    else:
-        # Dynamic category slug
-        query = select(Product).where(
-            Product.category == selected_profile,
-            Product.is_active == True
-        ).order_by(Product.sort_order)
-
+    after = before = None
+    if len(parts) > 2 and parts[2][:1] in ("a", "b"):
+        try:
+            sort_order, product_id = (int(x) for x in parts[2][1:].split("_"))
+            if parts[2][0] == "a":
+                after = (sort_order, product_id)
+            else:
+                before = (sort_order, product_id)
+        except ValueError:
+            pass
     
-    result = await session.execute(query)
-    products = result.scalars().all()
+    # Keyset page from SQL (or catalog snapshot cache)
+    logger.info(f"Changing page to {page} for slug {selected_profile}")
+    catalog_page = await CatalogService.get_page(session, selected_profile, page, after=after, before=before)
 
     # If query returned nothing, inform user instead of deleting message
-    if not products:
+    if not catalog_page.products:
         await callback.answer("Пусто... Мабуть, все випили. Зазирни пізніше!", show_alert=True)
         return
 
     # Use is_edit=True for show_product_page
     await show_product_page(
         callback.message, 
-        products, 
-        page, 
+        catalog_page, 
         selected_profile, 
         session, 
         callback.from_user.id,
@@ -446,13 +377,8 @@ async def handle_search_query(message: Message, session: AsyncSession):
         # Too short, ignore or suggest typing more
         return
 
-    # Search by name (UA)
-    stmt = select(Product).where(
-        Product.name_ua.ilike(f"%{query_text}%"),
-        Product.is_active == True
-    )
-    result = await session.execute(stmt)
-    products = result.scalars().all()
+    # Ranked full-text + fuzzy search (names, origin, region, variety, notes)
+    products = await SearchService.search(session, query_text)
 
     if not products:
         # Optional: Reply that nothing was found? 
@@ -8,12 +8,14 @@ from aiogram.types import (
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload # Додано для правильного завантаження товарів
 
-from src.database.models import User, PromoCode, VolumeDiscount, Order
+from src.database.models import User, Order
 from src.services.cart_service import CartService
 from src.services.order_service import OrderService
-from src.services.discount_engine import DiscountEngine
+from src.services.pricing_service import PricingService
+from src.services.promo_service import PromoService
+from src.services.outbox_service import OutboxService
+from src.services.broadcast_service import OutgoingMessage
 from src.keyboards.checkout_kb import (
     get_grind_selection_keyboard,
     get_delivery_method_keyboard,
@@ -40,47 +42,38 @@ logger = logging.getLogger(__name__)
 # ==========================================
 # 🔄 ДОПОМІЖНА ФУНКЦІЯ ГЕНЕРАЦІЇ ЗАМОВЛЕННЯ
 # ==========================================
-async def _generate_and_send_order_preview(message: Message, state: FSMContext, session: AsyncSession, user_id: int):
+async def _generate_and_send_order_preview(message: Message, state: FSMContext, session: AsyncSession, user_id: int, user: User = None):
     """Спільна логіка створення замовлення для швидкого та повного чекауту."""
     data = await state.get_data()
     
-    # Отримуємо користувача
-    user_query = select(User).where(User.id == user_id)
-    user_result = await session.execute(user_query)
-    user = user_result.scalar_one_or_none()
+    # Отримуємо користувача (якщо middleware ще не передав його)
+    if user is None or user.id != user_id:
+        user_query = select(User).where(User.id == user_id)
+        user_result = await session.execute(user_query)
+        user = user_result.scalar_one_or_none()
     
     if not user:
         await message.bot.send_message(chat_id=user_id, text="❌ Помилка: користувач не знайдений")
         await state.clear()
         return
     
-    cart_items = await CartService.get_cart_items(session, user_id)
-    if not cart_items:
-        await message.bot.send_message(chat_id=user_id, text="❌ Кошик порожній!")
-        await state.clear()
-        return
+    # The middleware's user may be a cached snapshot; checkout writes the row
+    # (promo, delivery details), so work with current values
+    await session.refresh(user)
     
     # Знижки — читаємо промокод з user.active_promo_code (зберігається в БД)
     promo_code_used = user.active_promo_code or data.get('promo_code')
-    promo_code_obj = None
-    if promo_code_used:
-        promo_query = select(PromoCode).where(PromoCode.code == promo_code_used.upper())
-        promo_result = await session.execute(promo_query)
-        promo_code_obj = promo_result.scalar_one_or_none()
-
-    
-    query_dist = select(VolumeDiscount).where(VolumeDiscount.is_active == True)
-    res_dist = await session.execute(query_dist)
-    active_rules = res_dist.scalars().all()
     
-    discount_breakdown = DiscountEngine.calculate_full_discount(cart_items, user, promo_code_obj, active_rules=active_rules)
+    # Один розрахунок кошика (товари, знижки, доставка) — його ж використає замовлення
+    quote = await PricingService.quote(session, user, data['delivery_method'], promo_code_used)
+    if quote is None:
+        await message.bot.send_message(chat_id=user_id, text="❌ Кошик порожній!")
+        await state.clear()
+        return
     
-    # Доставка
-    delivery_cost = OrderService._calculate_delivery_cost(
-        data['delivery_method'],
-        discount_breakdown.final_total
-    )
-    is_free_delivery = delivery_cost == 0 and discount_breakdown.final_total >= settings.free_delivery_threshold
+    discount_breakdown = quote.breakdown
+    delivery_cost = quote.delivery_cost
+    is_free_delivery = quote.is_free_delivery
     
     # Створення замовлення (pending)
     try:
@@ -93,7 +86,8 @@ async def _generate_and_send_order_preview(message: Message, state: FSMContext,
             recipient_name=data['recipient_name'],
             recipient_phone=data['recipient_phone'],
             grind_preference=data['grind_preference'],
-            promo_code_used=promo_code_used
+            promo_code_used=promo_code_used,
+            quote=quote
         )
         # Clear the promo code after it's been applied to the order
         if user.active_promo_code:
@@ -198,12 +192,13 @@ async def handle_checkout_cancel_inline(callback: CallbackQuery, state: FSMConte
     
     if order_id:
         try:
-            query = select(Order).options(selectinload(Order.items)).where(Order.id == order_id)
+            query = select(Order).where(Order.id == order_id)
             result = await session.execute(query)
             order = result.scalar_one_or_none()
             
             if order and order.status == "pending":
-                # Restore cart items before deleting the order
+                # Give back the promo code use and restore cart items before deleting the order
+                await PromoService.release(session, order.id)
                 await CartService.restore_cart_from_pending_order(session, callback.from_user.id, order.items)
                 await session.delete(order)
                 await session.commit()
@@ -228,7 +223,7 @@ async def handle_checkout_cancel_inline(callback: CallbackQuery, state: FSMConte
 # ==========================================
 
 @router.callback_query(F.data == "cart_checkout")
-async def start_checkout(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def start_checkout(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user: User = None):
     user_id = callback.from_user.id
     
     cart_items = await CartService.get_cart_items(session, user_id)
@@ -238,9 +233,10 @@ async def start_checkout(callback: CallbackQuery, state: FSMContext, session: As
     
     await state.clear()
     
-    user_query = select(User).where(User.id == user_id)
-    result = await session.execute(user_query)
-    user = result.scalar_one_or_none()
+    if user is None:
+        user_query = select(User).where(User.id == user_id)
+        result = await session.execute(user_query)
+        user = result.scalar_one_or_none()
     
     if user and user.delivery_city and user.last_address:
         text = f"""
@@ -333,7 +329,7 @@ async def process_grind_selection(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(CheckoutStates.waiting_for_delivery_method, F.data.startswith("delivery:"))
-async def process_delivery_method(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def process_delivery_method(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user: User = None):
     delivery_method = callback.data.split(":")[1]
     await state.update_data(delivery_method=delivery_method)
     
@@ -345,7 +341,7 @@ async def process_delivery_method(callback: CallbackQuery, state: FSMContext, se
             await callback.message.delete()
         except Exception:
             pass
-        await _generate_and_send_order_preview(callback.message, state, session, callback.from_user.id)
+        await _generate_and_send_order_preview(callback.message, state, session, callback.from_user.id, user)
         await callback.answer()
         return
 
@@ -476,7 +472,7 @@ async def process_recipient_name(message: Message, state: FSMContext):
 
 
 @router.message(CheckoutStates.waiting_for_recipient_phone, F.text)
-async def process_recipient_phone(message: Message, state: FSMContext, session: AsyncSession):
+async def process_recipient_phone(message: Message, state: FSMContext, session: AsyncSession, user: User = None):
     if message.text == "❌ Скасувати":
         await cancel_checkout(message, state)
         return
@@ -490,7 +486,7 @@ async def process_recipient_phone(message: Message, state: FSMContext, session:
         return
     
     await state.update_data(recipient_phone=phone)
-    await _generate_and_send_order_preview(message, state, session, message.from_user.id)
+    await _generate_and_send_order_preview(message, state, session, message.from_user.id, user)
 
 
 @router.callback_query(F.data == "checkout_edit")
@@ -562,10 +558,10 @@ async def edit_checkout_recipient(callback: CallbackQuery, state: FSMContext):
 
 
 @router.callback_query(F.data == "checkout_edit_back")
-async def edit_checkout_back(callback: CallbackQuery, state: FSMContext, session: AsyncSession):
+async def edit_checkout_back(callback: CallbackQuery, state: FSMContext, session: AsyncSession, user: User = None):
     """Return to order confirmation."""
     # Re-generate preview
-    await _generate_and_send_order_preview(callback.message, state, session, callback.from_user.id)
+    await _generate_and_send_order_preview(callback.message, state, session, callback.from_user.id, user)
     await callback.answer()
 
 
@@ -575,12 +571,13 @@ async def cancel_checkout(message: Message, state: FSMContext, session: AsyncSes
     
     if order_id:
         try:
-            query = select(Order).options(selectinload(Order.items)).where(Order.id == order_id)
+            query = select(Order).where(Order.id == order_id)
             result = await session.execute(query)
             order = result.scalar_one_or_none()
             
             if order and order.status == "pending":
-                # Restore cart items before deleting the order
+                # Give back the promo code use and restore cart items before deleting the order
+                await PromoService.release(session, order.id)
                 await CartService.restore_cart_from_pending_order(session, message.from_user.id, order.items)
                 await session.delete(order)
                 await session.commit()
@@ -673,6 +670,22 @@ async def on_successful_payment(message: Message, session: AsyncSession):
         return
 
     order.status = "paid"
+    # Admin notifications are committed together with the status (sent by the outbox worker)
+    await OutboxService.enqueue(
+        session,
+        [
+            OutgoingMessage(
+                chat_id=admin_id,
+                text=f"💰 <b>НОВА ОПЛАТА (Apple/Google Pay)</b> ✅\n\n"
+                     f"Замовлення: #{order.order_number}\n"
+                     f"Сума: {payment_info.total_amount / 100} {payment_info.currency}\n"
+                     f"Користувач: {message.from_user.full_name} (@{message.from_user.username})"
+            )
+            for admin_id in settings.admin_id_list
+        ],
+        campaign="admin_payment",
+        scope=order.id
+    )
     await session.commit()
     
     await CartService.clear_cart(session, message.from_user.id)
@@ -690,15 +703,3 @@ async def on_successful_payment(message: Message, session: AsyncSession):
         parse_mode="HTML",
         reply_markup=keyboard
     )
-    
-    for admin_id in settings.admin_id_list:
-        try:
-            await message.bot.send_message(
-                admin_id,
-                f"💰 <b>НОВА ОПЛАТА (Apple/Google Pay)</b> ✅\n\n"
-                f"Замовлення: #{order.order_number}\n"
-                f"Сума: {payment_info.total_amount / 100} {payment_info.currency}\n"
-                f"Користувач: {message.from_user.full_name} (@{message.from_user.username})"
-            )
-        except Exception:
-            pass
\ No newline at end of file
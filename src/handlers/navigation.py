@@ -7,6 +7,7 @@ from aiogram.fsm.context import FSMContext
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from config import settings
+from src.database.models import User
 from src.keyboards.main_menu import get_admin_main_menu_keyboard, get_main_menu_keyboard
 from src.handlers.start import cmd_start, show_main_menu, show_about, show_support
 from src.handlers.support import show_recipes_menu
@@ -62,9 +63,9 @@ async def global_catalog(message: Message, session: AsyncSession, state: FSMCont
 
 
 @router.message(StateFilter("*"), F.text == "🛒 Мій Кошик")
-async def global_cart(message: Message, session: AsyncSession, state: FSMContext):
+async def global_cart(message: Message, session: AsyncSession, state: FSMContext, user: User = None):
     await state.clear()
-    await show_cart(message, session, state)
+    await show_cart(message, session, state, user=user)
 
 
 @router.message(StateFilter("*"), F.text == "👤 Мій Кабінет")
@@ -74,14 +75,14 @@ async def global_profile(message: Message, session: AsyncSession, state: FSMCont
 
 
 @router.message(StateFilter("*"), F.text == "🎟️ Спецпропозиції")
-async def global_promotions(message: Message, session: AsyncSession, state: FSMContext):
+async def global_promotions(message: Message, session: AsyncSession, state: FSMContext, user: User = None):
     await state.clear()
-    # Get user from database
-    from sqlalchemy import select
-    from src.database.models import User
-    query = select(User).where(User.id == message.from_user.id)
-    result = await session.execute(query)
-    user = result.scalar_one_or_none()
+    # User is injected by middleware; fall back to database
+    if user is None:
+        from sqlalchemy import select
+        query = select(User).where(User.id == message.from_user.id)
+        result = await session.execute(query)
+        user = result.scalar_one_or_none()
     await show_promotions(message, session, user)
     
 @router.message(StateFilter("*"), F.text.in_({"📖 Корисна Інфо", "🐒 Про нас"}))
@@ -9,7 +9,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from src.services.order_service import OrderService
 from src.services.payment_service import payment_service
 from src.keyboards.checkout_kb import get_payment_keyboard
-from src.utils.formatters import format_currency, format_date, format_order_items
+from src.utils.formatters import format_currency, format_date, format_order_items, format_skipped_items
 from src.utils.constants import ORDER_STATUS_NAMES
 from src.utils.image_constants import MODULE_ORDERS
 
@@ -297,29 +297,23 @@ async def repeat_order(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("❌ Замовлення не знайдено", show_alert=True)
         return
     
-    # Add items from order to cart
-    added_count = 0
-    for item in order.items:
-        try:
-            await CartService.add_to_cart(
-                session,
-                user_id=callback.from_user.id,
-                product_id=item['product_id'],
-                format=item['format'],
-                quantity=item['quantity']
-            )
-            added_count += 1
-        except Exception as e:
-            logger.error(f"Error adding item to cart: {e}")
-    
-    if added_count > 0:
+    # Add items from order to cart (one upsert + one commit for the whole order)
+    added = None
+    try:
+        added = await CartService.bulk_add_to_cart(session, callback.from_user.id, order.items or [])
+    except Exception as e:
+        logger.error(f"Error adding items to cart: {e}")
+    
+    if added and added.added > 0:
         await callback.answer(
-            f"✅ Додано {added_count} товарів до кошика!\n"
-            f"Перейдіть в кошик для оформлення.",
+            f"✅ Додано {added.added} товарів до кошика!\n"
+            f"Перейдіть в кошик для оформлення."
+            f"{format_skipped_items(added.skipped)}",
             show_alert=True
         )
     else:
-        await callback.answer("❌ Не вдалося додати товари", show_alert=True)
+        skipped = format_skipped_items(added.skipped) if added else ""
+        await callback.answer(f"❌ Не вдалося додати товари{skipped}", show_alert=True)
 
 
 @router.callback_query(F.data.startswith("order_pay:"))
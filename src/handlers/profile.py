@@ -6,11 +6,10 @@ from aiogram.types import Message, CallbackQuery
 from aiogram.fsm.context import FSMContext
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
 
 from src.database.models import User, Order
 from src.services.cart_service import CartService
-from src.utils.formatters import format_currency, format_date
+from src.utils.formatters import format_currency, format_date, format_skipped_items
 from src.utils.constants import CallbackPrefix
 from src.states.profile_states import ProfileEditStates
 
@@ -98,7 +97,7 @@ async def repeat_last_order(callback: CallbackQuery, session: AsyncSession):
     user_id = callback.from_user.id
     
     # Get last paid order with items
-    query = select(Order).options(selectinload(Order.items)).where(
+    query = select(Order).where(
         Order.user_id == user_id,
         Order.status != "cancelled", 
         Order.status != "pending"
@@ -111,25 +110,25 @@ async def repeat_last_order(callback: CallbackQuery, session: AsyncSession):
         await callback.answer("❌ Немає попередніх замовлень для повтору", show_alert=True)
         return
     
-    # Add items to cart
-    added_count = 0
-    for item in last_order.items:
-        await CartService.add_to_cart(
-            session=session,
-            user_id=user_id,
-            product_id=item.product_id,
-            format=item.format,
-            quantity=item.quantity
-        )
-        added_count += 1
+    # Add items to cart (order.items is a JSON list of dicts; one upsert for all)
+    added = await CartService.bulk_add_to_cart(session, user_id, last_order.items or [])
         
-    if added_count > 0:
-        await callback.answer(f"✅ {added_count} товарів додано в кошик!")
+    if added.added > 0:
+        if added.skipped:
+            await callback.answer(
+                f"✅ {added.added} товарів додано в кошик!{format_skipped_items(added.skipped)}",
+                show_alert=True
+            )
+        else:
+            await callback.answer(f"✅ {added.added} товарів додано в кошик!")
         # Redirect to cart
         from src.handlers.cart import show_cart
         await show_cart(callback, session)
     else:
-        await callback.answer("⚠️ Не вдалося відновити товари (можливо, вони видалені)", show_alert=True)
+        await callback.answer(
+            f"⚠️ Не вдалося відновити товари (можливо, вони видалені){format_skipped_items(added.skipped)}",
+            show_alert=True
+        )
 
 
 @router.callback_query(F.data == "profile_edit_data")
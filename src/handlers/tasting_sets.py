@@ -1,4 +1,5 @@
 """Tasting sets handler - pre-configured coffee bundles."""
+import logging
 from aiogram import Router, F
 from aiogram.types import Message, CallbackQuery, FSInputFile
 from aiogram.fsm.context import FSMContext
@@ -7,13 +8,14 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import TastingSet, Product
 from src.services.cart_service import CartService
-from src.utils.formatters import format_currency
+from src.utils.formatters import format_currency, format_skipped_items
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 from aiogram.types import InlineKeyboardButton
 from src.utils.image_constants import MODULE_TASTING_SETS
 from src.utils.admin_utils import is_admin
 
 router = Router()
+logger = logging.getLogger(__name__)
 
 
 @router.message(F.text == "🎁 Дегустаційні набори")
@@ -257,31 +259,30 @@ async def add_tasting_set_to_cart(callback: CallbackQuery, session: AsyncSession
         await callback.answer("❌ Набір не знайдено", show_alert=True)
         return
     
-    # Add all products from the set to cart
-    added_count = 0
-    for product_id in tasting_set.product_ids:
-        try:
-            await CartService.add_to_cart(
-                session=session,
-                user_id=user_id,
-                product_id=product_id,
-                format="300g",  # Tasting sets are 300g format
-                quantity=1
-            )
-            added_count += 1
-        except Exception as e:
-            continue
+    # Add all products from the set to cart (Tasting sets are 300g format)
+    added = None
+    try:
+        added = await CartService.bulk_add_to_cart(
+            session,
+            user_id,
+            [{"product_id": product_id, "format": "300g", "quantity": 1} for product_id in tasting_set.product_ids]
+        )
+    except Exception as e:
+        logger.error(f"Error adding tasting set to cart: {e}")
     
-    if added_count > 0:
+    if added and added.added > 0:
         await callback.answer(
             f"✅ Набір додано до кошика!\n"
-            f"Додано {added_count} сортів кави",
+            f"Додано {added.added} сортів кави"
+            f"{format_skipped_items(added.skipped)}",
             show_alert=True
         )
         
         # Show cart
         from src.handlers.cart import show_cart
         await show_cart(callback, session)
+    elif added and added.skipped:
+        await callback.answer(f"❌ Кава з набору зараз недоступна{format_skipped_items(added.skipped)}", show_alert=True)
     else:
         await callback.answer("❌ Помилка додавання набору", show_alert=True)
 
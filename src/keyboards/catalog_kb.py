@@ -139,7 +139,22 @@ def get_product_card_keyboard(product_id: int, page: int = 0) -> InlineKeyboardM
     return builder.as_markup()
 
 
-def get_product_list_keyboard(products: list, current_page: int, total_pages: int, selected_profile: str) -> InlineKeyboardMarkup:
+def _page_callback(page: int, selected_profile: str, cursor: str = "") -> str:
+    """Build catalog page callback, dropping the cursor if over Telegram's 64-byte limit."""
+    data = f"{CallbackPrefix.CATALOG_PAGE}{page}:{selected_profile}"
+    if cursor and len(data.encode()) + len(cursor) + 1 <= 64:
+        data += f":{cursor}"
+    return data
+
+
+def get_product_list_keyboard(
+    products: list,
+    current_page: int,
+    total_pages: int,
+    selected_profile: str,
+    first_key: tuple = None,
+    last_key: tuple = None
+) -> InlineKeyboardMarkup:
     builder = InlineKeyboardBuilder()
     
     for product in products:
@@ -151,13 +166,17 @@ def get_product_list_keyboard(products: list, current_page: int, total_pages: in
     if total_pages > 1:
         buttons = []
         
+        # Keyset cursors: 'b<sort_order>_<id>' = before first item, 'a...' = after last item
+        prev_cursor = f"b{first_key[0]}_{first_key[1]}" if first_key else ""
+        next_cursor = f"a{last_key[0]}_{last_key[1]}" if last_key else ""
+        
         if current_page > 0:
-            buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=f"{CallbackPrefix.CATALOG_PAGE}{current_page-1}:{selected_profile}"))
+            buttons.append(InlineKeyboardButton(text="⬅️ Назад", callback_data=_page_callback(current_page - 1, selected_profile, prev_cursor)))
         
         buttons.append(InlineKeyboardButton(text=f"{current_page + 1}/{total_pages}", callback_data="page_info"))
         
         if current_page < total_pages - 1:
-            buttons.append(InlineKeyboardButton(text="Далі ➡️", callback_data=f"{CallbackPrefix.CATALOG_PAGE}{current_page+1}:{selected_profile}"))
+            buttons.append(InlineKeyboardButton(text="Далі ➡️", callback_data=_page_callback(current_page + 1, selected_profile, next_cursor)))
         
         builder.row(*buttons)
     
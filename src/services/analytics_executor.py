@@ -0,0 +1,99 @@
+"""Concurrent execution of independent read-only analytics queries.
+
+An AsyncSession must not be used by several coroutines at once, so dashboard
+queries sharing the handler's session run one after another. The executor
+gives every query its own short-lived session (and pooled connection), runs
+them concurrently with a per-query timeout and returns whatever finished:
+a slow or failing query leaves a gap in the report instead of failing it.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.session import async_session
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+Query = Callable[[AsyncSession], Awaitable[Any]]
+
+
+@dataclass
+class AnalyticsBatch:
+    """Results of one executor run."""
+    results: Dict[str, Any] = field(default_factory=dict)
+    timed_out: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    @property
+    def complete(self) -> bool:
+        return not self.timed_out and not self.failed
+
+    @property
+    def missing(self) -> List[str]:
+        return self.timed_out + self.failed
+
+    def get(self, name: str, default: Any = None) -> Any:
+        return self.results.get(name, default)
+
+
+class AnalyticsExecutor:
+    """Runs named analytics queries concurrently on separate sessions."""
+
+    @staticmethod
+    async def _run_one(name: str, query: Query, timeout: float, semaphore: asyncio.Semaphore) -> Any:
+        async with semaphore:
+            async with async_session() as session:
+                try:
+                    return await asyncio.wait_for(query(session), timeout)
+                finally:
+                    # Read-only: never leave a transaction open on the pooled connection
+                    await session.rollback()
+
+    @staticmethod
+    async def run(
+        queries: Dict[str, Query],
+        timeout: Optional[float] = None,
+        timeouts: Optional[Dict[str, float]] = None
+    ) -> AnalyticsBatch:
+        """Run queries concurrently and collect their results.
+
+        Args:
+            queries: Name -> coroutine function taking its own session
+            timeout: Default per-query timeout in seconds
+            timeouts: Per-query overrides of the timeout
+
+        Returns:
+            AnalyticsBatch with results of the queries that finished in time
+        """
+        timeout = timeout or settings.analytics_query_timeout
+        timeouts = timeouts or {}
+        semaphore = asyncio.Semaphore(max(1, settings.analytics_max_concurrency))
+        started = time.perf_counter()
+
+        names = list(queries)
+        outcomes = await asyncio.gather(
+            *[
+                AnalyticsExecutor._run_one(name, queries[name], timeouts.get(name, timeout), semaphore)
+                for name in names
+            ],
+            return_exceptions=True
+        )
+
+        batch = AnalyticsBatch()
+        for name, outcome in zip(names, outcomes):
+            if isinstance(outcome, asyncio.TimeoutError):
+                logger.warning(f"Analytics query '{name}' timed out after {timeouts.get(name, timeout)}s")
+                batch.timed_out.append(name)
+            elif isinstance(outcome, BaseException):
+                logger.error(f"Analytics query '{name}' failed: {outcome}")
+                batch.failed.append(name)
+            else:
+                batch.results[name] = outcome
+        batch.elapsed_ms = (time.perf_counter() - started) * 1000
+        return batch
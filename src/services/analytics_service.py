@@ -1,11 +1,14 @@
 """Admin panel analytics service."""
-from typing import Dict, List
+from typing import Dict, List, Optional
 from datetime import datetime, timedelta
 from sqlalchemy import select, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 import asyncio
 
-from src.database.models import Order, User, Product
+from src.database.models import Order, OrderLine, User, Product
+from src.services.analytics_executor import AnalyticsExecutor
+from src.services.metrics_service import MetricsService, STATUS_COLUMNS
+from src.services.segment_service import SegmentService, SEGMENT_NAMES
 from config import LOYALTY_LEVELS
 
 
@@ -13,38 +16,20 @@ class AnalyticsService:
     """Service for admin analytics and statistics."""
     
     @staticmethod
-    async def get_general_statistics(session: AsyncSession) -> Dict:
-        """Get general business statistics (Optimized).
-        
-        Returns:
-            Dict with key metrics
-        """
-        # Execute queries in parallel
-        # Execute queries sequentially (Session is not thread-safe for concurrent use)
-        # 0: Total users
-        total_users_result = await session.execute(select(func.count(User.id)))
-        total_users = total_users_result.scalar() or 0
-
-        # 1: Total orders & revenue (paid+)
-        paid_stats_result = await session.execute(
-            select(func.count(Order.id), func.sum(Order.total))
-            .where(Order.status.in_(['paid', 'shipped', 'delivered']))
-        )
-        paid_stats = paid_stats_result.one()
-        paid_orders_count = paid_stats[0] or 0
-        total_revenue = paid_stats[1] or 0
-
-        # 2: Order status breakdown
-        status_result = await session.execute(
-            select(Order.status, func.count(Order.id)).group_by(Order.status)
-        )
-        status_counts = {row[0]: row[1] for row in status_result.all()}
-
-        # 3: Active products
-        active_products_result = await session.execute(
-             select(func.count(Product.id)).where(Product.is_active == True)
+    async def count_active_products(session: AsyncSession) -> int:
+        """Number of active products."""
+        result = await session.execute(
+            select(func.count(Product.id)).where(Product.is_active == True)
         )
-        active_products = active_products_result.scalar() or 0
+        return result.scalar() or 0
+    
+    @staticmethod
+    def _general_from(totals: Dict, active_products: int) -> Dict:
+        """General statistics from daily totals and active product count."""
+        total_users = int(totals['new_users'])
+        paid_orders_count = int(totals['sold_orders'])
+        total_revenue = totals['revenue']
+        status_counts = {status: int(totals[column]) for status, column in STATUS_COLUMNS.items()}
         
         total_orders = sum(status_counts.values())
         
@@ -63,6 +48,33 @@ class AnalyticsService:
             'active_products': active_products
         }
     
+    @staticmethod
+    async def get_general_report(timeout: Optional[float] = None) -> Dict:
+        """General statistics and alerts, queried concurrently.
+        
+        Every query runs on its own pooled session with a timeout; values of
+        queries that didn't finish are zero/empty and listed in 'unavailable'.
+        
+        Args:
+            timeout: Per-query timeout in seconds (settings default if None)
+            
+        Returns:
+            Dict with key metrics, 'alerts' and 'unavailable'
+        """
+        batch = await AnalyticsExecutor.run({
+            'totals': MetricsService.get_totals,
+            'active_products': AnalyticsService.count_active_products,
+            'alerts': AnalyticsService.get_pending_orders_alerts,
+        }, timeout=timeout)
+        
+        stats = AnalyticsService._general_from(
+            batch.get('totals', MetricsService.empty_totals()),
+            batch.get('active_products', 0)
+        )
+        stats['alerts'] = batch.get('alerts', [])
+        stats['unavailable'] = batch.missing
+        return stats
+    
     @staticmethod
     async def get_discount_statistics(session: AsyncSession) -> Dict:
         """Get discount usage statistics (Optimized).
@@ -70,31 +82,15 @@ class AnalyticsService:
         Returns:
             Dict with discount metrics
         """
-        # Aggregate all stats in one query
-        query = select(
-            func.count(Order.id),
-            func.sum(Order.discount_volume),
-            func.sum(Order.discount_loyalty),
-            func.sum(Order.discount_promo),
-            func.sum(Order.subtotal),
-            # Count orders that had ANY discount using CASE for compatibility
-            func.sum(case(
-                ((Order.discount_volume + Order.discount_loyalty + Order.discount_promo) > 0, 1),
-                else_=0
-            ))
-        ).where(
-            Order.status.in_(['paid', 'shipped', 'delivered'])
-        )
-        
-        result = await session.execute(query)
-        stats = result.one()
+        # Aggregates from the daily rollup
+        totals = await MetricsService.get_totals(session)
         
-        total_orders = stats[0] or 0
-        volume_discounts = stats[1] or 0
-        loyalty_discounts = stats[2] or 0
-        promo_discounts = stats[3] or 0
-        total_subtotal = stats[4] or 0
-        orders_with_discounts = stats[5] or 0
+        total_orders = int(totals['sold_orders'])
+        volume_discounts = totals['discount_volume']
+        loyalty_discounts = totals['discount_loyalty']
+        promo_discounts = totals['discount_promo']
+        total_subtotal = totals['subtotal']
+        orders_with_discounts = int(totals['orders_with_discount'])
         
         total_discounts = volume_discounts + loyalty_discounts + promo_discounts
         avg_discount_percent = (total_discounts / total_subtotal * 100) if total_subtotal > 0 else 0
@@ -114,33 +110,25 @@ class AnalyticsService:
         """Get distribution of users across loyalty levels.
         
         Returns:
-            Dict with user counts per level
+            Dict with user counts per level, insights and activity segments
         """
+        # All levels, insights and activity buckets in one aggregate query
+        counts = await SegmentService.get_counts(session)
         distribution = {}
         
         for level in range(1, 5):
-            query = select(func.count(User.id)).where(User.loyalty_level == level)
-            result = await session.execute(query)
-            count = result.scalar()
-            
             level_info = LOYALTY_LEVELS[level]
             distribution[level] = {
                 'name': level_info['name'],
-                'count': count,
+                'count': counts[f'level_{level}'],
                 'discount': level_info['discount']
             }
         
-        # Get users close to next level
-        close_to_level_2_query = select(func.count(User.id)).where(
-            User.loyalty_level == 1,
-            User.total_purchased_kg >= 3,
-            User.total_purchased_kg < 5
-        )
-        close_to_level_2_result = await session.execute(close_to_level_2_query)
-        close_to_level_2 = close_to_level_2_result.scalar()
-        
         distribution['insights'] = {
-            'close_to_level_2': close_to_level_2
+            'close_to_level_2': counts['close_to_level_2']
+        }
+        distribution['segments'] = {
+            name: counts[name] for name in SEGMENT_NAMES if name != 'close_to_level_2'
         }
         
         return distribution
@@ -165,40 +153,30 @@ class AnalyticsService:
             Order.status.in_(['paid', 'shipped', 'delivered'])
         ]
         
-        # Parallel queries:
-        # 1. Aggregates (Count, Revenue)
-        # 2. Items for KG calculation (only fetched column)
-        # Execute queries sequentially
-        
-        stats_result = await session.execute(
-            select(func.count(Order.id), func.sum(Order.total))
-            .where(*filter_condition)
+        # Orders, revenue and kg sold from the daily rollup
+        totals = await MetricsService.get_totals(session, days)
+        total_orders = int(totals['sold_orders'])
+        total_revenue = totals['revenue']
+        total_kg = totals['kg']
+        
+        # Best sellers by revenue
+        top_result = await session.execute(
+            select(
+                OrderLine.product_id,
+                func.max(OrderLine.name),
+                func.sum(OrderLine.weight_kg),
+                func.sum(OrderLine.total)
+            )
+            .join(Order, OrderLine.order_id == Order.id)
+            .where(OrderLine.created_at >= start_date, *filter_condition)
+            .group_by(OrderLine.product_id)
+            .order_by(func.sum(OrderLine.total).desc())
+            .limit(5)
         )
-        
-        items_result = await session.execute(
-            select(Order.items).where(*filter_condition)
-        )
-        
-        # Process Aggregates
-        stats = stats_result.one()
-        total_orders = stats[0] or 0
-        total_revenue = stats[1] or 0
-        
-        # Process KG
-        items_rows = items_result.all()
-        total_kg = 0
-        
-        for row in items_rows:
-            # row[0] is the items dict/list
-            order_items = row[0]
-            if not order_items:
-                continue
-                
-            for item in order_items:
-                if item.get('format') == '300g':
-                    total_kg += 0.3 * item.get('quantity', 0)
-                else:
-                    total_kg += 1.0 * item.get('quantity', 0)
+        top_products = [
+            {'product_id': product_id, 'name': name, 'kg': round(kg or 0, 1), 'revenue': int(revenue or 0)}
+            for product_id, name, kg, revenue in top_result.all()
+        ]
         
         avg_order_value = total_revenue / total_orders if total_orders > 0 else 0
         
@@ -207,7 +185,8 @@ class AnalyticsService:
             'total_orders': total_orders,
             'total_revenue': int(total_revenue),
             'avg_order_value': int(avg_order_value),
-            'total_kg_sold': round(total_kg, 1)
+            'total_kg_sold': round(total_kg or 0, 1),
+            'top_products': top_products
         }
     
     @staticmethod
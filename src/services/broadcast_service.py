@@ -0,0 +1,199 @@
+"""Broadcast engine - rate-limited concurrent delivery of message batches.
+
+Notification jobs hand the broadcaster a list of messages; a small pool of
+workers sends them concurrently while a global token bucket keeps the bot
+under Telegram's flood limit (~30 messages/s) and a per-chat interval keeps
+consecutive messages to one chat apart. ``RetryAfter`` pauses every worker
+for the time Telegram asks and the message is retried; users who blocked the
+bot are counted and skipped.
+"""
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional, Tuple
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramForbiddenError, TelegramRetryAfter
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class OutgoingMessage:
+    """One message of a broadcast."""
+    chat_id: int
+    text: str
+    parse_mode: Optional[str] = "HTML"
+    reply_markup: Any = None
+    ref: Any = None  # Caller's reference; outcome is reported in BroadcastReport.results
+
+
+@dataclass
+class BroadcastReport:
+    """Progress/result of a broadcast."""
+    total: int = 0
+    sent: int = 0
+    blocked: int = 0  # Bot blocked / chat deactivated
+    failed: int = 0
+    retries: int = 0
+    elapsed: float = 0.0
+    results: Dict[Any, str] = field(default_factory=dict)  # ref -> sent/blocked/failed
+
+    @property
+    def done(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+
+class TokenBucket:
+    """Token bucket shared by all workers (``rate`` tokens per second).
+
+    The default capacity of one token paces sends evenly: no burst above the
+    rate even right after an idle period.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float) -> None:
+        """Stop issuing tokens for a while (flood control)."""
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Broadcaster:
+    """Sends message batches with global rate limit and bounded concurrency."""
+
+    PER_CHAT_INTERVAL = 1.0  # seconds between messages to the same chat
+    MAX_RETRIES = 3
+    PROGRESS_EVERY = 500  # messages between progress callbacks/log lines
+
+    def __init__(
+        self,
+        bot: Bot,
+        rate: Optional[float] = None,
+        concurrency: Optional[int] = None
+    ):
+        self.bot = bot
+        self.bucket = TokenBucket(rate or settings.broadcast_rate)
+        self.concurrency = max(1, concurrency or settings.broadcast_concurrency)
+        self._last_sent: Dict[int, float] = {}
+
+    async def _wait_for_chat(self, chat_id: int) -> None:
+        last = self._last_sent.get(chat_id)
+        if last is not None:
+            delay = last + self.PER_CHAT_INTERVAL - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        self._last_sent[chat_id] = time.monotonic()
+
+    async def _deliver(self, message: OutgoingMessage) -> Tuple[str, int]:
+        """Send one message; returns outcome ('sent', 'blocked', 'failed') and retries."""
+        for attempt in range(self.MAX_RETRIES + 1):
+            await self._wait_for_chat(message.chat_id)
+            await self.bucket.acquire()
+            try:
+                await self.bot.send_message(
+                    chat_id=message.chat_id,
+                    text=message.text,
+                    parse_mode=message.parse_mode,
+                    reply_markup=message.reply_markup
+                )
+                return 'sent', attempt
+            except TelegramRetryAfter as e:
+                logger.warning(f"Flood control: pausing broadcast for {e.retry_after}s")
+                self.bucket.pause(e.retry_after)
+            except TelegramForbiddenError:
+                return 'blocked', attempt
+            except Exception as e:
+                logger.error(f"Failed to send message to {message.chat_id}: {e}")
+                return 'failed', attempt
+
+        logger.error(f"Giving up on message to {message.chat_id} after {self.MAX_RETRIES} retries")
+        return 'failed', self.MAX_RETRIES + 1
+
+    async def send(
+        self,
+        messages: Iterable[OutgoingMessage],
+        name: str = "broadcast",
+        progress: Optional[Callable[[BroadcastReport], Awaitable[None]]] = None
+    ) -> BroadcastReport:
+        """Send all messages and wait until every one is delivered or failed.
+
+        Args:
+            messages: Messages to send
+            name: Name used in log lines
+            progress: Optional coroutine called every PROGRESS_EVERY messages
+
+        Returns:
+            BroadcastReport
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait(message)
+
+        report = BroadcastReport(total=queue.qsize())
+        if not report.total:
+            return report
+        started = time.monotonic()
+        next_progress = self.PROGRESS_EVERY
+
+        async def worker() -> None:
+            nonlocal next_progress
+            while True:
+                try:
+                    message = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                outcome, retries = await self._deliver(message)
+                report.retries += retries
+                setattr(report, outcome, getattr(report, outcome) + 1)
+                if message.ref is not None:
+                    report.results[message.ref] = outcome
+                if report.done >= next_progress:
+                    next_progress += self.PROGRESS_EVERY
+                    report.elapsed = time.monotonic() - started
+                    logger.info(f"{name}: {report.done}/{report.total} processed")
+                    if progress:
+                        try:
+                            await progress(report)
+                        except Exception as e:
+                            logger.warning(f"{name}: progress callback failed: {e}")
+
+        await asyncio.gather(*[worker() for _ in range(min(self.concurrency, report.total))])
+        cutoff = time.monotonic() - self.PER_CHAT_INTERVAL
+        self._last_sent = {chat_id: at for chat_id, at in self._last_sent.items() if at > cutoff}
+
+        report.elapsed = time.monotonic() - started
+        logger.info(
+            f"{name}: sent {report.sent}/{report.total} "
+            f"(blocked {report.blocked}, failed {report.failed}, retries {report.retries}) "
+            f"in {report.elapsed:.1f}s"
+        )
+        if progress:
+            try:
+                await progress(report)
+            except Exception as e:
+                logger.warning(f"{name}: progress callback failed: {e}")
+        return report
@@ -1,15 +1,137 @@
 """Cart service - business logic for shopping cart operations."""
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
 from typing import List, Tuple, Optional
-from sqlalchemy import select
+from sqlalchemy import select, update, delete, func, case
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database.models import CartItem, Product, User
 from src.utils.constants import ProductFormat
 
 
+@dataclass
+class BulkAddResult:
+    """Outcome of adding several items at once."""
+    added: int  # cart lines added/updated
+    skipped: List[str]  # names of items that are no longer available
+
+
+@dataclass
+class CartSummary:
+    """Cart totals without loading cart rows."""
+    count: int  # sum of quantities
+    weight_kg: float
+    subtotal: int
+
+
+# Per-user cart summary cache: user_id -> (CartSummary, cached_at)
+_summary_cache: "OrderedDict[int, Tuple[CartSummary, float]]" = OrderedDict()
+
+
+def _dialect_insert(session: AsyncSession):
+    """Dialect-specific insert() supporting ON CONFLICT (SQLite / PostgreSQL)."""
+    if session.bind.dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert
+
+
 class CartService:
     """Service for cart operations."""
     
+    SUMMARY_TTL = 60.0  # seconds; bounds staleness if another worker edits the cart
+    SUMMARY_CACHE_SIZE = 10_000
+    
+    @staticmethod
+    def invalidate_summary(user_id: Optional[int] = None) -> None:
+        """Drop cached cart summary (call after any cart mutation)."""
+        if user_id is None:
+            _summary_cache.clear()
+        else:
+            _summary_cache.pop(user_id, None)
+    
+    @staticmethod
+    async def get_cart_summary(
+        session: AsyncSession,
+        user_id: int
+    ) -> CartSummary:
+        """Get item count, weight and subtotal of user's cart.
+        
+        One aggregate query on cache miss, no query on hit.
+        
+        Returns:
+            CartSummary
+        """
+        cached = _summary_cache.get(user_id)
+        if cached and time.monotonic() - cached[1] < CartService.SUMMARY_TTL:
+            _summary_cache.move_to_end(user_id)
+            return cached[0]
+        
+        weight_per_unit = case(
+            (CartItem.format == "300g", 0.3),
+            (CartItem.format == "1kg", 1.0),
+            else_=0.0
+        )
+        # 300g packs and unit items (equipment) are priced by price_300g
+        unit_price = case(
+            (CartItem.format == "1kg", Product.price_1kg),
+            else_=Product.price_300g
+        )
+        query = (
+            select(
+                func.coalesce(func.sum(CartItem.quantity), 0),
+                func.coalesce(func.sum(weight_per_unit * CartItem.quantity), 0.0),
+                func.coalesce(func.sum(unit_price * CartItem.quantity), 0)
+            )
+            .join(Product, CartItem.product_id == Product.id)
+            .where(CartItem.user_id == user_id)
+        )
+        count, weight_kg, subtotal = (await session.execute(query)).one()
+        summary = CartSummary(count=int(count), weight_kg=round(float(weight_kg), 3), subtotal=int(subtotal))
+        
+        _summary_cache[user_id] = (summary, time.monotonic())
+        _summary_cache.move_to_end(user_id)
+        while len(_summary_cache) > CartService.SUMMARY_CACHE_SIZE:
+            _summary_cache.popitem(last=False)
+        return summary
+    
+    @staticmethod
+    async def get_cart_metrics_by_user(session: AsyncSession) -> List[Tuple[int, int, float, int]]:
+        """(user_id, packs_300g, weight_kg, subtotal) of every non-empty cart - one GROUP BY query."""
+        packs = case((CartItem.format == "300g", CartItem.quantity), else_=0)
+        weight_per_unit = case(
+            (CartItem.format == "300g", 0.3),
+            (CartItem.format == "1kg", 1.0),
+            else_=0.0
+        )
+        unit_price = case(
+            (CartItem.format == "1kg", Product.price_1kg),
+            else_=Product.price_300g
+        )
+        query = (
+            select(
+                CartItem.user_id,
+                func.sum(packs),
+                func.sum(weight_per_unit * CartItem.quantity),
+                func.sum(unit_price * CartItem.quantity)
+            )
+            .join(Product, CartItem.product_id == Product.id)
+            .group_by(CartItem.user_id)
+        )
+        result = await session.execute(query)
+        return [(user_id, int(p or 0), float(w or 0), int(s or 0)) for user_id, p, w, s in result.all()]
+    
+    @staticmethod
+    async def get_open_cart_metrics(session: AsyncSession) -> List[Tuple[int, float, int]]:
+        """(packs_300g, weight_kg, subtotal) of every non-empty cart - one GROUP BY query.
+        
+        Used for discount what-if simulation.
+        """
+        return [metrics[1:] for metrics in await CartService.get_cart_metrics_by_user(session)]
+    
     @staticmethod
     async def get_cart_items(
         session: AsyncSession,
@@ -24,7 +146,7 @@ class CartService:
             select(CartItem, Product)
             .join(Product, CartItem.product_id == Product.id)
             .where(CartItem.user_id == user_id)
-            .order_by(CartItem.added_at)
+            .order_by(CartItem.id)
         )
         
         result = await session.execute(query)
@@ -50,33 +172,100 @@ class CartService:
         Returns:
             CartItem (new or updated)
         """
-        # Check if item already in cart
-        query = select(CartItem).where(
-            CartItem.user_id == user_id,
-            CartItem.product_id == product_id,
-            CartItem.format == format
+        # Single atomic statement: INSERT ... ON CONFLICT DO UPDATE ... RETURNING
+        # (relies on the unique index idx_cart_user_product; safe for quick double taps)
+        insert = _dialect_insert(session)
+        stmt = insert(CartItem).values(
+            user_id=user_id,
+            product_id=product_id,
+            format=format,
+            quantity=quantity
         )
-        result = await session.execute(query)
-        cart_item = result.scalar_one_or_none()
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id, CartItem.format],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity, "added_at": func.now()}
+        ).returning(CartItem)
         
-        if cart_item:
-            # Update quantity
-            cart_item.quantity += quantity
-        else:
-            # Create new cart item
-            cart_item = CartItem(
-                user_id=user_id,
-                product_id=product_id,
-                format=format,
-                quantity=quantity
-            )
-            session.add(cart_item)
+        result = await session.execute(stmt, execution_options={"populate_existing": True})
+        cart_item = result.scalar_one()
         
         await session.commit()
-        await session.refresh(cart_item)
+        CartService.invalidate_summary(user_id)
         
         return cart_item
     
+    @staticmethod
+    async def bulk_add_to_cart(
+        session: AsyncSession,
+        user_id: int,
+        items: List[dict]
+    ) -> BulkAddResult:
+        """Merge several items into the cart with one multi-row upsert and one commit.
+        
+        Args:
+            session: Database session
+            user_id: User ID
+            items: Dicts with product_id, format and quantity (e.g. order.items)
+            
+        Returns:
+            BulkAddResult; missing or inactive products are skipped and named
+        """
+        # Merge duplicates first: one statement can't update the same row twice
+        merged = {}
+        names = {}
+        for item in items:
+            product_id = item.get('product_id')
+            format = item.get('format')
+            try:
+                # Old order JSON may have quantity null (or none at all)
+                quantity = int(item.get('quantity', 1) or 0)
+            except (TypeError, ValueError):
+                quantity = 0
+            if product_id and format and quantity > 0:
+                key = (product_id, format)
+                merged[key] = merged.get(key, 0) + quantity
+                if item.get('name'):
+                    names.setdefault(product_id, item['name'])
+        
+        if not merged:
+            return BulkAddResult(added=0, skipped=[])
+        
+        # Only products that still exist and are on sale
+        product_ids = {product_id for product_id, _ in merged}
+        result = await session.execute(
+            select(Product.id, Product.name_ua, Product.is_active).where(Product.id.in_(product_ids))
+        )
+        available = set()
+        for product_id, name, is_active in result.all():
+            names.setdefault(product_id, name)
+            if is_active:
+                available.add(product_id)
+        
+        rows = [
+            {"user_id": user_id, "product_id": product_id, "format": format, "quantity": quantity}
+            for (product_id, format), quantity in merged.items()
+            if product_id in available
+        ]
+        skipped = [
+            names.get(product_id, f"#{product_id}")
+            for product_id in sorted(product_ids - available)
+        ]
+        
+        if not rows:
+            return BulkAddResult(added=0, skipped=skipped)
+        
+        insert = _dialect_insert(session)
+        stmt = insert(CartItem).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[CartItem.user_id, CartItem.product_id, CartItem.format],
+            set_={"quantity": CartItem.quantity + stmt.excluded.quantity, "added_at": func.now()}
+        )
+        await session.execute(stmt)
+        await session.commit()
+        CartService.invalidate_summary(user_id)
+        
+        return BulkAddResult(added=len(rows), skipped=skipped)
+    
     @staticmethod
     async def update_quantity(
         session: AsyncSession,
@@ -100,10 +289,13 @@ class CartService:
         if new_quantity <= 0:
             await session.delete(cart_item)
             await session.commit()
+            CartService.invalidate_summary(cart_item.user_id)
             return None
         
         cart_item.quantity = new_quantity
+        cart_item.added_at = func.now()
         await session.commit()
+        CartService.invalidate_summary(cart_item.user_id)
         await session.refresh(cart_item)
         
         return cart_item
@@ -124,22 +316,33 @@ class CartService:
         cart_item_id: int,
         delta: int
     ) -> Optional[CartItem]:
-        """Change cart item quantity by delta (positive or negative)."""
-        cart_item = await CartService.get_cart_item(session, cart_item_id)
+        """Change cart item quantity by delta (positive or negative).
+        
+        Atomic UPDATE ... RETURNING; the row is deleted when quantity drops to 0.
+        """
+        stmt = (
+            update(CartItem)
+            .where(CartItem.id == cart_item_id)
+            .values(quantity=CartItem.quantity + delta, added_at=func.now())
+            .returning(CartItem)
+        )
+        result = await session.execute(stmt, execution_options={"populate_existing": True})
+        cart_item = result.scalar_one_or_none()
         
         if not cart_item:
             return None
-            
-        new_quantity = cart_item.quantity + delta
         
-        if new_quantity <= 0:
-            await session.delete(cart_item)
+        user_id = cart_item.user_id
+        if cart_item.quantity <= 0:
+            await session.execute(
+                delete(CartItem).where(CartItem.id == cart_item_id, CartItem.quantity <= 0)
+            )
             await session.commit()
+            CartService.invalidate_summary(user_id)
             return None
-            
-        cart_item.quantity = new_quantity
+        
         await session.commit()
-        await session.refresh(cart_item)
+        CartService.invalidate_summary(user_id)
         
         return cart_item
     
@@ -162,6 +365,7 @@ class CartService:
         
         await session.delete(cart_item)
         await session.commit()
+        CartService.invalidate_summary(cart_item.user_id)
         
         return True
     
@@ -175,18 +379,56 @@ class CartService:
         Returns:
             Number of items removed
         """
-        query = select(CartItem).where(CartItem.user_id == user_id)
-        result = await session.execute(query)
-        items = result.scalars().all()
+        # One set-based DELETE instead of loading and deleting each row
+        result = await session.execute(delete(CartItem).where(CartItem.user_id == user_id))
+        count = result.rowcount
         
-        count = len(items)
+        await session.commit()
+        CartService.invalidate_summary(user_id)
         
-        for item in items:
-            await session.delete(item)
+        return count
+    
+    @staticmethod
+    async def purge_inactive_products(session: AsyncSession) -> int:
+        """Remove products that are no longer on sale from every cart.
         
+        Returns:
+            Number of cart lines removed
+        """
+        inactive_ids = select(Product.id).where(Product.is_active == False)
+        result = await session.execute(
+            delete(CartItem).where(CartItem.product_id.in_(inactive_ids))
+        )
         await session.commit()
         
-        return count
+        if result.rowcount:
+            CartService.invalidate_summary()
+        return result.rowcount
+    
+    @staticmethod
+    async def purge_idle_carts(session: AsyncSession, idle_days: int) -> int:
+        """Delete carts untouched for more than idle_days.
+
+        ``added_at`` is refreshed on every add and quantity change, so it's
+        the line's last activity.
+        
+        Returns:
+            Number of cart lines removed
+        """
+        cutoff = datetime.utcnow() - timedelta(days=idle_days)
+        idle_users = (
+            select(CartItem.user_id)
+            .group_by(CartItem.user_id)
+            .having(func.max(CartItem.added_at) < cutoff)
+        )
+        result = await session.execute(
+            delete(CartItem).where(CartItem.user_id.in_(idle_users))
+        )
+        await session.commit()
+        
+        if result.rowcount:
+            CartService.invalidate_summary()
+        return result.rowcount
     
     @staticmethod
     async def get_cart_count(
@@ -198,11 +440,8 @@ class CartService:
         Returns:
             Total item count (sum of quantities)
         """
-        query = select(CartItem).where(CartItem.user_id == user_id)
-        result = await session.execute(query)
-        items = result.scalars().all()
-        
-        return sum(item.quantity for item in items)
+        summary = await CartService.get_cart_summary(session, user_id)
+        return summary.count
     
     @staticmethod
     def calculate_cart_weight(cart_items: List[Tuple[CartItem, Product]]) -> float:
@@ -236,20 +475,6 @@ class CartService:
         Returns:
             Number of items restored
         """
-        count = 0
-        for item in order_items:
-            product_id = item.get('product_id')
-            format = item.get('format')
-            quantity = item.get('quantity', 1)
-            
-            if product_id and format:
-                await CartService.add_to_cart(
-                    session,
-                    user_id,
-                    product_id,
-                    format,
-                    quantity
-                )
-                count += 1
-                
-        return count
+        result = await CartService.bulk_add_to_cart(session, user_id, order_items)
+        return result.added
+
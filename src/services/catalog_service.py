@@ -0,0 +1,219 @@
+"""Catalog service - paginated (and cached) product listings for the catalog screens."""
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from sqlalchemy import and_, func, or_, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+
+from src.database.models import Category, Product
+from src.utils.constants import CoffeeProfile
+from src.utils.image_constants import CATEGORY_IMAGES
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Coffee sub-profiles filter within all non-equipment categories by Product.profile
+COFFEE_PROFILES = {"espresso", "filter", "universal"}
+
+# Products per catalog page
+PAGE_SIZE = 5
+
+# Cached pages per snapshot (bounded, so memory stays flat for big catalogs)
+MAX_CACHED_PAGES = 256
+
+# Versioned in-memory snapshot of the active catalog
+_snapshot: Optional[dict] = None
+_version = 0
+
+_PRODUCT_COLUMNS = [attr.key for attr in Product.__mapper__.column_attrs]
+
+
+def _detached_product(values) -> Product:
+    """Detached Product built from column values (never in any session)."""
+    product = Product.__mapper__.class_manager.new_instance()
+    for key, value in zip(_PRODUCT_COLUMNS, values):
+        set_committed_value(product, key, value)
+    make_transient_to_detached(product)
+    return product
+
+
+@dataclass
+class CatalogPage:
+    """One page of a catalog listing."""
+    products: List[Product]
+    total: int
+    page: int
+    page_size: int = PAGE_SIZE
+    # Keyset cursors (sort_order, id) of the first/last product on the page
+    first_key: Optional[Tuple[int, int]] = None
+    last_key: Optional[Tuple[int, int]] = None
+
+    @property
+    def total_pages(self) -> int:
+        return (self.total + self.page_size - 1) // self.page_size
+
+
+class CatalogService:
+    """Service for catalog listings.
+
+    Pages are fetched with keyset pagination over (sort_order, id) and come
+    with the total count in the same query. Fetched pages and category data
+    live in a versioned snapshot, so repeated page turns don't hit the
+    database. Admin edits of products or categories must call
+    ``CatalogService.invalidate()``.
+    """
+
+    @staticmethod
+    def invalidate() -> None:
+        """Drop the snapshot (call after any product/category change)."""
+        global _snapshot, _version
+        _version += 1
+        _snapshot = None
+        logger.info(f"Catalog snapshot invalidated (version {_version})")
+
+    @staticmethod
+    async def _get_snapshot(session: AsyncSession) -> dict:
+        """Return current snapshot, rebuilding it if invalidated or expired."""
+        global _snapshot
+        if _snapshot and time.monotonic() - _snapshot["loaded_at"] < settings.catalog_cache_ttl:
+            return _snapshot
+
+        version = _version
+        cat_result = await session.execute(
+            select(Category.slug, Category.is_active, Category.image_path)
+        )
+        categories = cat_result.all()
+        non_equip_cats = [
+            slug for slug, is_active, _ in categories
+            if is_active and slug != "equipment"
+        ]
+
+        snapshot = {
+            "version": version,
+            "loaded_at": time.monotonic(),
+            "non_equip_cats": non_equip_cats,
+            "category_images": {slug: image_path for slug, _, image_path in categories if image_path},
+            "pages": OrderedDict(),
+        }
+        # Don't publish a snapshot that was invalidated while loading
+        if version == _version:
+            _snapshot = snapshot
+        return snapshot
+
+    @staticmethod
+    def _filter(snapshot: dict, slug: str):
+        """SQL filter for a catalog slug/profile (active products only)."""
+        if slug == "all":
+            # All coffee products (any category that is NOT equipment)
+            categories = snapshot["non_equip_cats"] or ["coffee"]
+            condition = Product.category.in_(categories)
+        elif slug in COFFEE_PROFILES:
+            # Matching profile + universal, in any non-equipment category
+            condition = and_(
+                (Product.profile == slug) | (Product.profile == CoffeeProfile.UNIVERSAL),
+                Product.category != "equipment"
+            )
+        else:
+            # Dynamic category slug
+            condition = Product.category == slug
+        return and_(condition, Product.is_active == True)
+
+    @staticmethod
+    async def get_category_image(session: AsyncSession, slug: str) -> Optional[Path]:
+        """Get category image (custom from snapshot, then static map).
+
+        Same result as ``get_category_image_async`` without a query per page.
+        """
+        snapshot = await CatalogService._get_snapshot(session)
+        image_path = snapshot["category_images"].get(slug)
+        if image_path:
+            path = Path(image_path)
+            if path.exists():
+                return path
+        return CATEGORY_IMAGES.get(slug)
+
+    @staticmethod
+    async def get_page(
+        session: AsyncSession,
+        slug: str,
+        page: int = 0,
+        after: Optional[Tuple[int, int]] = None,
+        before: Optional[Tuple[int, int]] = None,
+        page_size: int = PAGE_SIZE
+    ) -> CatalogPage:
+        """Get one page of active products for a catalog slug/profile.
+
+        Next/previous pages are fetched by keyset (``after``/``before`` the
+        (sort_order, id) of the current page's last/first product). Without a
+        cursor (first page, "back" from product details) OFFSET is used.
+
+        Args:
+            session: Database session
+            slug: 'all', coffee profile (espresso/filter/universal) or category slug
+            page: Page number (for display and OFFSET fallback)
+            after: Cursor for the next page
+            before: Cursor for the previous page
+            page_size: Products per page
+
+        Returns:
+            CatalogPage with products (detached, read-only) and total count
+        """
+        snapshot = await CatalogService._get_snapshot(session)
+        cache_key = (slug, page, after, before, page_size)
+        pages: OrderedDict = snapshot["pages"]
+        if cache_key in pages:
+            pages.move_to_end(cache_key)
+            return pages[cache_key]
+
+        condition = CatalogService._filter(snapshot, slug)
+        # Total count as a scalar subquery: page rows and count in one round trip
+        total_subq = select(func.count(Product.id)).where(condition).scalar_subquery()
+        # Plain columns, not entities: cached products must not be (or replace)
+        # objects of the caller's session
+        query = select(*[getattr(Product, key) for key in _PRODUCT_COLUMNS], total_subq).where(condition)
+
+        if after is not None:
+            query = query.where(or_(
+                Product.sort_order > after[0],
+                and_(Product.sort_order == after[0], Product.id > after[1])
+            )).order_by(Product.sort_order, Product.id)
+        elif before is not None:
+            query = query.where(or_(
+                Product.sort_order < before[0],
+                and_(Product.sort_order == before[0], Product.id < before[1])
+            )).order_by(Product.sort_order.desc(), Product.id.desc())
+        else:
+            query = query.order_by(Product.sort_order, Product.id).offset(page * page_size)
+
+        result = await session.execute(query.limit(page_size))
+        rows = result.all()
+        if not rows and (after is not None or before is not None):
+            # Cursor is stale (catalog changed) - fall back to the page number
+            return await CatalogService.get_page(session, slug, page, page_size=page_size)
+        products = [_detached_product(row[:-1]) for row in rows]
+        if before is not None:
+            products.reverse()
+
+        if rows:
+            total = rows[0][-1]
+        else:
+            total = (await session.execute(select(func.count(Product.id)).where(condition))).scalar()
+
+        catalog_page = CatalogPage(
+            products=products,
+            total=total,
+            page=page,
+            page_size=page_size,
+            first_key=(products[0].sort_order, products[0].id) if products else None,
+            last_key=(products[-1].sort_order, products[-1].id) if products else None,
+        )
+        pages[cache_key] = catalog_page
+        while len(pages) > MAX_CACHED_PAGES:
+            pages.popitem(last=False)
+        return catalog_page
@@ -1,9 +1,136 @@
 """Discount calculation engine - the core business logic."""
-from typing import List, Dict, Optional, Tuple
-from dataclasses import dataclass
+import time
+from bisect import bisect_right
+from typing import List, Dict, Optional, Sequence, Tuple
+from dataclasses import dataclass, field
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+try:
+    import numpy as np
+except ImportError:  # Batch pricing falls back to a per-cart loop
+    np = None
 
 from config import LOYALTY_LEVELS, VOLUME_DISCOUNTS_PACKS, KG_DISCOUNT_THRESHOLD, KG_DISCOUNT_PERCENT
-from src.database.models import CartItem, Product, PromoCode, User
+from src.database.models import CartItem, Product, PromoCode, User, VolumeDiscount
+
+
+@dataclass
+class VolumeRuleSet:
+    """Volume discount rules compiled for bisect lookups.
+    
+    Per discount type ('packs', 'weight', 'price'): ascending thresholds and
+    the best percent reachable at each threshold (running maximum).
+    """
+    thresholds: Dict[str, List[float]] = field(default_factory=dict)
+    best_percents: Dict[str, List[int]] = field(default_factory=dict)
+    
+    @classmethod
+    def compile(cls, rules: List[Tuple[str, float, int]]) -> "VolumeRuleSet":
+        """Build rule set from (discount_type, threshold, discount_percent) tuples."""
+        rule_set = cls()
+        by_type: Dict[str, List[Tuple[float, int]]] = {}
+        for discount_type, threshold, percent in rules:
+            by_type.setdefault(discount_type, []).append((threshold, percent))
+        
+        for discount_type, items in by_type.items():
+            items.sort()
+            thresholds, best, current = [], [], 0
+            for threshold, percent in items:
+                current = max(current, percent)
+                thresholds.append(threshold)
+                best.append(current)
+            rule_set.thresholds[discount_type] = thresholds
+            rule_set.best_percents[discount_type] = best
+        return rule_set
+    
+    @classmethod
+    def from_models(cls, rules: List["VolumeDiscount"]) -> "VolumeRuleSet":
+        """Compile active VolumeDiscount rows (falls back to legacy config if none)."""
+        active = [(r.discount_type, r.threshold, r.discount_percent) for r in rules if r.is_active]
+        return cls.compile(active) if active else cls.legacy()
+    
+    @classmethod
+    def legacy(cls) -> "VolumeRuleSet":
+        """Rules from config (VOLUME_DISCOUNTS_PACKS / KG_DISCOUNT_*)."""
+        rules = [('packs', threshold, percent) for threshold, percent in VOLUME_DISCOUNTS_PACKS.items()]
+        rules.append(('weight', KG_DISCOUNT_THRESHOLD, KG_DISCOUNT_PERCENT))
+        return cls.compile(rules)
+    
+    def best(self, discount_type: str, value: float) -> int:
+        """Best discount percent for value (0 if below every threshold)."""
+        thresholds = self.thresholds.get(discount_type)
+        if not thresholds:
+            return 0
+        idx = bisect_right(thresholds, value) - 1
+        return self.best_percents[discount_type][idx] if idx >= 0 else 0
+    
+    def next_tier(self, discount_type: str, value: float) -> Optional[Tuple[float, int]]:
+        """Nearest (threshold, percent) above value that improves the discount."""
+        thresholds = self.thresholds.get(discount_type)
+        if not thresholds:
+            return None
+        current = self.best(discount_type, value)
+        best = self.best_percents[discount_type]
+        # best is non-decreasing: first index with a higher percent
+        idx = max(bisect_right(thresholds, value), bisect_right(best, current))
+        if idx < len(thresholds):
+            return thresholds[idx], best[idx]
+        return None
+    
+    @property
+    def max_percent(self) -> int:
+        return max((b[-1] for b in self.best_percents.values() if b), default=0)
+
+
+@dataclass
+class PricingColumns:
+    """Columnar cart data for batch pricing (one position per cart/order).
+    
+    NumPy arrays when NumPy is installed, plain lists otherwise.
+    """
+    packs: "Sequence[int]"
+    weights: "Sequence[float]"
+    subtotals: "Sequence[int]"
+    
+    @classmethod
+    def from_rows(cls, rows: List[Tuple[int, float, int]]) -> "PricingColumns":
+        """Build columns from (packs, weight_kg, subtotal) rows."""
+        packs = [int(r[0]) for r in rows]
+        weights = [float(r[1]) for r in rows]
+        subtotals = [int(r[2]) for r in rows]
+        if np is not None:
+            return cls(np.asarray(packs, dtype=np.int64), np.asarray(weights, dtype=np.float64),
+                       np.asarray(subtotals, dtype=np.int64))
+        return cls(packs, weights, subtotals)
+    
+    def __len__(self) -> int:
+        return len(self.subtotals)
+
+
+@dataclass
+class SimulationResult:
+    """Impact of replacing the current volume rules with a candidate set."""
+    carts: int
+    gross: int  # Sum of subtotals before discounts
+    current_discount: int
+    candidate_discount: int
+    carts_changed: int
+    elapsed_ms: float
+    
+    @property
+    def discount_delta(self) -> int:
+        return self.candidate_discount - self.current_discount
+    
+    @property
+    def revenue_delta(self) -> int:
+        return -self.discount_delta
+
+
+# Process-wide compiled rules (invalidated by admin_discounts edits)
+_volume_rules: Optional[VolumeRuleSet] = None
+_volume_rules_loaded_at = 0.0
 
 
 @dataclass
@@ -31,6 +158,40 @@ class DiscountBreakdown:
 class DiscountEngine:
     """Calculate discounts based on cart contents and user status."""
     
+    # Seconds; admin edits invalidate this worker at once, other workers pick
+    # the change up within the TTL
+    VOLUME_RULES_TTL = 60.0
+    
+    @staticmethod
+    async def get_volume_rules(session: AsyncSession) -> VolumeRuleSet:
+        """Get compiled active volume discount rules (cached process-wide)."""
+        global _volume_rules, _volume_rules_loaded_at
+        if _volume_rules is not None and time.monotonic() - _volume_rules_loaded_at < DiscountEngine.VOLUME_RULES_TTL:
+            return _volume_rules
+        
+        result = await session.execute(select(VolumeDiscount).where(VolumeDiscount.is_active == True))
+        _volume_rules = VolumeRuleSet.from_models(result.scalars().all())
+        _volume_rules_loaded_at = time.monotonic()
+        return _volume_rules
+    
+    @staticmethod
+    def invalidate_volume_rules() -> None:
+        """Drop compiled rules (call after VolumeDiscount changes)."""
+        global _volume_rules
+        _volume_rules = None
+    
+    @staticmethod
+    def _resolve_rules(active_rules=None) -> VolumeRuleSet:
+        """Compiled rules from argument (legacy config if None).
+        
+        Callers pricing for users pass ``await DiscountEngine.get_volume_rules(session)``.
+        """
+        if isinstance(active_rules, VolumeRuleSet):
+            return active_rules
+        if active_rules:
+            return VolumeRuleSet.from_models(active_rules)
+        return VolumeRuleSet.legacy()
+    
     @staticmethod
     def calculate_cart_metrics(cart_items: List[Tuple[CartItem, Product]]) -> Tuple[int, float, int]:
         """Calculate cart metrics: pack count, total weight, subtotal.
@@ -70,38 +231,76 @@ class DiscountEngine:
         total_packs_300g: int, 
         total_weight_kg: float,
         subtotal: int = 0,
-        active_rules: Optional[List['VolumeDiscount']] = None
+        active_rules=None
     ) -> int:
         """Calculate volume discount percentage based on active rules.
-        If active_rules is None, falls back to legacy config.
+        
+        active_rules may be a compiled VolumeRuleSet or a list of VolumeDiscount;
+        if None, the legacy config is used.
         """
-        best_discount = 0
+        rules = DiscountEngine._resolve_rules(active_rules)
+        return max(
+            rules.best('packs', total_packs_300g),
+            rules.best('weight', total_weight_kg),
+            rules.best('price', subtotal),
+        )
+    
+    @staticmethod
+    def batch_volume_discount(rules: VolumeRuleSet, columns: PricingColumns):
+        """Volume discount percent for every cart in columns at once.
         
-        if active_rules:
-            for rule in active_rules:
-                if not rule.is_active:
-                    continue
-                    
-                if rule.discount_type == 'packs':
-                    if total_packs_300g >= rule.threshold:
-                        best_discount = max(best_discount, rule.discount_percent)
-                elif rule.discount_type == 'weight':
-                    if total_weight_kg >= rule.threshold:
-                        best_discount = max(best_discount, rule.discount_percent)
-                elif rule.discount_type == 'price':
-                    if subtotal >= rule.threshold:
-                        best_discount = max(best_discount, rule.discount_percent)
-            return best_discount
-
-        # Fallback to legacy config
-        for pack_threshold, discount in VOLUME_DISCOUNTS_PACKS.items():
-            if total_packs_300g >= pack_threshold:
-                best_discount = max(best_discount, discount)
-        
-        if total_weight_kg >= KG_DISCOUNT_THRESHOLD:
-            best_discount = max(best_discount, KG_DISCOUNT_PERCENT)
-            
-        return best_discount
+        Same result as ``calculate_volume_discount`` per cart, vectorized
+        with ``searchsorted`` over the compiled thresholds.
+        """
+        if np is None:
+            return [
+                DiscountEngine.calculate_volume_discount(packs, weight, subtotal, rules)
+                for packs, weight, subtotal in zip(columns.packs, columns.weights, columns.subtotals)
+            ]
+        
+        percents = np.zeros(len(columns), dtype=np.int64)
+        for discount_type, values in (
+            ('packs', columns.packs), ('weight', columns.weights), ('price', columns.subtotals)
+        ):
+            thresholds = rules.thresholds.get(discount_type)
+            if not thresholds:
+                continue
+            idx = np.searchsorted(np.asarray(thresholds), values, side='right') - 1
+            best = np.asarray(rules.best_percents[discount_type], dtype=np.int64)
+            percents = np.maximum(percents, np.where(idx >= 0, best[np.maximum(idx, 0)], 0))
+        return percents
+    
+    @staticmethod
+    def simulate(current: VolumeRuleSet, candidate: VolumeRuleSet, columns: PricingColumns) -> SimulationResult:
+        """What-if: discounts of current vs candidate rules over many carts.
+        
+        Volume discounts only (loyalty is disabled, promo codes are per user).
+        """
+        started = time.perf_counter()
+        current_pct = DiscountEngine.batch_volume_discount(current, columns)
+        candidate_pct = DiscountEngine.batch_volume_discount(candidate, columns)
+        
+        if np is None:
+            current_amounts = [int(s * p / 100) for s, p in zip(columns.subtotals, current_pct)]
+            candidate_amounts = [int(s * p / 100) for s, p in zip(columns.subtotals, candidate_pct)]
+            gross = sum(columns.subtotals)
+            current_discount, candidate_discount = sum(current_amounts), sum(candidate_amounts)
+            changed = sum(1 for a, b in zip(current_pct, candidate_pct) if a != b)
+        else:
+            gross = int(columns.subtotals.sum())
+            current_discount = int((columns.subtotals * current_pct // 100).sum())
+            candidate_discount = int((columns.subtotals * candidate_pct // 100).sum())
+            changed = int(np.count_nonzero(current_pct != candidate_pct))
+        
+        return SimulationResult(
+            carts=len(columns),
+            gross=gross,
+            current_discount=current_discount,
+            candidate_discount=candidate_discount,
+            carts_changed=changed,
+            elapsed_ms=(time.perf_counter() - started) * 1000,
+        )
+    
     @staticmethod
     def calculate_loyalty_discount(user: User) -> int:
         """Get loyalty discount. 
@@ -115,14 +314,16 @@ class DiscountEngine:
         cart_items: List[Tuple[CartItem, Product]],
         user: User,
         promo_code: Optional[PromoCode] = None,
-        active_rules: Optional[List['VolumeDiscount']] = None
+        active_rules=None
     ) -> DiscountBreakdown:
         """Calculate complete discount breakdown."""
+        rules = DiscountEngine._resolve_rules(active_rules)
+        
         # Calculate cart metrics
         total_packs, total_kg, subtotal = DiscountEngine.calculate_cart_metrics(cart_items)
         
         # Calculate volume discount
-        volume_discount = DiscountEngine.calculate_volume_discount(total_packs, total_kg, subtotal, active_rules)
+        volume_discount = DiscountEngine.calculate_volume_discount(total_packs, total_kg, subtotal, rules)
         
         # Calculate loyalty discount
         loyalty_discount = DiscountEngine.calculate_loyalty_discount(user)
@@ -161,8 +362,8 @@ class DiscountEngine:
         final_total = subtotal - total_discount_amount
         
         # Progress tracking
-        next_pack_tier = DiscountEngine._get_next_pack_discount_tier(total_packs)
-        kg_discount_active = total_kg >= KG_DISCOUNT_THRESHOLD
+        next_pack_tier = DiscountEngine._get_next_pack_discount_tier(total_packs, rules)
+        kg_discount_active = rules.best('weight', total_kg) > 0
         
         return DiscountBreakdown(
             volume_discount_percent=final_volume,
@@ -183,42 +384,42 @@ class DiscountEngine:
 
 
     @staticmethod
-    def _get_next_pack_discount_tier(current_packs: int) -> Optional[int]:
+    def _get_next_pack_discount_tier(current_packs: int, rules: Optional[VolumeRuleSet] = None) -> Optional[int]:
         """Get next pack discount tier threshold."""
-        thresholds = sorted(VOLUME_DISCOUNTS_PACKS.keys())
-        for t in thresholds:
-            if current_packs < t:
-                return t
-        return None
+        tier = DiscountEngine._resolve_rules(rules).next_tier('packs', current_packs)
+        return int(tier[0]) if tier else None
 
     @staticmethod
     def format_discount_progress(
         breakdown: DiscountBreakdown,
-        current_format: str = "both"
+        current_format: str = "both",
+        rules: Optional[VolumeRuleSet] = None
     ) -> str:
         """Friendly progress message for beginners (no tables)."""
         from config import settings
         
+        rules = DiscountEngine._resolve_rules(rules)
         lines = ["🐒 <b>ПРОГРЕС ДО ЗНИЖОК:</b>\n"]
         
         packs = breakdown.total_packs_300g
         weight = breakdown.total_weight_kg
         
         # 1. Volume Discount Progress
-        if breakdown.volume_discount_percent >= 25:
-            lines.append("🔥 <b>ВІТАЄМО!</b> У тебе активована максимальна оптова знижка <b>-25%</b>! Це найкраща ціна, на яку ти міг розраховувати.")
+        max_percent = rules.max_percent
+        if max_percent and breakdown.volume_discount_percent >= max_percent:
+            lines.append(f"🔥 <b>ВІТАЄМО!</b> У тебе активована максимальна оптова знижка <b>-{max_percent}%</b>! Це найкраща ціна, на яку ти міг розраховувати.")
         else:
             # Tell how many packs to next tier
-            next_tier = breakdown.next_pack_discount_tier
-            if next_tier:
-                needed_packs = next_tier - packs
-                next_discount = VOLUME_DISCOUNTS_PACKS.get(next_tier, 25)
-                lines.append(f"📦 Ще {needed_packs} пачки (по 300г) — і отримаєш знижку <b>-{next_discount}%</b> на все замовлення!")
+            pack_tier = rules.next_tier('packs', packs)
+            if pack_tier:
+                needed_packs = int(pack_tier[0]) - packs
+                lines.append(f"📦 Ще {needed_packs} пачки (по 300г) — і отримаєш знижку <b>-{pack_tier[1]}%</b> на все замовлення!")
             
             # Tell about kg threshold
-            if weight < KG_DISCOUNT_THRESHOLD:
-                needed_kg = KG_DISCOUNT_THRESHOLD - weight
-                lines.append(f"⚖️ Або додай ще <b>{needed_kg:.1f} кг</b>, щоб миттєво отримати <b>-25%</b>!")
+            kg_tier = rules.next_tier('weight', weight)
+            if kg_tier:
+                needed_kg = kg_tier[0] - weight
+                lines.append(f"⚖️ Або додай ще <b>{needed_kg:.1f} кг</b>, щоб миттєво отримати <b>-{kg_tier[1]}%</b>!")
         
         # 2. Free Delivery Progress
         threshold = settings.free_delivery_threshold
@@ -0,0 +1,229 @@
+"""Per-user targeting features (``user_features``).
+
+Order features - favorite profile, average packs and order value, first/last
+order and cadence - are recomputed for a user at the end of any flush in
+which one of their orders became or stopped being sold (paid/shipped/
+delivered), in the same transaction. Cart features are refreshed for
+everybody with one grouped upsert before cart-based campaigns: cart writes
+are bulk Core statements that mapper events don't see. Campaigns then target
+users with a single indexed query on ``user_features``.
+"""
+import logging
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import case, delete, event, func, inspect, or_, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, object_session
+
+from src.database.models import Order, OrderLine, Product, UserFeature
+from src.services.cart_service import CartService
+from src.services.metrics_service import SOLD_STATUSES
+
+logger = logging.getLogger(__name__)
+
+ORDER_COLUMNS = [
+    'orders_count', 'favorite_profile', 'avg_packs', 'avg_order_value',
+    'first_order_at', 'last_order_at', 'order_cadence_days',
+]
+CART_COLUMNS = ['cart_packs', 'cart_weight_kg', 'cart_value', 'cart_refreshed_at']
+
+_BATCH_SIZE = 500
+
+
+def _empty_order_features(user_id: int) -> Dict:
+    return {
+        'user_id': user_id,
+        'orders_count': 0,
+        'favorite_profile': None,
+        'avg_packs': 0.0,
+        'avg_order_value': 0,
+        'first_order_at': None,
+        'last_order_at': None,
+        'order_cadence_days': None,
+    }
+
+
+def _order_feature_rows(connection, user_ids: Optional[List[int]] = None) -> List[Dict]:
+    """Order features of the given users (all users with sold orders if None)."""
+    filters = [Order.status.in_(SOLD_STATUSES)]
+    if user_ids is not None:
+        filters.append(Order.user_id.in_(user_ids))
+
+    rows: Dict[int, Dict] = {}
+    result = connection.execute(
+        select(
+            Order.user_id,
+            func.count(Order.id),
+            func.avg(Order.total),
+            func.min(Order.created_at),
+            func.max(Order.created_at)
+        )
+        .where(*filters)
+        .group_by(Order.user_id)
+    )
+    for user_id, count, avg_total, first_at, last_at in result.all():
+        row = _empty_order_features(user_id)
+        row.update({
+            'orders_count': count,
+            'avg_order_value': int(avg_total or 0),
+            'first_order_at': first_at,
+            'last_order_at': last_at,
+        })
+        if count > 1 and first_at and last_at:
+            row['order_cadence_days'] = round((last_at - first_at).total_seconds() / 86400 / (count - 1), 1)
+        rows[user_id] = row
+
+    packs = case((OrderLine.format == "300g", OrderLine.quantity), else_=0)
+    result = connection.execute(
+        select(Order.user_id, func.sum(packs))
+        .join(OrderLine, OrderLine.order_id == Order.id)
+        .where(*filters)
+        .group_by(Order.user_id)
+    )
+    for user_id, total_packs in result.all():
+        row = rows[user_id]
+        row['avg_packs'] = round((total_packs or 0) / row['orders_count'], 2)
+
+    # Favorite profile: most ordered lines per profile
+    result = connection.execute(
+        select(Order.user_id, Product.profile, func.count(OrderLine.id))
+        .join(OrderLine, OrderLine.order_id == Order.id)
+        .join(Product, Product.id == OrderLine.product_id)
+        .where(*filters, Product.profile.is_not(None))
+        .group_by(Order.user_id, Product.profile)
+    )
+    best_counts: Dict[int, int] = {}
+    for user_id, profile, count in result.all():
+        if count > best_counts.get(user_id, 0):
+            best_counts[user_id] = count
+            rows[user_id]['favorite_profile'] = profile
+
+    # Users without sold orders anymore
+    for user_id in user_ids or []:
+        rows.setdefault(user_id, _empty_order_features(user_id))
+    return list(rows.values())
+
+
+def _upsert(connection, rows: List[Dict], columns: Iterable[str]) -> None:
+    """Insert feature rows or update the given columns of existing ones."""
+    if not rows:
+        return
+    columns = list(columns)
+    insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    for start in range(0, len(rows), _BATCH_SIZE):
+        stmt = insert(UserFeature).values(rows[start:start + _BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['user_id'],
+            set_={**{column: stmt.excluded[column] for column in columns}, 'updated_at': func.now()}
+        )
+        connection.execute(stmt)
+
+
+def refresh_order_features(connection, user_ids: List[int]) -> None:
+    """Recompute order features of some users (sync, usable inside flush)."""
+    _upsert(connection, _order_feature_rows(connection, user_ids), ORDER_COLUMNS)
+
+
+# ---------- incremental maintenance (sync, runs inside flush) ----------
+
+_PENDING_USERS = 'feature_users'
+
+
+def _mark_user(target: Order) -> None:
+    """Remember the buyer; features are recomputed once the flush has written everything."""
+    session = object_session(target)
+    if session is not None:
+        session.info.setdefault(_PENDING_USERS, set()).add(target.user_id)
+
+
+@event.listens_for(Order, "after_insert")
+def _on_order_inserted(mapper, connection, target) -> None:
+    if target.status in SOLD_STATUSES:
+        _mark_user(target)
+
+
+@event.listens_for(Order, "after_update")
+def _on_order_updated(mapper, connection, target) -> None:
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    old_status = history.deleted[0] if history.deleted else None
+    if (old_status in SOLD_STATUSES) != (target.status in SOLD_STATUSES):
+        _mark_user(target)
+
+
+@event.listens_for(Order, "after_delete")
+def _on_order_deleted(mapper, connection, target) -> None:
+    if target.status in SOLD_STATUSES:
+        _mark_user(target)
+
+
+@event.listens_for(Session, "after_flush")
+def _refresh_marked_users(session, flush_context) -> None:
+    user_ids = session.info.pop(_PENDING_USERS, None)
+    if user_ids:
+        refresh_order_features(session.connection(), sorted(user_ids))
+
+
+class FeatureService:
+    """Service for per-user targeting features."""
+
+    @staticmethod
+    async def refresh_cart_features(session: AsyncSession) -> int:
+        """Refresh cart columns of all users (one grouped query, commits).
+
+        Returns:
+            Number of users with a non-empty cart
+        """
+        now = datetime.utcnow()
+        await session.execute(
+            update(UserFeature)
+            .where(or_(UserFeature.cart_packs > 0, UserFeature.cart_weight_kg > 0, UserFeature.cart_value > 0))
+            .values(cart_packs=0, cart_weight_kg=0.0, cart_value=0, cart_refreshed_at=now)
+            .execution_options(synchronize_session=False)
+        )
+
+        carts = await CartService.get_cart_metrics_by_user(session)
+        rows = [
+            {
+                **_empty_order_features(user_id),
+                'cart_packs': packs,
+                'cart_weight_kg': round(weight_kg, 3),
+                'cart_value': subtotal,
+                'cart_refreshed_at': now,
+            }
+            for user_id, packs, weight_kg, subtotal in carts
+        ]
+        connection = await session.connection()
+        await connection.run_sync(_upsert, rows, CART_COLUMNS)
+        await session.commit()
+        return len(rows)
+
+    @staticmethod
+    async def rebuild(session: AsyncSession) -> int:
+        """Recompute the whole table from orders and carts (commits).
+
+        Returns:
+            Number of users with sold orders
+        """
+        await session.execute(delete(UserFeature))
+        connection = await session.connection()
+        rows = await connection.run_sync(_order_feature_rows)
+        await connection.run_sync(_upsert, rows, ORDER_COLUMNS)
+        await session.commit()
+        await FeatureService.refresh_cart_features(session)
+        logger.info(f"User features rebuilt ({len(rows)} customers)")
+        return len(rows)
+
+    @staticmethod
+    async def ensure_built(session: AsyncSession) -> None:
+        """Build the table once (empty table but existing sold orders)."""
+        has_features = await session.execute(select(UserFeature.user_id).limit(1))
+        if has_features.first() is not None:
+            return
+        has_orders = await session.execute(select(Order.id).where(Order.status.in_(SOLD_STATUSES)).limit(1))
+        if has_orders.first() is not None:
+            await FeatureService.rebuild(session)
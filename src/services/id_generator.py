@@ -0,0 +1,120 @@
+"""Block-allocated ID generator for order numbers and referral codes.
+
+Each worker reserves a block of values from the ``id_sequences`` row with one
+atomic ``UPDATE ... RETURNING`` and hands them out from memory, so creating an
+order normally costs no extra query and never retries on a unique-index
+collision. Values are monotonic per worker and unique across workers.
+
+Blocks are reserved on the caller's session (no second pooled connection per
+update). The caller gets the first value of the block; the rest is handed out
+only after the caller's transaction commits and is dropped if it rolls back,
+so a rolled-back reservation is never reused.
+"""
+import logging
+import string
+
+from sqlalchemy import event, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import IdSequence
+
+logger = logging.getLogger(__name__)
+
+_REFERRAL_ALPHABET = string.ascii_uppercase + string.digits
+_REFERRAL_SPACE = len(_REFERRAL_ALPHABET) ** 8
+# Odd, not divisible by 3: n -> n * K mod 36^8 is a bijection (unique codes)
+_REFERRAL_MULTIPLIER = 897002298653
+
+
+class BlockAllocator:
+    """Hands out values of a named sequence from reserved blocks."""
+
+    def __init__(self, name: str, block_size: int, start: int = 1):
+        self.name = name
+        self.block_size = block_size
+        self.start = start
+        self._next = 0
+        self._end = 0  # current block is [_next, _end)
+
+    async def _reserve(self, session: AsyncSession) -> tuple:
+        """Reserve the next block in the caller's transaction."""
+        conn = await session.connection()
+        values = {"name": self.name, "next_value": self.start}
+        if conn.dialect.name == "postgresql":
+            await conn.execute(pg_insert(IdSequence).values(**values).on_conflict_do_nothing())
+        else:
+            await conn.execute(sqlite_insert(IdSequence).values(**values).on_conflict_do_nothing())
+
+        result = await conn.execute(
+            update(IdSequence)
+            .where(IdSequence.name == self.name)
+            .values(next_value=IdSequence.next_value + self.block_size)
+            .returning(IdSequence.next_value)
+        )
+        end = result.scalar_one()
+        logger.info(f"Reserved {self.name} block [{end - self.block_size}, {end})")
+        return end - self.block_size, end
+
+    def _use_after_commit(self, session: AsyncSession, start: int, end: int) -> None:
+        """Hand out [start, end) once the reserving transaction commits."""
+        done = False
+
+        def on_commit(_session):
+            nonlocal done
+            if done:
+                return
+            done = True
+            if self._next >= self._end:
+                self._next, self._end = start, end
+
+        def on_rollback(_session):
+            nonlocal done
+            done = True
+
+        sync_session = session.sync_session
+        event.listen(sync_session, "after_commit", on_commit, once=True)
+        event.listen(sync_session, "after_rollback", on_rollback, once=True)
+
+    async def next(self, session: AsyncSession) -> int:
+        """Next value of the sequence (reserves a block on ``session`` if needed)."""
+        if self._next < self._end:
+            value = self._next
+            self._next += 1
+            return value
+
+        start, end = await self._reserve(session)
+        self._use_after_commit(session, start + 1, end)
+        return start
+
+
+_order_numbers = BlockAllocator("order_number", block_size=20, start=10000)
+_referral_codes = BlockAllocator("referral_code", block_size=100, start=1)
+
+
+class IdGenerator:
+    """Unique order numbers and referral codes."""
+
+    @staticmethod
+    async def next_order_number(session: AsyncSession) -> str:
+        """Order number in format MC-NNNNN (5+ digits, never collides with legacy MC-XXXX)."""
+        return f"MC-{await _order_numbers.next(session)}"
+
+    @staticmethod
+    def referral_code_for(value: int) -> str:
+        """Referral code for a sequence value: 'R' + 8 scrambled base-36 characters.
+
+        Legacy random codes have 8 characters, so new codes can't collide with them.
+        """
+        n = (value * _REFERRAL_MULTIPLIER) % _REFERRAL_SPACE
+        chars = []
+        for _ in range(8):
+            n, digit = divmod(n, len(_REFERRAL_ALPHABET))
+            chars.append(_REFERRAL_ALPHABET[digit])
+        return "R" + "".join(reversed(chars))
+
+    @staticmethod
+    async def next_referral_code(session: AsyncSession) -> str:
+        """Unique, hard-to-guess referral code."""
+        return IdGenerator.referral_code_for(await _referral_codes.next(session))
@@ -0,0 +1,114 @@
+"""Database leases and run history for scheduled jobs.
+
+Every bot worker runs the same scheduler; before a job runs, the worker takes
+the job's lease with one conditional upsert (succeeds only if nobody holds an
+unexpired lease), so each job runs once across workers and never overlaps
+itself. After a successful run the lease is kept until just before the job's
+next slot, so a late duplicate fire of the same slot (or a manual rerun) is
+skipped too. A lease of a crashed worker expires after its TTL. Every run is
+recorded in ``job_runs`` with its status, result and duration.
+"""
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import JobLease, JobRun
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+class JobLeaseService:
+    """Service for job leases and run history."""
+
+    @staticmethod
+    def new_owner() -> str:
+        """Owner token of one run (worker ID + random suffix)."""
+        return f"{WORKER_ID}:{uuid.uuid4().hex[:8]}"
+
+    @staticmethod
+    async def acquire(session: AsyncSession, name: str, owner: str, ttl_seconds: int) -> bool:
+        """Take the job's lease if it's free or expired (commits).
+
+        Returns:
+            True if the lease is now held by ``owner``
+        """
+        now = datetime.utcnow()
+        connection = await session.connection()
+        insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+        stmt = insert(JobLease).values(
+            name=name,
+            owner=owner,
+            acquired_at=now,
+            locked_until=now + timedelta(seconds=ttl_seconds)
+        )
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['name'],
+            set_={
+                'owner': stmt.excluded.owner,
+                'acquired_at': stmt.excluded.acquired_at,
+                'locked_until': stmt.excluded.locked_until,
+            },
+            where=JobLease.locked_until < now
+        ).returning(JobLease.owner)
+        result = await session.execute(stmt)
+        acquired = result.scalar_one_or_none() == owner
+        await session.commit()
+        return acquired
+
+    @staticmethod
+    async def release(
+        session: AsyncSession,
+        name: str,
+        owner: str,
+        until: Optional[datetime] = None
+    ) -> None:
+        """Release the lease if still held by ``owner`` (commits).
+
+        Args:
+            session: Database session
+            name: Job name
+            owner: Owner token of the run
+            until: Keep the lease locked until this time (UTC); now if None
+        """
+        await session.execute(
+            update(JobLease)
+            .where(JobLease.name == name, JobLease.owner == owner)
+            .values(locked_until=max(until or datetime.utcnow(), datetime.utcnow()))
+            .execution_options(synchronize_session=False)
+        )
+        await session.commit()
+
+    @staticmethod
+    async def start_run(session: AsyncSession, name: str, owner: str) -> JobRun:
+        """Record the start of a run (commits)."""
+        run = JobRun(job_name=name, owner=owner, status='running', started_at=datetime.utcnow())
+        session.add(run)
+        await session.commit()
+        return run
+
+    @staticmethod
+    async def finish_run(session: AsyncSession, run_id: int, status: str, result: Optional[str] = None) -> None:
+        """Record the end of a run with its duration (commits)."""
+        run = await session.get(JobRun, run_id)
+        if run is None:
+            return
+        run.finished_at = datetime.utcnow()
+        run.duration_ms = int((run.finished_at - run.started_at).total_seconds() * 1000)
+        run.status = status
+        run.result = result[:1000] if result else None
+        await session.commit()
+
+    @staticmethod
+    async def get_recent_runs(session: AsyncSession, limit: int = 20) -> List[JobRun]:
+        """Latest job runs, newest first."""
+        result = await session.execute(
+            select(JobRun).order_by(JobRun.started_at.desc(), JobRun.id.desc()).limit(limit)
+        )
+        return list(result.scalars().all())
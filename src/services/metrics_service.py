@@ -0,0 +1,237 @@
+"""Daily metrics rollup for admin dashboards.
+
+``daily_metrics`` keeps one row per day (order creation date) with order
+counts by status, sales, kg, discounts and new users. Mapper events on Order
+and User apply the difference of every insert, status change and delete to
+the day's row with an atomic upsert inside the same flush, so dashboards
+read a handful of rows instead of scanning ``orders``. ``rebuild()``
+recomputes the table from history.
+"""
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional
+
+from sqlalchemy import case, delete, event, func, inspect, select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import DailyMetric, Order, OrderLine, User
+
+logger = logging.getLogger(__name__)
+
+SOLD_STATUSES = ('paid', 'shipped', 'delivered')
+
+STATUS_COLUMNS = {
+    'pending': 'orders_pending',
+    'paid': 'orders_paid',
+    'shipped': 'orders_shipped',
+    'delivered': 'orders_delivered',
+    'cancelled': 'orders_cancelled',
+}
+
+_SUM_COLUMNS = [
+    'new_users', *STATUS_COLUMNS.values(), 'sold_orders', 'revenue', 'subtotal', 'kg',
+    'discount_volume', 'discount_loyalty', 'discount_promo', 'orders_with_discount',
+]
+
+
+def _as_date(value) -> date:
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    if value:
+        return date.fromisoformat(str(value)[:10])
+    return datetime.utcnow().date()
+
+
+def _order_deltas(order: Order, status: Optional[str], kg: float, sign: int) -> Dict[str, float]:
+    """Contribution of an order with the given status (sign: +1 add, -1 remove)."""
+    deltas: Dict[str, float] = {}
+    column = STATUS_COLUMNS.get(status)
+    if column:
+        deltas[column] = sign
+
+    if status in SOLD_STATUSES:
+        discount_volume = order.discount_volume or 0
+        discount_loyalty = order.discount_loyalty or 0
+        discount_promo = order.discount_promo or 0
+        has_discount = (discount_volume + discount_loyalty + discount_promo) > 0
+        deltas.update({
+            'sold_orders': sign,
+            'revenue': sign * (order.total or 0),
+            'subtotal': sign * (order.subtotal or 0),
+            'kg': sign * kg,
+            'discount_volume': sign * discount_volume,
+            'discount_loyalty': sign * discount_loyalty,
+            'discount_promo': sign * discount_promo,
+            'orders_with_discount': sign if has_discount else 0,
+        })
+    return deltas
+
+
+def _apply(connection, day: date, deltas: Dict[str, float]) -> None:
+    """Add deltas to the day's row (atomic upsert)."""
+    deltas = {key: value for key, value in deltas.items() if value}
+    if not deltas:
+        return
+
+    insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+    stmt = insert(DailyMetric).values(day=day, **{key: deltas.get(key, 0) for key in _SUM_COLUMNS})
+    stmt = stmt.on_conflict_do_update(
+        index_elements=['day'],
+        set_={key: getattr(DailyMetric, key) + stmt.excluded[key] for key in deltas}
+    )
+    connection.execute(stmt)
+
+
+def _order_day(connection, order: Order) -> date:
+    loaded = inspect(order).dict
+    if loaded.get('created_at') is None and order.id is not None:
+        created_at = connection.execute(select(Order.created_at).where(Order.id == order.id)).scalar()
+        return _as_date(created_at)
+    return _as_date(loaded.get('created_at'))
+
+
+def _order_kg(connection, order: Order) -> float:
+    loaded = inspect(order).dict
+    if 'lines' in loaded:
+        return sum(line.weight_kg or 0 for line in loaded['lines'])
+    return connection.execute(
+        select(func.coalesce(func.sum(OrderLine.weight_kg), 0.0)).where(OrderLine.order_id == order.id)
+    ).scalar()
+
+
+# ---------- incremental maintenance (sync, runs inside flush) ----------
+
+@event.listens_for(Order, "after_insert")
+def _on_order_inserted(mapper, connection, target) -> None:
+    kg = _order_kg(connection, target) if target.status in SOLD_STATUSES else 0.0
+    _apply(connection, _order_day(connection, target), _order_deltas(target, target.status, kg, +1))
+
+
+@event.listens_for(Order, "after_update")
+def _on_order_updated(mapper, connection, target) -> None:
+    history = inspect(target).attrs.status.history
+    if not history.has_changes():
+        return
+    old_status = history.deleted[0] if history.deleted else None
+    new_status = target.status
+    if old_status == new_status:
+        return
+
+    sold = old_status in SOLD_STATUSES or new_status in SOLD_STATUSES
+    kg = _order_kg(connection, target) if sold else 0.0
+    deltas = _order_deltas(target, new_status, kg, +1)
+    for key, value in _order_deltas(target, old_status, kg, -1).items():
+        deltas[key] = deltas.get(key, 0) + value
+    _apply(connection, _order_day(connection, target), deltas)
+
+
+@event.listens_for(Order, "after_delete")
+def _on_order_deleted(mapper, connection, target) -> None:
+    kg = _order_kg(connection, target) if target.status in SOLD_STATUSES else 0.0
+    _apply(connection, _order_day(connection, target), _order_deltas(target, target.status, kg, -1))
+
+
+@event.listens_for(User, "after_insert")
+def _on_user_inserted(mapper, connection, target) -> None:
+    _apply(connection, _as_date(inspect(target).dict.get('created_at')), {'new_users': 1})
+
+
+class MetricsService:
+    """Service for the daily metrics rollup."""
+
+    @staticmethod
+    async def rebuild(session: AsyncSession) -> int:
+        """Recompute daily_metrics from orders, order_lines and users.
+
+        Returns:
+            Number of days written
+        """
+        days: Dict[date, Dict[str, float]] = {}
+
+        def add(day, values: Dict[str, float]) -> None:
+            row = days.setdefault(_as_date(day), {key: 0 for key in _SUM_COLUMNS})
+            for key, value in values.items():
+                row[key] += value or 0
+
+        kg_per_order = (
+            select(OrderLine.order_id, func.sum(OrderLine.weight_kg).label('kg'))
+            .group_by(OrderLine.order_id)
+            .subquery()
+        )
+        order_day = func.date(Order.created_at)
+        sold = Order.status.in_(SOLD_STATUSES)
+        discount = Order.discount_volume + Order.discount_loyalty + Order.discount_promo
+        result = await session.execute(
+            select(
+                order_day,
+                Order.status,
+                func.count(Order.id),
+                func.sum(Order.total),
+                func.sum(Order.subtotal),
+                func.sum(func.coalesce(kg_per_order.c.kg, 0.0)),
+                func.sum(Order.discount_volume),
+                func.sum(Order.discount_loyalty),
+                func.sum(Order.discount_promo),
+                func.sum(case((discount > 0, 1), else_=0)),
+            )
+            .outerjoin(kg_per_order, kg_per_order.c.order_id == Order.id)
+            .where(Order.status.in_(STATUS_COLUMNS.keys()))
+            .group_by(order_day, Order.status)
+        )
+        for day, status, count, revenue, subtotal, kg, volume, loyalty, promo, discounted in result.all():
+            values = {STATUS_COLUMNS[status]: count}
+            if status in SOLD_STATUSES:
+                values.update({
+                    'sold_orders': count,
+                    'revenue': revenue,
+                    'subtotal': subtotal,
+                    'kg': kg,
+                    'discount_volume': volume,
+                    'discount_loyalty': loyalty,
+                    'discount_promo': promo,
+                    'orders_with_discount': discounted,
+                })
+            add(day, values)
+
+        user_day = func.date(User.created_at)
+        result = await session.execute(select(user_day, func.count(User.id)).group_by(user_day))
+        for day, count in result.all():
+            add(day, {'new_users': count})
+
+        await session.execute(delete(DailyMetric))
+        if days:
+            await session.execute(
+                DailyMetric.__table__.insert(),
+                [{'day': day, **values} for day, values in days.items()]
+            )
+        await session.commit()
+        logger.info(f"Daily metrics rebuilt ({len(days)} days)")
+        return len(days)
+
+    @staticmethod
+    async def ensure_built(session: AsyncSession) -> None:
+        """Build the rollup once (empty table but existing users/orders)."""
+        has_metrics = await session.execute(select(DailyMetric.day).limit(1))
+        if has_metrics.first() is not None:
+            return
+        has_history = await session.execute(select(User.id).limit(1))
+        if has_history.first() is not None:
+            await MetricsService.rebuild(session)
+
+    @staticmethod
+    def empty_totals() -> Dict[str, float]:
+        """Totals with every metric at zero."""
+        return {key: 0 for key in _SUM_COLUMNS}
+
+    @staticmethod
+    async def get_totals(session: AsyncSession, days: Optional[int] = None) -> Dict[str, float]:
+        """Sum of daily metrics (all time, or the last N days including today)."""
+        query = select(*[func.coalesce(func.sum(getattr(DailyMetric, key)), 0) for key in _SUM_COLUMNS])
+        if days is not None:
+            query = query.where(DailyMetric.day > datetime.utcnow().date() - timedelta(days=days))
+        row = (await session.execute(query)).one()
+        return dict(zip(_SUM_COLUMNS, row))
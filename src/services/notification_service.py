@@ -6,13 +6,22 @@ from sqlalchemy import select, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 from aiogram import Bot
 
-from src.database.models import User, Order, Product
+from src.database.models import User, Order, Product, UserFeature
+from src.services.broadcast_service import OutgoingMessage
+from src.services.feature_service import FeatureService
+from src.services.outbox_service import OutboxService
+from src.services.targeting_service import TargetingService
 from src.utils.formatters import format_currency, format_date
 from config import settings
 
 logger = logging.getLogger(__name__)
 
 
+def _estimated_savings(cart_value: int, current_percent: int, next_percent: int) -> int:
+    """Rough extra savings on the current cart value at the next discount tier."""
+    return max(0, cart_value * (next_percent - current_percent) // 100)
+
+
 class NotificationService:
     """Service for sending automated notifications to users."""
     
@@ -20,6 +29,18 @@ class NotificationService:
         """Initialize notification service with bot instance."""
         self.bot = bot
     
+    @staticmethod
+    async def _enqueue(
+        session: AsyncSession,
+        messages: List[OutgoingMessage],
+        campaign: str,
+        scope=None
+    ) -> int:
+        """Put a campaign's messages into the outbox (once per user per scope, default today)."""
+        enqueued = await OutboxService.enqueue(session, messages, campaign, scope)
+        await session.commit()
+        return enqueued
+    
     async def send_order_confirmation(
         self,
         session: AsyncSession,
@@ -61,15 +82,10 @@ class NotificationService:
 Дякуємо, що обрали Monkeys Coffee! 🐒☕
 """
         
-        try:
-            await self.bot.send_message(
-                chat_id=order.user_id,
-                text=text,
-                parse_mode="HTML"
-            )
-            logger.info(f"Sent order confirmation for order {order_id}")
-        except Exception as e:
-            logger.error(f"Failed to send order confirmation: {e}")
+        await self._enqueue(
+            session, [OutgoingMessage(chat_id=order.user_id, text=text)], "order_confirmation", scope=order.id
+        )
+        logger.info(f"Queued order confirmation for order {order_id}")
     
     async def send_shipping_notification(
         self,
@@ -114,15 +130,14 @@ class NotificationService:
 Смачної кави! ☕
 """
         
-        try:
-            await self.bot.send_message(
-                chat_id=order.user_id,
-                text=text,
-                parse_mode="HTML"
-            )
-            logger.info(f"Sent shipping notification for order {order_id}")
-        except Exception as e:
-            logger.error(f"Failed to send shipping notification: {e}")
+        # A corrected tracking number is announced again
+        await self._enqueue(
+            session,
+            [OutgoingMessage(chat_id=order.user_id, text=text)],
+            "order_shipped",
+            scope=f"{order.id}-{order.tracking_number}"
+        )
+        logger.info(f"Queued shipping notification for order {order_id}")
     
     async def send_replenishment_reminders(
         self,
@@ -135,72 +150,23 @@ class NotificationService:
         - Haven't ordered in the last 3 days
         
         Returns:
-            Number of reminders sent
+            Number of reminders queued for sending
         """
-        # Calculate date range
-        reminder_start = datetime.utcnow() - timedelta(days=25)
-        reminder_end = datetime.utcnow() - timedelta(days=20)
-        recent_cutoff = datetime.utcnow() - timedelta(days=3)
-        
-        # Find users with last order in reminder window
-        query = select(User).join(Order).where(
-            and_(
-                Order.status.in_(['paid', 'shipped', 'delivered']),
-                Order.created_at >= reminder_start,
-                Order.created_at <= reminder_end
-            )
-        ).distinct()
+        # Candidates with their last order and favorite product (one query)
+        targets = await TargetingService.get_replenishment_targets(
+            session,
+            window_start_days=25,
+            window_end_days=20,
+            recent_days=3
+        )
         
-        result = await session.execute(query)
-        users = result.scalars().all()
+        messages = []
         
-        sent_count = 0
-        
-        for user in users:
-            # Check if user has ordered recently
-            recent_order_query = select(Order).where(
-                and_(
-                    Order.user_id == user.id,
-                    Order.created_at >= recent_cutoff,
-                    Order.status.in_(['paid', 'shipped', 'delivered'])
-                )
-            )
-            recent_result = await session.execute(recent_order_query)
-            recent_order = recent_result.scalar_one_or_none()
-            
-            if recent_order:
-                continue  # Skip if already ordered recently
-            
-            # Get user's last order for personalization
-            last_order_query = select(Order).where(
-                and_(
-                    Order.user_id == user.id,
-                    Order.status.in_(['paid', 'shipped', 'delivered'])
-                )
-            ).order_by(Order.created_at.desc()).limit(1)
-            
-            last_order_result = await session.execute(last_order_query)
-            last_order = last_order_result.scalar_one_or_none()
-            
-            if not last_order:
-                continue
+        for target in targets:
+            user = target.user
             
             # Personalize based on last order
-            days_ago = (datetime.utcnow() - last_order.created_at).days
-            
-            # Get most ordered product
-            favorite_product = None
-            if last_order.items:
-                product_counts = {}
-                for item in last_order.items:
-                    product_id = item.get('product_id')
-                    product_counts[product_id] = product_counts.get(product_id, 0) + item.get('quantity', 0)
-                
-                if product_counts:
-                    favorite_id = max(product_counts, key=product_counts.get)
-                    product_query = select(Product).where(Product.id == favorite_id)
-                    product_result = await session.execute(product_query)
-                    favorite_product = product_result.scalar_one_or_none()
+            days_ago = (datetime.utcnow() - target.last_order_at).days
             
             text = f"""
 ☕ <b>Час поповнити запаси кави!</b>
@@ -210,9 +176,9 @@ class NotificationService:
 
 """
             
-            if favorite_product:
+            if target.favorite_product:
                 text += f"""💚 <b>Ваша улюблена кава:</b>
-{favorite_product.name_ua}
+{target.favorite_product}
 
 Вона чекає на вас в каталозі!
 
@@ -238,18 +204,9 @@ class NotificationService:
 Замовляйте зараз! 🐒☕
 """
             
-            try:
-                await self.bot.send_message(
-                    chat_id=user.id,
-                    text=text,
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-                logger.info(f"Sent replenishment reminder to user {user.id}")
-            except Exception as e:
-                logger.error(f"Failed to send replenishment reminder to user {user.id}: {e}")
+            messages.append(OutgoingMessage(chat_id=user.id, text=text))
         
-        return sent_count
+        return await self._enqueue(session, messages, "replenishment_reminders")
     
     async def send_volume_discount_suggestions(
         self,
@@ -260,33 +217,42 @@ class NotificationService:
         Targets users who have items in cart but haven't reached next discount tier.
         
         Returns:
-            Number of suggestions sent
+            Number of suggestions queued for sending
         """
         from src.services.discount_engine import DiscountEngine
-        from src.services.cart_service import CartService
         
-        # Find users with active carts
-        query = select(User).join(User.cart_items).distinct()
+        # Fresh cart columns, then users near a tier in one indexed query
+        await FeatureService.refresh_cart_features(session)
+        rules = await DiscountEngine.get_volume_rules(session)
+        query = (
+            select(User, UserFeature)
+            .join(UserFeature, UserFeature.user_id == User.id)
+            .where(
+                or_(
+                    UserFeature.cart_packs.in_([2, 3, 5]),
+                    and_(UserFeature.cart_weight_kg >= 1.5, UserFeature.cart_weight_kg < 2.0)
+                )
+            )
+        )
         result = await session.execute(query)
-        users = result.scalars().all()
         
-        sent_count = 0
+        messages = []
         
-        for user in users:
-            # Get cart breakdown
-            cart_items = await CartService.get_cart_items(session, user.id)
-            
-            if not cart_items:
-                continue
-            
-            breakdown = DiscountEngine.calculate_full_discount(cart_items, user)
+        for user, features in result.all():
+            packs = features.cart_packs
+            weight_kg = features.cart_weight_kg
+            cart_value = features.cart_value
+            current_discount = (
+                DiscountEngine.calculate_volume_discount(packs, weight_kg, cart_value, rules)
+                + DiscountEngine.calculate_loyalty_discount(user)
+            )
             
             # Check if close to next tier
             should_send = False
             suggestion = ""
             
             # Check pack-based discounts
-            if breakdown.total_packs_300g == 2:
+            if packs == 2:
                 should_send = True
                 suggestion = """
 🎯 <b>Ще 1 пачка = -10%!</b>
@@ -294,35 +260,35 @@ class NotificationService:
 У вас в кошику 2 пачки по 300г.
 Додайте ще одну - отримаєте знижку 10%!
 
-💰 Економія: ~{} грн
-""".format(format_currency(breakdown.potential_savings_packs))
+💰 Економія: ~{}
+""".format(format_currency(_estimated_savings(cart_value, current_discount, 10)))
             
-            elif breakdown.total_packs_300g in [3, 5]:
-                next_tier = 4 if breakdown.total_packs_300g == 3 else 6
+            elif packs in [3, 5]:
+                next_tier = 4 if packs == 3 else 6
                 next_discount = 15 if next_tier == 4 else 25
-                needed = next_tier - breakdown.total_packs_300g
+                needed = next_tier - packs
                 
                 should_send = True
                 suggestion = f"""
 🎯 <b>Ще {needed} пачки = -{next_discount}%!</b>
 
-У вас в кошику {breakdown.total_packs_300g} пачки.
+У вас в кошику {packs} пачки.
 Додайте ще {needed} - отримаєте знижку {next_discount}%!
 
-💰 Економія: ~{format_currency(breakdown.potential_savings_packs)}
+💰 Економія: ~{format_currency(_estimated_savings(cart_value, current_discount, next_discount))}
 """
             
             # Check kg-based discounts
-            elif 1.5 <= breakdown.total_weight_kg < 2.0:
-                needed_kg = 2.0 - breakdown.total_weight_kg
+            elif 1.5 <= weight_kg < 2.0:
+                needed_kg = 2.0 - weight_kg
                 should_send = True
                 suggestion = f"""
 🎯 <b>Ще {needed_kg:.1f} кг = -25%!</b>
 
-У вас в кошику {breakdown.total_weight_kg:.1f} кг кави.
+У вас в кошику {weight_kg:.1f} кг кави.
 Додайте ще трохи - активуєте максимальну знижку 25%!
 
-💰 Економія: ~{format_currency(breakdown.potential_savings_kg)}
+💰 Економія: ~{format_currency(_estimated_savings(cart_value, current_discount, 25))}
 """
             
             if should_send:
@@ -334,8 +300,8 @@ class NotificationService:
 ━━━━━━━━━━━━━━━━━━━━━━━━━━━
 
 <b>Поточний кошик:</b>
-Товарів на: {format_currency(breakdown.subtotal)}
-Поточна знижка: {breakdown.volume_discount_percent + breakdown.loyalty_discount_percent}%
+Товарів на: {format_currency(cart_value)}
+Поточна знижка: {current_discount}%
 
 <b>Після додавання:</b>
 Знижка збільшиться до максимуму!
@@ -346,18 +312,9 @@ class NotificationService:
 Не упустіть вигоду! 🐒
 """
                 
-                try:
-                    await self.bot.send_message(
-                        chat_id=user.id,
-                        text=text,
-                        parse_mode="HTML"
-                    )
-                    sent_count += 1
-                    logger.info(f"Sent volume discount suggestion to user {user.id}")
-                except Exception as e:
-                    logger.error(f"Failed to send suggestion to user {user.id}: {e}")
-        
-        return sent_count
+                messages.append(OutgoingMessage(chat_id=user.id, text=text))
+        
+        return await self._enqueue(session, messages, "volume_suggestions")
     
     async def send_fresh_roast_announcements(
         self,
@@ -371,7 +328,7 @@ class NotificationService:
             product_ids: Optional list of newly roasted product IDs
             
         Returns:
-            Number of announcements sent
+            Number of announcements queued for sending
         """
         # Get recently roasted products (last 3 days)
         if not product_ids:
@@ -397,34 +354,18 @@ class NotificationService:
         if not products:
             return 0
         
-        # Get all active users who have ordered before
-        user_query = select(User).join(Order).where(
-            Order.status.in_(['paid', 'shipped', 'delivered'])
-        ).distinct()
+        # Customers with their favorite profile (one indexed query)
+        user_query = (
+            select(User, UserFeature.favorite_profile)
+            .join(UserFeature, UserFeature.user_id == User.id)
+            .where(UserFeature.orders_count > 0)
+        )
         user_result = await session.execute(user_query)
-        users = user_result.scalars().all()
         
-        sent_count = 0
+        messages = []
         
-        for user in users:
+        for user, favorite_profile in user_result.all():
             # Personalize based on user's order history
-            orders_query = select(Order).where(
-                and_(
-                    Order.user_id == user.id,
-                    Order.status.in_(['paid', 'shipped', 'delivered'])
-                )
-            )
-            orders_result = await session.execute(orders_query)
-            user_orders = orders_result.scalars().all()
-            
-            # Find user's favorite profile
-            profile_counts = {}
-            for order in user_orders:
-                for item in order.items:
-                    profile = item.get('profile', 'universal')
-                    profile_counts[profile] = profile_counts.get(profile, 0) + 1
-            
-            favorite_profile = max(profile_counts, key=profile_counts.get) if profile_counts else None
             
             # Filter products for this user
             relevant_products = products
@@ -471,21 +412,13 @@ class NotificationService:
 Замовляйте, поки тепла! ☕🔥
 """
             
-            try:
-                await self.bot.send_message(
-                    chat_id=user.id,
-                    text=text,
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-                logger.info(f"Sent fresh roast announcement to user {user.id}")
-            except Exception as e:
-                logger.error(f"Failed to send announcement to user {user.id}: {e}")
+            messages.append(OutgoingMessage(chat_id=user.id, text=text))
         
-        return sent_count
+        return await self._enqueue(session, messages, "fresh_roast")
     
     async def send_loyalty_upgrade_notification(
         self,
+        session: AsyncSession,
         user_id: int,
         new_level: int,
         total_kg: float
@@ -493,6 +426,7 @@ class NotificationService:
         """Send notification when user reaches new loyalty level.
         
         Args:
+            session: Database session
             user_id: User ID
             new_level: New loyalty level achieved
             total_kg: Total kg purchased
@@ -545,15 +479,10 @@ class NotificationService:
         
         text += "\n\nПродовжуйте насолоджуватись найкращою кавою! 🐒☕"
         
-        try:
-            await self.bot.send_message(
-                chat_id=user_id,
-                text=text,
-                parse_mode="HTML"
-            )
-            logger.info(f"Sent loyalty upgrade notification to user {user_id}")
-        except Exception as e:
-            logger.error(f"Failed to send loyalty upgrade: {e}")
+        await self._enqueue(
+            session, [OutgoingMessage(chat_id=user_id, text=text)], "loyalty_upgrade", scope=new_level
+        )
+        logger.info(f"Queued loyalty upgrade notification for user {user_id}")
     
     async def send_abandoned_cart_reminder(
         self,
@@ -567,7 +496,7 @@ class NotificationService:
         - Haven't placed order in last 7 days
         
         Returns:
-            Number of reminders sent
+            Number of reminders queued for sending
         """
         from src.services.cart_service import CartService
         
@@ -580,7 +509,7 @@ class NotificationService:
         result = await session.execute(query)
         users = result.scalars().all()
         
-        sent_count = 0
+        messages = []
         
         for user in users:
             # Check if user has recent orders
@@ -602,7 +531,9 @@ class NotificationService:
                 continue
             
             from src.services.discount_engine import DiscountEngine
-            breakdown = DiscountEngine.calculate_full_discount(cart_items, user)
+            breakdown = DiscountEngine.calculate_full_discount(
+                cart_items, user, active_rules=await DiscountEngine.get_volume_rules(session)
+            )
             
             text = f"""
 🛒 <b>Ви забули про свій кошик!</b>
@@ -633,15 +564,6 @@ class NotificationService:
 Не втрачайте своїх переваг! 🐒☕
 """
             
-            try:
-                await self.bot.send_message(
-                    chat_id=user.id,
-                    text=text,
-                    parse_mode="HTML"
-                )
-                sent_count += 1
-                logger.info(f"Sent abandoned cart reminder to user {user.id}")
-            except Exception as e:
-                logger.error(f"Failed to send abandoned cart reminder: {e}")
+            messages.append(OutgoingMessage(chat_id=user.id, text=text))
         
-        return sent_count
+        return await self._enqueue(session, messages, "abandoned_cart")
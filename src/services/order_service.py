@@ -1,13 +1,15 @@
 """Order service - business logic for order creation and management."""
 from typing import List, Tuple, Optional
-from datetime import datetime
-from sqlalchemy import select
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case, insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.database.models import Order, User, CartItem, Product
-from src.services.cart_service import CartService
-from src.services.discount_engine import DiscountEngine
+from src.database.models import Order, OrderLine, User, CartItem, Product
+from src.services.id_generator import IdGenerator
 from src.services.loyalty_service import LoyaltyService
+from src.services.pricing_service import PricingService, Quote
+from src.services.promo_service import PromoService
+from src.services.user_cache import user_cache
 from config import settings
 
 
@@ -24,10 +26,14 @@ class OrderService:
         recipient_name: str,
         recipient_phone: str,
         grind_preference: str,
-        promo_code_used: Optional[str] = None
+        promo_code_used: Optional[str] = None,
+        quote: Optional[Quote] = None
     ) -> Order:
         """Create order from user's cart.
         
+        Prices come from the checkout quote (``PricingService.quote``) if it
+        is given and matches the order, otherwise the cart is priced here.
+        
         Args:
             session: Database session
             user: User object
@@ -38,65 +44,40 @@ class OrderService:
             recipient_phone: Recipient phone
             grind_preference: Grind type selected
             promo_code_used: Optional promo code
+            quote: Quote shown to the user
             
         Returns:
             Created Order object
         """
-        # Get cart items
-        cart_items = await CartService.get_cart_items(session, user.id)
+        if (quote is None or quote.user_id != user.id or
+                quote.delivery_method != delivery_method or quote.promo_code != promo_code_used):
+            quote = await PricingService.quote(session, user, delivery_method, promo_code_used)
         
-        if not cart_items:
+        if quote is None:
             raise ValueError("Cart is empty")
         
-        # Calculate discounts
-        from src.database.models import PromoCode
-        promo_code_obj = None
-        if promo_code_used:
-            promo_query = select(PromoCode).where(PromoCode.code == promo_code_used.upper())
-            promo_result = await session.execute(promo_query)
-            promo_code_obj = promo_result.scalar_one_or_none()
-        
-        discount_breakdown = DiscountEngine.calculate_full_discount(
-            cart_items, user, promo_code_obj
-        )
+        discount_breakdown = quote.breakdown
         
-        # Calculate delivery cost
-        delivery_cost = OrderService._calculate_delivery_cost(
-            delivery_method, 
-            discount_breakdown.final_total
-        )
-        
-        # Prepare order items as JSON
-        order_items = []
-        for cart_item, product in cart_items:
-            price = product.price_300g if cart_item.format == "300g" else product.price_1kg
-            order_items.append({
-                "product_id": product.id,
-                "name": product.name_ua,
-                "format": cart_item.format,
-                "quantity": cart_item.quantity,
-                "price": price,
-                "total": price * cart_item.quantity
-            })
-        
-        # Create order
+        # Create order (lines are the same items as rows, for analytics)
         order = Order(
+            order_number=await IdGenerator.next_order_number(session),
             user_id=user.id,
             status="pending",
-            items=order_items,
+            items=quote.order_items,
             subtotal=discount_breakdown.subtotal,
             discount_volume=discount_breakdown.volume_discount_amount,
             discount_loyalty=discount_breakdown.loyalty_discount_amount,
             discount_promo=discount_breakdown.promo_discount_amount,
             promo_code_used=promo_code_used,
-            delivery_cost=delivery_cost,
-            total=discount_breakdown.final_total + delivery_cost,
+            delivery_cost=quote.delivery_cost,
+            total=quote.total,
             delivery_method=delivery_method,
             delivery_city=delivery_city,
             delivery_address=delivery_address,
             recipient_name=recipient_name,
             recipient_phone=recipient_phone,
-            grind_preference=grind_preference
+            grind_preference=grind_preference,
+            lines=[OrderLine(**OrderLine.values_from_item(item)) for item in quote.order_items]
         )
         
         # Update user's persistent delivery details for next time
@@ -107,40 +88,19 @@ class OrderService:
         
         session.add(order)
         
-        # Update promo code usage if used
+        # Redeem promo code (atomic; the usage limit is checked by the database)
+        promo_code_obj = await PromoService.get_promo(session, quote.promo_code) if quote.promo_code_id else None
         if promo_code_obj:
-            promo_code_obj.used_count += 1
+            await session.flush()
+            if not await PromoService.redeem(session, promo_code_obj, user.id, order.id):
+                await session.rollback()
+                raise ValueError("промокод більше не дійсний, спробуйте ще раз без нього")
         
         await session.commit()
         await session.refresh(order)
         
         return order
     
-    @staticmethod
-    def _calculate_delivery_cost(delivery_method: str, order_total: int) -> int:
-        """Calculate delivery cost based on method and order total.
-        
-        Args:
-            delivery_method: Delivery method
-            order_total: Order total amount
-            
-        Returns:
-            Delivery cost in UAH
-        """
-        # Free delivery above threshold
-        if order_total >= settings.free_delivery_threshold:
-            return 0
-        
-        # Delivery costs by method
-        if delivery_method == "nova_poshta":
-            return settings.delivery_cost_nova_poshta
-        elif delivery_method == "ukrposhta":
-            return settings.delivery_cost_ukrposhta
-        elif delivery_method == "courier":
-            return 100  # Fixed courier cost
-        
-        return settings.delivery_cost_nova_poshta  # Default
-    
     @staticmethod
     async def mark_order_paid(
         session: AsyncSession,
@@ -165,19 +125,22 @@ class OrderService:
         order.status = "paid"
         order.paid_at = datetime.utcnow()
         
-        # Update user statistics and loyalty level
-        user_query = select(User).where(User.id == order.user_id)
-        user_result = await session.execute(user_query)
+        # Update user statistics and loyalty level. Counters are incremented in
+        # Python, so read the row fresh (and locked) - the session may hold a
+        # cached snapshot of the buyer (user_cache) that another worker has outdated.
+        user_query = select(User).where(User.id == order.user_id).with_for_update()
+        user_result = await session.execute(user_query, execution_options={"populate_existing": True})
         user = user_result.scalar_one_or_none()
         
         if user:
-            # Calculate total kg purchased
-            total_kg = 0
-            for item in order.items:
-                if item['format'] == '300g':
-                    total_kg += 0.3 * item['quantity']
-                else:
-                    total_kg += 1.0 * item['quantity']
+            # Calculate total kg purchased. Loyalty keeps its old rule: anything
+            # but a 300g pack counts 1 kg per item, including equipment ('unit'
+            # lines, whose weight_kg is 0 for the sales stats).
+            loyalty_kg = case((OrderLine.format == '300g', OrderLine.weight_kg), else_=OrderLine.quantity)
+            kg_result = await session.execute(
+                select(func.coalesce(func.sum(loyalty_kg), 0.0)).where(OrderLine.order_id == order.id)
+            )
+            total_kg = kg_result.scalar()
             
             # Update loyalty
             level_upgraded, new_level = await LoyaltyService.update_user_level(
@@ -190,18 +153,22 @@ class OrderService:
             
             # Process referral bonus if first order
             if user.total_orders == 1 and user.referred_by_id:
-                referrer_query = select(User).where(User.id == user.referred_by_id)
-                referrer_result = await session.execute(referrer_query)
+                referrer_query = select(User).where(User.id == user.referred_by_id).with_for_update()
+                referrer_result = await session.execute(referrer_query, execution_options={"populate_existing": True})
                 referrer = referrer_result.scalar_one_or_none()
                 
                 if referrer:
                     # Add bonus to both users
                     user.referral_balance += settings.referral_bonus_amount
                     referrer.referral_balance += settings.referral_bonus_amount
+                    user_cache.invalidate(referrer.id)
         
         await session.commit()
         await session.refresh(order)
         
+        # Paid order changes stats/loyalty of the buyer (may be updated from admin's session)
+        user_cache.invalidate(order.user_id)
+        
         return order
     
     @staticmethod
@@ -288,3 +255,53 @@ class OrderService:
         await session.refresh(order)
         
         return order
+    
+    @staticmethod
+    async def get_order_metrics(
+        session: AsyncSession,
+        days: int = 90
+    ) -> List[Tuple[int, float, int]]:
+        """(packs_300g, weight_kg, subtotal) of paid orders for the last days.
+        
+        Used for discount what-if simulation (one GROUP BY over order_lines).
+        """
+        since = datetime.utcnow() - timedelta(days=days)
+        packs = case((OrderLine.format == "300g", OrderLine.quantity), else_=0)
+        result = await session.execute(
+            select(func.sum(packs), func.sum(OrderLine.weight_kg), Order.subtotal)
+            .join(Order, OrderLine.order_id == Order.id)
+            .where(
+                Order.status.in_(['paid', 'shipped', 'delivered']),
+                Order.created_at >= since
+            )
+            .group_by(Order.id, Order.subtotal)
+        )
+        return [(int(p or 0), float(w or 0), subtotal or 0) for p, w, subtotal in result.all()]
+    
+    @staticmethod
+    def backfill_order_lines(connection) -> int:
+        """Create order_lines for orders saved before the table existed.
+        
+        Called from init_db via ``run_sync``; orders that already have lines
+        are skipped, so after the first run this is a single empty query.
+        
+        Returns:
+            Number of lines written
+        """
+        has_lines = select(OrderLine.id).where(OrderLine.order_id == Order.id).exists()
+        orders = connection.execute(
+            select(Order.id, Order.items, Order.created_at).where(~has_lines)
+        ).all()
+        
+        values = []
+        for order_id, items, created_at in orders:
+            for item in items or []:
+                values.append({
+                    'order_id': order_id,
+                    'created_at': created_at,
+                    **OrderLine.values_from_item(item)
+                })
+        
+        for start in range(0, len(values), 1000):
+            connection.execute(insert(OrderLine), values[start:start + 1000])
+        return len(values)
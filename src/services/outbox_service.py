@@ -0,0 +1,276 @@
+"""Durable notification outbox.
+
+Jobs and handlers enqueue rendered messages (text, parse mode and keyboard)
+into ``outbox`` (in their own transaction) instead of sending them directly. Every row has an idempotency
+key - '<campaign>:<scope>:<chat_id>', scope being the date for scheduled
+campaigns - so re-running a job enqueues nothing new. ``OutboxWorker`` drains
+due rows through the Broadcaster: rows are claimed with a conditional UPDATE
+that pushes ``next_attempt_at`` forward by a lease, so a crashed worker's rows
+become due again, and failed sends are retried with exponential backoff.
+"""
+import asyncio
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Union
+
+from aiogram import Bot
+from aiogram.types import ForceReply, InlineKeyboardMarkup, ReplyKeyboardMarkup, ReplyKeyboardRemove
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import OutboxMessage
+from src.database.session import async_session
+from src.services.broadcast_service import Broadcaster, OutgoingMessage
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Field that identifies each Telegram markup type in its JSON form
+_MARKUP_TYPES = {
+    'inline_keyboard': InlineKeyboardMarkup,
+    'keyboard': ReplyKeyboardMarkup,
+    'remove_keyboard': ReplyKeyboardRemove,
+    'force_reply': ForceReply,
+}
+
+
+def _dump_markup(markup: Any) -> Optional[dict]:
+    """Keyboard as JSON for the outbox (aiogram markup object or dict).
+    
+    Raises:
+        ValueError: If it isn't a Telegram reply markup
+    """
+    if markup is None:
+        return None
+    data = markup if isinstance(markup, dict) else markup.model_dump(mode='json', exclude_none=True)
+    if not any(field in data for field in _MARKUP_TYPES):
+        raise ValueError(f"Unknown reply markup: {sorted(data)}")
+    return data
+
+
+def _load_markup(data: Optional[dict]) -> Any:
+    """Rebuild the aiogram markup object stored by ``_dump_markup``."""
+    if not data:
+        return None
+    for field, markup_type in _MARKUP_TYPES.items():
+        if field in data:
+            return markup_type.model_validate(data)
+    return None
+
+
+class OutboxService:
+    """Service for enqueueing and draining outbox messages."""
+
+    BATCH_SIZE = 500
+    LEASE = timedelta(minutes=10)  # claimed rows are retried after this if the worker dies
+    BACKOFF_BASE = 30  # seconds; doubled on every failed attempt
+
+    @staticmethod
+    def make_key(campaign: str, chat_id: int, scope: Union[str, int, date, None] = None) -> str:
+        """Idempotency key (scope defaults to today's date)."""
+        if scope is None:
+            scope = datetime.utcnow().date()
+        if isinstance(scope, date):
+            scope = scope.isoformat()
+        return f"{campaign}:{scope}:{chat_id}"
+
+    @staticmethod
+    async def enqueue(
+        session: AsyncSession,
+        messages: Iterable[OutgoingMessage],
+        campaign: str,
+        scope: Union[str, int, date, None] = None
+    ) -> int:
+        """Add messages to the outbox, skipping already enqueued keys.
+
+        The caller commits (together with whatever caused the notification).
+
+        Args:
+            session: Database session
+            messages: Rendered messages
+            campaign: Campaign name (part of the idempotency key)
+            scope: Key scope, e.g. order ID; today's date if None
+
+        Returns:
+            Number of newly enqueued messages
+        """
+        now = datetime.utcnow()
+        rows = [
+            {
+                'idempotency_key': OutboxService.make_key(campaign, message.chat_id, scope),
+                'campaign': campaign,
+                'chat_id': message.chat_id,
+                'text': message.text,
+                'parse_mode': message.parse_mode,
+                'reply_markup': _dump_markup(message.reply_markup),
+                'status': 'pending',
+                'attempts': 0,
+                'next_attempt_at': now,
+            }
+            for message in messages
+        ]
+        if not rows:
+            return 0
+
+        connection = await session.connection()
+        insert = pg_insert if connection.dialect.name == "postgresql" else sqlite_insert
+        enqueued = 0
+        for start in range(0, len(rows), OutboxService.BATCH_SIZE):
+            stmt = (
+                insert(OutboxMessage)
+                .values(rows[start:start + OutboxService.BATCH_SIZE])
+                .on_conflict_do_nothing(index_elements=['idempotency_key'])
+                .returning(OutboxMessage.id)
+            )
+            result = await session.execute(stmt)
+            enqueued += len(result.all())
+
+        if enqueued < len(rows):
+            logger.info(f"Outbox {campaign}: {len(rows) - enqueued} messages already enqueued, skipped")
+        return enqueued
+
+    @staticmethod
+    async def claim(session: AsyncSession, limit: int) -> List[OutboxMessage]:
+        """Claim due pending rows for sending (commits)."""
+        now = datetime.utcnow()
+        due = select(OutboxMessage.id).where(
+            OutboxMessage.status == 'pending',
+            OutboxMessage.next_attempt_at <= now
+        ).order_by(OutboxMessage.id).limit(limit)
+        ids = [row[0] for row in (await session.execute(due)).all()]
+        if not ids:
+            return []
+
+        # Conditional UPDATE: rows claimed by another worker meanwhile are skipped
+        result = await session.execute(
+            update(OutboxMessage)
+            .where(
+                OutboxMessage.id.in_(ids),
+                OutboxMessage.status == 'pending',
+                OutboxMessage.next_attempt_at <= now
+            )
+            .values(
+                next_attempt_at=now + OutboxService.LEASE,
+                attempts=OutboxMessage.attempts + 1
+            )
+            .returning(OutboxMessage)
+            .execution_options(synchronize_session=False)
+        )
+        claimed = list(result.scalars().all())
+        await session.commit()
+        return claimed
+
+    @staticmethod
+    async def record(session: AsyncSession, rows: List[OutboxMessage], results: Dict[int, str]) -> None:
+        """Store send outcomes of claimed rows (commits)."""
+        now = datetime.utcnow()
+        by_status: Dict[str, List[int]] = {}
+        retry_at: Dict[datetime, List[int]] = {}
+
+        for row in rows:
+            outcome = results.get(row.id, 'failed')
+            if outcome == 'failed' and row.attempts < settings.outbox_max_attempts:
+                delay = OutboxService.BACKOFF_BASE * 2 ** (row.attempts - 1)
+                retry_at.setdefault(now + timedelta(seconds=delay), []).append(row.id)
+            else:
+                by_status.setdefault(outcome, []).append(row.id)
+
+        for status, ids in by_status.items():
+            values = {'status': status}
+            if status == 'sent':
+                values['sent_at'] = now
+            await session.execute(
+                update(OutboxMessage).where(OutboxMessage.id.in_(ids)).values(**values)
+                .execution_options(synchronize_session=False)
+            )
+        for next_attempt_at, ids in retry_at.items():
+            await session.execute(
+                update(OutboxMessage).where(OutboxMessage.id.in_(ids)).values(next_attempt_at=next_attempt_at)
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+
+    @staticmethod
+    async def drain(broadcaster: Broadcaster) -> int:
+        """Send every due message.
+
+        Returns:
+            Number of messages sent
+        """
+        sent = 0
+        while True:
+            async with async_session() as session:
+                rows = await OutboxService.claim(session, OutboxService.BATCH_SIZE)
+            if not rows:
+                return sent
+
+            report = await broadcaster.send(
+                [
+                    OutgoingMessage(
+                        chat_id=row.chat_id,
+                        text=row.text,
+                        parse_mode=row.parse_mode,
+                        reply_markup=_load_markup(row.reply_markup),
+                        ref=row.id
+                    )
+                    for row in rows
+                ],
+                name="outbox"
+            )
+            async with async_session() as session:
+                await OutboxService.record(session, rows, report.results)
+            sent += report.sent
+
+    @staticmethod
+    async def purge(session: AsyncSession, days: Optional[int] = None) -> int:
+        """Delete finished rows older than the retention period (commits).
+
+        Keys of purged rows can be enqueued again, so retention must be longer
+        than any campaign scope.
+        """
+        cutoff = datetime.utcnow() - timedelta(days=days or settings.outbox_retention_days)
+        result = await session.execute(
+            delete(OutboxMessage).where(
+                OutboxMessage.status != 'pending',
+                OutboxMessage.created_at < cutoff
+            )
+        )
+        await session.commit()
+        return result.rowcount or 0
+
+
+class OutboxWorker:
+    """Background task that drains the outbox periodically."""
+
+    def __init__(self, bot: Bot, interval: Optional[float] = None):
+        self.broadcaster = Broadcaster(bot)
+        self.interval = interval or settings.outbox_poll_interval
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Outbox worker started")
+
+    async def stop(self) -> None:
+        task, self._task = self._task, None
+        if task is None:
+            return
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+        logger.info("Outbox worker stopped")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                sent = await OutboxService.drain(self.broadcaster)
+                if sent:
+                    logger.info(f"Outbox: sent {sent} messages")
+            except Exception as e:
+                logger.error(f"Outbox drain failed: {e}")
+            await asyncio.sleep(self.interval)
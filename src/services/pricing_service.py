@@ -0,0 +1,151 @@
+"""Pricing service - one pass over the cart that produces a checkout quote.
+
+A quote is an immutable snapshot of the priced cart: order lines, discount
+breakdown, delivery cost and total, identified by a hash of that content. The
+checkout preview hands the quote itself to order creation, so both use
+exactly the same numbers (and the same cart read) instead of pricing the cart
+twice.
+"""
+import hashlib
+import json
+from dataclasses import asdict, dataclass
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import CartItem, Product, User
+from src.services.cart_service import CartService
+from src.services.discount_engine import DiscountBreakdown, DiscountEngine
+from src.services.promo_service import PromoService
+from config import settings
+
+
+@dataclass(frozen=True)
+class QuoteLine:
+    """Priced cart line."""
+    product_id: int
+    name: str
+    format: str
+    quantity: int
+    price: int
+    total: int
+
+
+@dataclass(frozen=True)
+class Quote:
+    """Priced cart for checkout (read-only)."""
+    token: str
+    user_id: int
+    lines: Tuple[QuoteLine, ...]
+    breakdown: DiscountBreakdown
+    promo_code: Optional[str]  # Code as entered (stored on the order)
+    promo_code_id: Optional[int]  # Set only if the promo discount applies
+    delivery_method: str
+    delivery_cost: int
+    total: int
+
+    @property
+    def is_free_delivery(self) -> bool:
+        return self.delivery_cost == 0 and self.breakdown.final_total >= settings.free_delivery_threshold
+
+    @property
+    def order_items(self) -> List[Dict]:
+        """Lines in the Order.items JSON format."""
+        return [asdict(line) for line in self.lines]
+
+
+class PricingService:
+    """Service for pricing the cart at checkout."""
+
+    @staticmethod
+    def calculate_delivery_cost(delivery_method: str, order_total: int) -> int:
+        """Calculate delivery cost based on method and order total (after discounts).
+
+        Returns:
+            Delivery cost in UAH
+        """
+        # Free delivery above threshold
+        if order_total >= settings.free_delivery_threshold:
+            return 0
+
+        # Delivery costs by method
+        if delivery_method == "nova_poshta":
+            return settings.delivery_cost_nova_poshta
+        elif delivery_method == "ukrposhta":
+            return settings.delivery_cost_ukrposhta
+        elif delivery_method == "courier":
+            return 100  # Fixed courier cost
+
+        return settings.delivery_cost_nova_poshta  # Default
+
+    @staticmethod
+    def _line(cart_item: CartItem, product: Product) -> QuoteLine:
+        # Same prices as DiscountEngine.calculate_cart_metrics
+        if cart_item.format in ("300g", "unit"):
+            price = product.price_300g
+        elif cart_item.format == "1kg":
+            price = product.price_1kg
+        else:
+            price = 0
+        return QuoteLine(
+            product_id=product.id,
+            name=product.name_ua,
+            format=cart_item.format,
+            quantity=cart_item.quantity,
+            price=price,
+            total=price * cart_item.quantity,
+        )
+
+    @staticmethod
+    def _token(user_id: int, lines: Tuple[QuoteLine, ...], breakdown: DiscountBreakdown,
+               promo_code: Optional[str], delivery_method: str, delivery_cost: int) -> str:
+        payload = json.dumps({
+            "user_id": user_id,
+            "lines": [asdict(line) for line in lines],
+            "breakdown": asdict(breakdown),
+            "promo_code": promo_code,
+            "delivery_method": delivery_method,
+            "delivery_cost": delivery_cost,
+        }, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    @staticmethod
+    async def quote(
+        session: AsyncSession,
+        user: User,
+        delivery_method: str,
+        promo_code: Optional[str] = None
+    ) -> Optional[Quote]:
+        """Price the user's cart once: lines, discounts, delivery.
+
+        Args:
+            session: Database session
+            user: User object
+            delivery_method: Delivery method selected
+            promo_code: Optional promo code
+
+        Returns:
+            Quote, or None if the cart is empty
+        """
+        cart_items = await CartService.get_cart_items(session, user.id)
+        if not cart_items:
+            return None
+
+        promo = await PromoService.get_promo(session, promo_code)
+        active_rules = await DiscountEngine.get_volume_rules(session)
+        breakdown = DiscountEngine.calculate_full_discount(cart_items, user, promo, active_rules=active_rules)
+        delivery_cost = PricingService.calculate_delivery_cost(delivery_method, breakdown.final_total)
+        lines = tuple(PricingService._line(cart_item, product) for cart_item, product in cart_items)
+
+        quote = Quote(
+            token=PricingService._token(user.id, lines, breakdown, promo_code, delivery_method, delivery_cost),
+            user_id=user.id,
+            lines=lines,
+            breakdown=breakdown,
+            promo_code=promo_code,
+            promo_code_id=promo.id if promo and breakdown.promo_discount_percent > 0 else None,
+            delivery_method=delivery_method,
+            delivery_cost=delivery_cost,
+            total=breakdown.final_total + delivery_cost,
+        )
+        return quote
@@ -0,0 +1,161 @@
+"""Promo code service - cached lookups and race-free redemption.
+
+Cart renders and checkout previews look codes up through a small TTL cache
+(unknown codes are cached too), so a promo push to thousands of users doesn't
+hit ``promo_codes`` on every screen. The cached object only answers "what does
+the code give and is it in its validity window"; the usage limit is enforced
+by ``redeem()`` with a single conditional UPDATE, so concurrent checkouts can't
+oversell a limited code.
+"""
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import PromoCode, PromoRedemption
+
+logger = logging.getLogger(__name__)
+
+# code -> (detached PromoCode or None for unknown codes, loaded_at)
+_promo_cache: "OrderedDict[str, Tuple[Optional[PromoCode], float]]" = OrderedDict()
+
+
+class PromoService:
+    """Service for promo code lookup and redemption."""
+
+    CACHE_TTL = 30.0  # seconds; admin edits and redemptions invalidate immediately
+    CACHE_SIZE = 1024
+
+    @staticmethod
+    def invalidate(code: Optional[str] = None) -> None:
+        """Drop one code (or all codes) from the lookup cache."""
+        if code is None:
+            _promo_cache.clear()
+        else:
+            _promo_cache.pop(code.upper(), None)
+
+    @staticmethod
+    async def get_promo(session: AsyncSession, code: Optional[str]) -> Optional[PromoCode]:
+        """Get promo code by code (cached, detached, read-only).
+
+        Args:
+            session: Database session
+            code: Promo code as entered/stored (case-insensitive)
+
+        Returns:
+            PromoCode or None if the code doesn't exist. Validity still has to
+            be checked with ``is_valid()``.
+        """
+        if not code:
+            return None
+        code = code.upper()
+
+        item = _promo_cache.get(code)
+        if item and time.monotonic() - item[1] < PromoService.CACHE_TTL:
+            _promo_cache.move_to_end(code)
+            return item[0]
+
+        result = await session.execute(select(PromoCode).where(PromoCode.code == code))
+        promo = result.scalar_one_or_none()
+        if promo is not None:
+            # Shared between updates: keep it out of the caller's session
+            session.expunge(promo)
+
+        _promo_cache[code] = (promo, time.monotonic())
+        _promo_cache.move_to_end(code)
+        while len(_promo_cache) > PromoService.CACHE_SIZE:
+            _promo_cache.popitem(last=False)
+        return promo
+
+    @staticmethod
+    async def redeem(
+        session: AsyncSession,
+        promo: PromoCode,
+        user_id: int,
+        order_id: Optional[int] = None
+    ) -> bool:
+        """Atomically use one redemption of a promo code.
+
+        ``used_count`` is incremented only if the code is still active, in its
+        validity window and under its usage limit - checked by the database in
+        the same statement. The caller commits (together with the order).
+
+        Args:
+            session: Database session
+            promo: Promo code to redeem
+            user_id: Telegram user ID
+            order_id: Order the code was used for
+
+        Returns:
+            True if redeemed, False if the code is no longer available
+        """
+        now = datetime.utcnow()
+        result = await session.execute(
+            update(PromoCode)
+            .where(
+                PromoCode.id == promo.id,
+                PromoCode.is_active == True,
+                or_(PromoCode.valid_from.is_(None), PromoCode.valid_from <= now),
+                or_(PromoCode.valid_until.is_(None), PromoCode.valid_until >= now),
+                or_(
+                    PromoCode.usage_limit.is_(None),
+                    PromoCode.usage_limit == 0,
+                    PromoCode.used_count < PromoCode.usage_limit
+                )
+            )
+            .values(used_count=PromoCode.used_count + 1)
+            .returning(PromoCode.used_count)
+            .execution_options(synchronize_session=False)
+        )
+        used_count = result.scalar_one_or_none()
+        # Cached copy has a stale used_count either way
+        PromoService.invalidate(promo.code)
+
+        if used_count is None:
+            logger.info(f"Promo code {promo.code} not redeemed for user {user_id}: no longer available")
+            return False
+
+        session.add(PromoRedemption(promo_code_id=promo.id, user_id=user_id, order_id=order_id))
+        return True
+
+    @staticmethod
+    async def release(session: AsyncSession, order_id: int) -> int:
+        """Give back redemptions of an order (pending order deleted/cancelled).
+
+        The caller commits.
+
+        Returns:
+            Number of released redemptions
+        """
+        result = await session.execute(
+            delete(PromoRedemption)
+            .where(PromoRedemption.order_id == order_id)
+            .returning(PromoRedemption.promo_code_id)
+        )
+        promo_ids = [row[0] for row in result.all()]
+        for promo_id in promo_ids:
+            await session.execute(
+                update(PromoCode)
+                .where(PromoCode.id == promo_id, PromoCode.used_count > 0)
+                .values(used_count=PromoCode.used_count - 1)
+                .execution_options(synchronize_session=False)
+            )
+        if promo_ids:
+            PromoService.invalidate()
+        return len(promo_ids)
+
+    @staticmethod
+    async def get_unique_users(session: AsyncSession, promo_ids: List[int]) -> Dict[int, int]:
+        """Number of distinct users per promo code (one grouped query)."""
+        if not promo_ids:
+            return {}
+        result = await session.execute(
+            select(PromoRedemption.promo_code_id, func.count(func.distinct(PromoRedemption.user_id)))
+            .where(PromoRedemption.promo_code_id.in_(promo_ids))
+            .group_by(PromoRedemption.promo_code_id)
+        )
+        return {promo_id: users for promo_id, users in result.all()}
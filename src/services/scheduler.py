@@ -1,12 +1,23 @@
-"""Scheduler for automated tasks and notifications."""
+"""Scheduler for automated tasks and notifications.
+
+Every worker runs the scheduler; each run takes the job's database lease
+first (see job_lease), so a job runs once per slot across workers and is
+recorded in the run history.
+"""
+import asyncio
 import logging
-from datetime import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Awaitable, Callable, Optional, Set
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 from aiogram import Bot
 
 from src.database.session import async_session
 from src.services.notification_service import NotificationService
+from src.services.cart_service import CartService
+from src.services.job_lease import JobLeaseService
+from src.services.outbox_service import OutboxService
+from config import settings
 
 logger = logging.getLogger(__name__)
 
@@ -14,6 +25,8 @@ logger = logging.getLogger(__name__)
 class TaskScheduler:
     """Scheduler for automated background tasks."""
     
+    SLOT_MARGIN = timedelta(minutes=1)  # lease of a finished run ends this long before the next slot
+    
     def __init__(self, bot: Bot):
         """Initialize scheduler with bot instance.
         
@@ -23,6 +36,7 @@ class TaskScheduler:
         self.bot = bot
         self.scheduler = AsyncIOScheduler()
         self.notification_service = NotificationService(bot)
+        self._running: Set[asyncio.Task] = set()
     
     def start(self):
         """Start the scheduler and register all jobs."""
@@ -30,7 +44,8 @@ class TaskScheduler:
         
         # Daily replenishment reminders - 10:00 AM
         self.scheduler.add_job(
-            self._send_replenishment_reminders,
+            self._run,
+            args=["replenishment_reminders", self._send_replenishment_reminders],
             trigger=CronTrigger(hour=10, minute=0),
             id="replenishment_reminders",
             name="Send coffee replenishment reminders",
@@ -39,7 +54,8 @@ class TaskScheduler:
         
         # Volume discount suggestions - 3:00 PM
         self.scheduler.add_job(
-            self._send_volume_suggestions,
+            self._run,
+            args=["volume_suggestions", self._send_volume_suggestions],
             trigger=CronTrigger(hour=15, minute=0),
             id="volume_suggestions",
             name="Send volume discount suggestions",
@@ -48,7 +64,8 @@ class TaskScheduler:
         
         # Abandoned cart reminders - 6:00 PM
         self.scheduler.add_job(
-            self._send_abandoned_cart_reminders,
+            self._run,
+            args=["abandoned_cart_reminders", self._send_abandoned_cart_reminders],
             trigger=CronTrigger(hour=18, minute=0),
             id="abandoned_cart_reminders",
             name="Send abandoned cart reminders",
@@ -57,67 +74,163 @@ class TaskScheduler:
         
         # Fresh roast announcements - Monday & Thursday at 11:00 AM
         self.scheduler.add_job(
-            self._send_fresh_roast_announcements,
+            self._run,
+            args=["fresh_roast_announcements", self._send_fresh_roast_announcements],
             trigger=CronTrigger(day_of_week='mon,thu', hour=11, minute=0),
             id="fresh_roast_announcements",
             name="Send fresh roast announcements",
             replace_existing=True
         )
         
+        # Cart housekeeping (inactive products, idle carts) - 4:00 AM
+        self.scheduler.add_job(
+            self._run,
+            args=["cart_cleanup", self._cleanup_carts],
+            trigger=CronTrigger(hour=4, minute=0),
+            id="cart_cleanup",
+            name="Purge inactive products and idle carts",
+            replace_existing=True
+        )
+        
+        # Outbox housekeeping (finished messages past retention) - 4:15 AM
+        self.scheduler.add_job(
+            self._run,
+            args=["outbox_cleanup", self._cleanup_outbox],
+            trigger=CronTrigger(hour=4, minute=15),
+            id="outbox_cleanup",
+            name="Purge sent notification outbox rows",
+            replace_existing=True
+        )
+        
         self.scheduler.start()
         logger.info("Task scheduler started successfully")
     
-    def stop(self):
-        """Stop the scheduler."""
+    async def stop(self, timeout: float = 30.0):
+        """Stop the scheduler, letting running jobs finish (cancelled after timeout)."""
         logger.info("Stopping task scheduler...")
-        self.scheduler.shutdown()
+        if self.scheduler.running:
+            self.scheduler.shutdown(wait=False)
+        
+        running = set(self._running)
+        if running:
+            logger.info(f"Waiting for {len(running)} running jobs...")
+            _, pending = await asyncio.wait(running, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.wait(pending)
         logger.info("Task scheduler stopped")
     
-    async def _send_replenishment_reminders(self):
-        """Job to send replenishment reminders."""
+    def _next_slot(self, job_id: str) -> Optional[datetime]:
+        """Time (naive UTC) the lease of a finished run is kept until, or None."""
+        job = self.scheduler.get_job(job_id)
+        next_run_time = getattr(job, 'next_run_time', None)
+        if next_run_time is None:
+            return None
+        return next_run_time.astimezone(timezone.utc).replace(tzinfo=None) - self.SLOT_MARGIN
+    
+    async def _run(self, job_id: str, func: Callable[..., Awaitable[Any]], *args) -> Any:
+        """Run a job under its database lease and record the run.
+        
+        Skipped if another worker (or an earlier run) holds the lease. A
+        successful run keeps the lease until just before the job's next slot,
+        so the same slot never runs twice; failed runs release it at once.
+        
+        Returns:
+            Job result, or None if skipped/failed
+        """
+        owner = JobLeaseService.new_owner()
+        async with async_session() as session:
+            if not await JobLeaseService.acquire(session, job_id, owner, settings.scheduler_lease_seconds):
+                logger.info(f"Job {job_id} is running elsewhere or already ran for this slot, skipped")
+                return None
+            run = await JobLeaseService.start_run(session, job_id, owner)
+        
+        task = asyncio.current_task()
+        self._running.add(task)
+        status, result = 'failed', None
         try:
-            async with async_session() as session:
-                count = await self.notification_service.send_replenishment_reminders(session)
-                logger.info(f"Sent {count} replenishment reminders")
+            result = await func(*args)
+            status = 'success'
+            return result
+        except asyncio.CancelledError:
+            status = 'cancelled'
+            raise
         except Exception as e:
-            logger.error(f"Error sending replenishment reminders: {e}")
+            logger.error(f"Job {job_id} failed: {e}")
+            result = repr(e)
+            return None
+        finally:
+            self._running.discard(task)
+            try:
+                async with async_session() as session:
+                    await JobLeaseService.finish_run(
+                        session, run.id, status, str(result) if result is not None else None
+                    )
+                    until = self._next_slot(job_id) if status == 'success' else None
+                    await JobLeaseService.release(session, job_id, owner, until)
+            except Exception as e:
+                logger.error(f"Could not record run of job {job_id}: {e}")
+    
+    async def _send_replenishment_reminders(self):
+        """Job to send replenishment reminders."""
+        async with async_session() as session:
+            count = await self.notification_service.send_replenishment_reminders(session)
+            summary = f"Queued {count} replenishment reminders"
+            logger.info(summary)
+            return summary
     
     async def _send_volume_suggestions(self):
         """Job to send volume discount suggestions."""
-        try:
-            async with async_session() as session:
-                count = await self.notification_service.send_volume_discount_suggestions(session)
-                logger.info(f"Sent {count} volume discount suggestions")
-        except Exception as e:
-            logger.error(f"Error sending volume suggestions: {e}")
+        async with async_session() as session:
+            count = await self.notification_service.send_volume_discount_suggestions(session)
+            summary = f"Queued {count} volume discount suggestions"
+            logger.info(summary)
+            return summary
     
     async def _send_abandoned_cart_reminders(self):
         """Job to send abandoned cart reminders."""
-        try:
-            async with async_session() as session:
-                count = await self.notification_service.send_abandoned_cart_reminder(session)
-                logger.info(f"Sent {count} abandoned cart reminders")
-        except Exception as e:
-            logger.error(f"Error sending abandoned cart reminders: {e}")
+        async with async_session() as session:
+            count = await self.notification_service.send_abandoned_cart_reminder(session)
+            summary = f"Queued {count} abandoned cart reminders"
+            logger.info(summary)
+            return summary
     
     async def _send_fresh_roast_announcements(self):
         """Job to send fresh roast announcements."""
-        try:
-            async with async_session() as session:
-                count = await self.notification_service.send_fresh_roast_announcements(session)
-                logger.info(f"Sent {count} fresh roast announcements")
-        except Exception as e:
-            logger.error(f"Error sending fresh roast announcements: {e}")
+        async with async_session() as session:
+            count = await self.notification_service.send_fresh_roast_announcements(session)
+            summary = f"Queued {count} fresh roast announcements"
+            logger.info(summary)
+            return summary
+    
+    async def _cleanup_carts(self):
+        """Job to keep cart table small."""
+        async with async_session() as session:
+            inactive = await CartService.purge_inactive_products(session)
+            idle = await CartService.purge_idle_carts(session, settings.cart_idle_days)
+            summary = f"Cart cleanup: {inactive} inactive product lines, {idle} idle cart lines removed"
+            logger.info(summary)
+            return summary
     
-    # Manual trigger methods for admin use
+    async def _cleanup_outbox(self):
+        """Job to keep outbox table small."""
+        async with async_session() as session:
+            purged = await OutboxService.purge(session)
+            summary = f"Outbox cleanup: {purged} rows removed"
+            logger.info(summary)
+            return summary
+    
+    # Manual trigger methods for admin use (same lease as the scheduled runs:
+    # skipped if the current slot has already run)
     
     async def trigger_replenishment_reminders(self):
         """Manually trigger replenishment reminders."""
-        await self._send_replenishment_reminders()
+        return await self._run("replenishment_reminders", self._send_replenishment_reminders)
     
     async def trigger_volume_suggestions(self):
         """Manually trigger volume suggestions."""
-        await self._send_volume_suggestions()
+        return await self._run("volume_suggestions", self._send_volume_suggestions)
     
     async def trigger_fresh_roast_announcements(self, product_ids=None):
         """Manually trigger fresh roast announcements.
@@ -125,14 +238,13 @@ class TaskScheduler:
         Args:
             product_ids: Optional list of product IDs to announce
         """
-        try:
-            async with async_session() as session:
-                count = await self.notification_service.send_fresh_roast_announcements(
-                    session, 
-                    product_ids
-                )
-                logger.info(f"Manually sent {count} fresh roast announcements")
-                return count
-        except Exception as e:
-            logger.error(f"Error manually sending announcements: {e}")
-            return 0
+        return await self._run("fresh_roast_announcements", self._announce_fresh_roast, product_ids)
+    
+    async def _announce_fresh_roast(self, product_ids=None) -> int:
+        async with async_session() as session:
+            count = await self.notification_service.send_fresh_roast_announcements(
+                session, 
+                product_ids
+            )
+            logger.info(f"Manually queued {count} fresh roast announcements")
+            return count
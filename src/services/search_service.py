@@ -0,0 +1,276 @@
+"""Product search - full-text index with fuzzy matching and transliteration.
+
+The ``product_search`` index covers name_ua, name_en, origin, region, variety
+and tasting_notes (plus their Latin transliteration, so "efiopiya" finds
+"Ефіопія" and "гейша" finds "Geisha").
+
+* SQLite: FTS5 virtual table ranked by bm25; typos are corrected with
+  Levenshtein distance against the index vocabulary (``fts5vocab``).
+* PostgreSQL: table with a weighted ``tsvector`` (GIN) ranked by ts_rank,
+  plus pg_trgm ``word_similarity`` for typos.
+
+The index is rebuilt on startup and kept up to date by mapper events on
+Product (insert/update/delete through the ORM).
+"""
+import logging
+import re
+from typing import Dict, List, Optional, Sequence
+
+from sqlalchemy import event, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Product
+
+logger = logging.getLogger(__name__)
+
+# Ukrainian (and Russian-only letters) → Latin, tuned for coffee names
+_TRANSLIT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "ґ": "g", "д": "d", "е": "e",
+    "є": "ye", "ж": "zh", "з": "z", "и": "y", "і": "i", "ї": "yi", "й": "y",
+    "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r",
+    "с": "s", "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch",
+    "ш": "sh", "щ": "shch", "ь": "", "ю": "yu", "я": "ya", "'": "", "’": "",
+    "ё": "yo", "ы": "y", "э": "e", "ъ": "",
+}
+# Letter pairs spelled differently in coffee names ("гейша" → "geisha")
+_TRANSLIT_PAIRS = {"ей": "ei"}
+_PAIR_RE = re.compile("|".join(_TRANSLIT_PAIRS))
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+# Search index state (per process)
+_enabled = False
+_vocabulary: Optional[List[str]] = None
+
+
+def transliterate(value: str) -> str:
+    """Cyrillic → Latin transliteration (lowercase)."""
+    value = _PAIR_RE.sub(lambda m: _TRANSLIT_PAIRS[m.group()], value.lower())
+    return "".join(_TRANSLIT.get(ch, ch) for ch in value)
+
+
+def _tokens(value: str) -> List[str]:
+    return [t for t in _WORD_RE.findall(value.lower()) if len(t) > 1]
+
+
+def levenshtein(a: str, b: str, max_distance: int = 2) -> int:
+    """Edit distance between a and b (stops early above max_distance)."""
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ca != cb)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+
+def _documents(product) -> Dict[str, str]:
+    """Build indexed text for a product: name part and details part."""
+    name = " ".join(filter(None, [product.name_ua, product.name_en]))
+    notes = product.tasting_notes or []
+    if isinstance(notes, str):
+        notes = [notes]
+    details = " ".join(filter(None, [
+        product.origin, product.region, product.variety, " ".join(map(str, notes))
+    ]))
+    return {
+        "name": f"{name} {transliterate(name)}",
+        "details": f"{details} {transliterate(details)}",
+    }
+
+
+# ---------- index maintenance (sync, runs inside flush / run_sync) ----------
+
+def _write_index(connection, product) -> None:
+    docs = _documents(product)
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "INSERT INTO product_search (product_id, document, tsv) VALUES ("
+            ":id, :document, "
+            "setweight(to_tsvector('simple', :name), 'A') || setweight(to_tsvector('simple', :details), 'B')) "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document, tsv = EXCLUDED.tsv"
+        ), {"id": product.id, "document": f"{docs['name']} {docs['details']}", **docs})
+    else:
+        connection.execute(text("DELETE FROM product_search WHERE rowid = :id"), {"id": product.id})
+        connection.execute(text(
+            "INSERT INTO product_search (rowid, name, details) VALUES (:id, :name, :details)"
+        ), {"id": product.id, **docs})
+
+
+def _delete_index(connection, product_id: int) -> None:
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("DELETE FROM product_search WHERE product_id = :id"), {"id": product_id})
+    else:
+        connection.execute(text("DELETE FROM product_search WHERE rowid = :id"), {"id": product_id})
+
+
+@event.listens_for(Product, "after_insert")
+@event.listens_for(Product, "after_update")
+def _on_product_saved(mapper, connection, target) -> None:
+    global _vocabulary
+    if _enabled:
+        _write_index(connection, target)
+        _vocabulary = None
+
+
+@event.listens_for(Product, "after_delete")
+def _on_product_deleted(mapper, connection, target) -> None:
+    global _vocabulary
+    if _enabled:
+        _delete_index(connection, target.id)
+        _vocabulary = None
+
+
+class SearchService:
+    """Service for product full-text search."""
+
+    @staticmethod
+    def setup(connection) -> None:
+        """Create the search index and (re)build it from products.
+
+        Called from init_db via ``run_sync``. If the database can't provide
+        the index (no FTS5 / no pg_trgm) search falls back to ILIKE.
+        """
+        global _enabled, _vocabulary
+        _enabled = False
+        _vocabulary = None
+        try:
+            with connection.begin_nested():
+                if connection.dialect.name == "postgresql":
+                    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                    connection.execute(text(
+                        "CREATE TABLE IF NOT EXISTS product_search ("
+                        "product_id INTEGER PRIMARY KEY REFERENCES products(id) ON DELETE CASCADE, "
+                        "document TEXT NOT NULL, tsv TSVECTOR NOT NULL)"
+                    ))
+                    connection.execute(text(
+                        "CREATE INDEX IF NOT EXISTS idx_product_search_tsv ON product_search USING GIN (tsv)"
+                    ))
+                    connection.execute(text(
+                        "CREATE INDEX IF NOT EXISTS idx_product_search_trgm "
+                        "ON product_search USING GIN (document gin_trgm_ops)"
+                    ))
+                else:
+                    connection.execute(text(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5("
+                        "name, details, tokenize = 'unicode61 remove_diacritics 2')"
+                    ))
+                    connection.execute(text(
+                        "CREATE VIRTUAL TABLE IF NOT EXISTS product_search_vocab "
+                        "USING fts5vocab(product_search, 'row')"
+                    ))
+
+                # Rebuild: catches changes made outside the ORM / other processes
+                connection.execute(text("DELETE FROM product_search"))
+                products = connection.execute(select(
+                    Product.id, Product.name_ua, Product.name_en, Product.origin,
+                    Product.region, Product.variety, Product.tasting_notes
+                )).all()
+                for product in products:
+                    _write_index(connection, product)
+        except Exception as e:
+            logger.warning(f"Product search index unavailable, using ILIKE search: {e}")
+            return
+
+        _enabled = True
+        logger.info(f"Product search index built ({len(products)} products)")
+
+    @staticmethod
+    async def _get_vocabulary(session: AsyncSession) -> List[str]:
+        """Index terms for typo correction (SQLite)."""
+        global _vocabulary
+        if _vocabulary is None:
+            result = await session.execute(text("SELECT term FROM product_search_vocab"))
+            _vocabulary = [row[0] for row in result.all()]
+        return _vocabulary
+
+    @staticmethod
+    def _fuzzy_terms(token: str, vocabulary: Sequence[str]) -> List[str]:
+        """Vocabulary terms within edit distance of a (misspelled) token."""
+        if len(token) < 4:
+            return []
+        max_distance = 1 if len(token) < 7 else 2
+        return [
+            term for term in vocabulary
+            if levenshtein(token, term, max_distance) <= max_distance
+        ][:5]
+
+    @staticmethod
+    async def _search_ids(session: AsyncSession, query_text: str, limit: int) -> List[int]:
+        """Ranked product IDs from the index."""
+        tokens = _tokens(query_text)
+        translit_tokens = _tokens(transliterate(query_text))
+        if not tokens:
+            return []
+
+        if session.bind.dialect.name == "postgresql":
+            terms = sorted(set(tokens + translit_tokens))
+            ts_query = " | ".join(f"{t}:*" for t in terms)
+            result = await session.execute(text(
+                "SELECT s.product_id FROM product_search s, to_tsquery('simple', :ts_query) q "
+                "WHERE s.tsv @@ q OR :q <% s.document OR :qt <% s.document "
+                "ORDER BY ts_rank(s.tsv, q) "
+                "+ greatest(word_similarity(:q, s.document), word_similarity(:qt, s.document)) DESC "
+                "LIMIT :limit"
+            ), {
+                "ts_query": ts_query,
+                "q": query_text.lower(),
+                "qt": transliterate(query_text),
+                "limit": limit,
+            })
+            return [row[0] for row in result.all()]
+
+        # SQLite FTS5: prefix match for each token and its transliteration,
+        # exact match for vocabulary terms close to a misspelled token
+        vocabulary = await SearchService._get_vocabulary(session)
+        terms = set()
+        for token in set(tokens + translit_tokens):
+            terms.add(f'"{token}"*')
+            if not any(term.startswith(token) for term in vocabulary):
+                terms.update(f'"{term}"' for term in SearchService._fuzzy_terms(token, vocabulary))
+
+        result = await session.execute(text(
+            "SELECT rowid FROM product_search WHERE product_search MATCH :match "
+            "ORDER BY bm25(product_search, 10.0, 1.0) LIMIT :limit"
+        ), {"match": " OR ".join(sorted(terms)), "limit": limit})
+        return [row[0] for row in result.all()]
+
+    @staticmethod
+    async def search(session: AsyncSession, query_text: str, limit: int = 20) -> List[Product]:
+        """Search active products by name, origin, region, variety, tasting notes.
+
+        Args:
+            session: Database session
+            query_text: User's free-text query
+            limit: Max results
+
+        Returns:
+            Active products, best match first
+        """
+        if not _enabled:
+            result = await session.execute(
+                select(Product).where(
+                    Product.name_ua.ilike(f"%{query_text}%"),
+                    Product.is_active == True
+                ).limit(limit)
+            )
+            return list(result.scalars().all())
+
+        # Over-fetch: inactive products are filtered out afterwards
+        ids = await SearchService._search_ids(session, query_text, limit * 2)
+        if not ids:
+            return []
+
+        result = await session.execute(
+            select(Product).where(Product.id.in_(ids), Product.is_active == True)
+        )
+        by_id = {p.id: p for p in result.scalars().all()}
+        return [by_id[i] for i in ids if i in by_id][:limit]
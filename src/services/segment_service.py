@@ -0,0 +1,84 @@
+"""User segments - loyalty and activity buckets counted in one query.
+
+Every segment is a SQL condition on ``users``; ``get_counts`` evaluates all of
+them as ``SUM(CASE ...)`` columns of a single aggregate query, so dashboards
+and audience previews cost one round trip however many segments there are.
+Activity segments rely on ``last_active_at``, which the update middleware
+touches at most once per ``user_activity_interval``.
+"""
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+from config import LOYALTY_LEVELS
+
+# Display names of non-loyalty segments
+SEGMENT_NAMES = {
+    "all": "Усі користувачі",
+    "active_7d": "Активні за 7 днів",
+    "active_30d": "Активні за 30 днів",
+    "dormant_30d": "Неактивні понад 30 днів",
+    "buyers": "Мають замовлення",
+    "no_orders": "Без замовлень",
+    "lapsed_buyers": "Не замовляли понад 30 днів",
+    "close_to_level_2": "Близько до рівня 2",
+}
+
+
+class SegmentService:
+    """Service for user segment conditions and counts."""
+
+    @staticmethod
+    def conditions(now: Optional[datetime] = None) -> Dict[str, object]:
+        """SQL condition per segment name (loyalty levels are 'level_N')."""
+        now = now or datetime.utcnow()
+        week_ago = now - timedelta(days=7)
+        month_ago = now - timedelta(days=30)
+
+        segments = {
+            "all": User.id.is_not(None),
+            "active_7d": User.last_active_at >= week_ago,
+            "active_30d": User.last_active_at >= month_ago,
+            "dormant_30d": User.last_active_at < month_ago,
+            "buyers": User.total_orders > 0,
+            "no_orders": User.total_orders == 0,
+            "lapsed_buyers": and_(User.total_orders > 0, User.last_order_at < month_ago),
+            "close_to_level_2": and_(
+                User.loyalty_level == 1,
+                User.total_purchased_kg >= 3,
+                User.total_purchased_kg < 5
+            ),
+        }
+        for level in LOYALTY_LEVELS:
+            segments[f"level_{level}"] = User.loyalty_level == level
+        return segments
+
+    @staticmethod
+    def condition(name: str):
+        """SQL condition for one segment (KeyError if unknown)."""
+        return SegmentService.conditions()[name]
+
+    @staticmethod
+    async def get_counts(session: AsyncSession, names: Optional[List[str]] = None) -> Dict[str, int]:
+        """Size of every (or the named) segment in a single aggregate query.
+
+        Args:
+            session: Database session
+            names: Segment names, all segments if None
+
+        Returns:
+            Dict segment name -> number of users
+        """
+        segments = SegmentService.conditions()
+        if names is not None:
+            segments = {name: segments[name] for name in names}
+
+        query = select(*[
+            func.coalesce(func.sum(case((condition, 1), else_=0)), 0).label(name)
+            for name, condition in segments.items()
+        ])
+        row = (await session.execute(query)).one()
+        return {name: int(value) for name, value in zip(segments, row)}
@@ -0,0 +1,116 @@
+"""Set-based targeting for automated notifications.
+
+Candidate lists are computed by the database in one query (window functions
+over ``orders`` and ``order_lines``) instead of a few lookups per user, so a
+daily job costs the same handful of queries for 10 or 10,000 recipients.
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import Order, OrderLine, Product, User
+from src.services.metrics_service import SOLD_STATUSES
+
+
+@dataclass
+class ReplenishmentTarget:
+    """User due for a replenishment reminder."""
+    user: User
+    last_order_id: int
+    last_order_at: datetime
+    favorite_product: Optional[str]  # Most ordered product of the last order
+
+
+class TargetingService:
+    """Service for notification audiences."""
+
+    @staticmethod
+    async def get_replenishment_targets(
+        session: AsyncSession,
+        window_start_days: int = 25,
+        window_end_days: int = 20,
+        recent_days: int = 3,
+        now: Optional[datetime] = None
+    ) -> List[ReplenishmentTarget]:
+        """Users with an order in the reminder window and none recently.
+
+        One query: a ROW_NUMBER() over each user's sold orders picks the last
+        order (a window MAX flags users with an order in the reminder window),
+        and a ROW_NUMBER() over the last orders' lines picks the favorite
+        product.
+
+        Args:
+            session: Database session
+            window_start_days: Oldest order age in the window (days)
+            window_end_days: Newest order age in the window (days)
+            recent_days: Skip users who ordered within this many days
+            now: Reference time (utcnow if None)
+
+        Returns:
+            List of ReplenishmentTarget
+        """
+        now = now or datetime.utcnow()
+        window_start = now - timedelta(days=window_start_days)
+        window_end = now - timedelta(days=window_end_days)
+        recent_cutoff = now - timedelta(days=recent_days)
+
+        in_window = and_(Order.created_at >= window_start, Order.created_at <= window_end)
+        ranked_orders = (
+            select(
+                Order.id.label('order_id'),
+                Order.user_id,
+                Order.created_at,
+                func.row_number().over(
+                    partition_by=Order.user_id,
+                    order_by=(Order.created_at.desc(), Order.id.desc())
+                ).label('rn'),
+                func.max(case((in_window, 1), else_=0)).over(partition_by=Order.user_id).label('in_window'),
+            )
+            .where(Order.status.in_(SOLD_STATUSES))
+            .cte('ranked_orders')
+        )
+        last_orders = (
+            select(ranked_orders.c.order_id, ranked_orders.c.user_id, ranked_orders.c.created_at)
+            .where(
+                ranked_orders.c.rn == 1,
+                ranked_orders.c.in_window == 1,
+                ranked_orders.c.created_at < recent_cutoff
+            )
+            .cte('last_orders')
+        )
+        ranked_products = (
+            select(
+                OrderLine.order_id,
+                OrderLine.product_id,
+                func.row_number().over(
+                    partition_by=OrderLine.order_id,
+                    order_by=(func.sum(OrderLine.quantity).desc(), OrderLine.product_id)
+                ).label('rn'),
+            )
+            .join(last_orders, last_orders.c.order_id == OrderLine.order_id)
+            .group_by(OrderLine.order_id, OrderLine.product_id)
+            .cte('ranked_products')
+        )
+
+        result = await session.execute(
+            select(User, last_orders.c.order_id, last_orders.c.created_at, Product.name_ua)
+            .join(last_orders, last_orders.c.user_id == User.id)
+            .outerjoin(
+                ranked_products,
+                and_(ranked_products.c.order_id == last_orders.c.order_id, ranked_products.c.rn == 1)
+            )
+            .outerjoin(Product, Product.id == ranked_products.c.product_id)
+            .order_by(User.id)
+        )
+        return [
+            ReplenishmentTarget(
+                user=user,
+                last_order_id=order_id,
+                last_order_at=created_at,
+                favorite_product=product_name
+            )
+            for user, order_id, created_at, product_name in result.all()
+        ]
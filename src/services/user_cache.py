@@ -0,0 +1,126 @@
+"""Per-process identity cache for users (TTL + LRU, keyed by Telegram ID).
+
+The update middleware used to SELECT the user on every button press. Now it
+keeps a snapshot of the user's columns and re-attaches it to the update's
+session without a query (only when the handler actually uses the session). Rows changed by another session (e.g. admin marks an
+order as paid) must call ``user_cache.invalidate(user_id)``.
+
+The cache is per process: with several workers, a snapshot may be up to
+``user_cache_ttl`` seconds behind a change made by another worker. That is
+fine for display; write paths that depend on current values (checkout,
+paying an order) re-read the row first.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.database.models import User
+
+_USER_COLUMNS = [attr.key for attr in User.__mapper__.column_attrs]
+
+
+class UserIdentityCache:
+    """TTL/LRU cache of User column snapshots."""
+
+    def __init__(self, ttl: float = 60.0, max_size: int = 10_000):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: "OrderedDict[int, tuple[Dict[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_snapshot(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Return cached column values or None (counts hit/miss)."""
+        item = self._items.get(user_id)
+        if item and time.monotonic() - item[1] < self.ttl:
+            self._items.move_to_end(user_id)
+            self.hits += 1
+            return item[0]
+
+        if item:
+            self._items.pop(user_id, None)
+        self.misses += 1
+        return None
+
+    def get_detached(self, user_id: int) -> Optional[User]:
+        """Build a detached User from the cached snapshot (no SQL).
+
+        The instance can be attached with ``session.add()`` (or
+        ``LazySession.adopt()``) without hitting the database.
+
+        Returns:
+            Detached User, or None on cache miss
+        """
+        snapshot = self.get_snapshot(user_id)
+        if snapshot is None:
+            return None
+
+        user = User.__mapper__.class_manager.new_instance()
+        for key, value in snapshot.items():
+            # Committed values: nothing is flushed back unless a handler changes it
+            set_committed_value(user, key, value)
+        make_transient_to_detached(user)
+        return user
+
+    async def attach(self, session: AsyncSession, user_id: int) -> Optional[User]:
+        """Attach cached user to session as a persistent object (no SQL).
+
+        Args:
+            session: Session of the current update
+            user_id: Telegram user ID
+
+        Returns:
+            User bound to session, or None on cache miss
+        """
+        user = self.get_detached(user_id)
+        if user is None:
+            return None
+        return await session.merge(user, load=False)
+
+    def put(self, user: User) -> None:
+        """Remember the user's current (committed) column values."""
+        state = inspect(user)
+        if not state.has_identity:
+            return
+        if state.modified:
+            # Uncommitted changes must never leak into the cache
+            self.invalidate(state.identity[0])
+            return
+
+        loaded = state.dict
+        if any(key not in loaded for key in _USER_COLUMNS):
+            # Server-side values (last_active_at) are expired after UPDATE - reload next time
+            self.invalidate(state.identity[0])
+            return
+
+        user_id = state.identity[0]
+        self._items[user_id] = ({key: loaded[key] for key in _USER_COLUMNS}, time.monotonic())
+        self._items.move_to_end(user_id)
+        while len(self._items) > self.max_size:
+            self._items.popitem(last=False)
+
+    def invalidate(self, user_id: Optional[int] = None) -> None:
+        """Drop one user (or everybody if user_id is None)."""
+        if user_id is None:
+            self._items.clear()
+        else:
+            self._items.pop(user_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "size": len(self._items),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 1) if total else 0.0,
+        }
+
+
+# Global cache instance (settings applied in bot.py)
+user_cache = UserIdentityCache()
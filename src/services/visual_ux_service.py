@@ -175,20 +175,22 @@ class VisualUXService:
     @staticmethod
     def create_bundle_recommendation(
         cart_items: List[Tuple],
-        user: User
+        user: User,
+        active_rules
     ) -> Optional[str]:
         """Create smart bundle recommendation based on cart.
         
         Args:
             cart_items: List of (CartItem, Product) tuples
             user: User object
+            active_rules: Volume rules (``await DiscountEngine.get_volume_rules(session)``)
             
         Returns:
             Formatted recommendation or None
         """
         from src.services.discount_engine import DiscountEngine
         
-        breakdown = DiscountEngine.calculate_full_discount(cart_items, user)
+        breakdown = DiscountEngine.calculate_full_discount(cart_items, user, active_rules=active_rules)
         
         # Analyze cart composition
         total_packs = breakdown.total_packs_300g
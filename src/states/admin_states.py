@@ -130,6 +130,7 @@ class AdminStates(StatesGroup):
     waiting_for_volume_discount_threshold = State()
     waiting_for_volume_discount_percent = State()
     waiting_for_volume_discount_description = State()
+    waiting_for_discount_simulation_rules = State()
     
     # Text Content
     waiting_for_text_content = State()
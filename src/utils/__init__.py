@@ -6,7 +6,8 @@ from src.utils.constants import (
 from src.utils.formatters import (
     format_currency, format_progress_bar, format_discount_info,
     format_tasting_notes, format_date, format_cart_summary,
-    format_order_items, pluralize_ua, format_weight, truncate_text
+    format_order_items, pluralize_ua, format_weight, truncate_text,
+    format_skipped_items
 )
 from src.utils.validators import (
     validate_phone, validate_promo_code, sanitize_user_input,
@@ -21,6 +22,7 @@ __all__ = [
     'format_currency', 'format_progress_bar', 'format_discount_info',
     'format_tasting_notes', 'format_date', 'format_cart_summary',
     'format_order_items', 'pluralize_ua', 'format_weight', 'truncate_text',
+    'format_skipped_items',
     # Validators
     'validate_phone', 'validate_promo_code', 'sanitize_user_input',
     'validate_city_name', 'validate_address',
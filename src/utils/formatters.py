@@ -149,6 +149,16 @@ def truncate_text(text: str, max_length: int = 100, suffix: str = "...") -> str:
     return text[:max_length - len(suffix)] + suffix
 
 
+def format_skipped_items(names: List[str], max_length: int = 120) -> str:
+    """Line listing items that couldn't be added to the cart ('' if none).
+    
+    Short enough for a callback alert (200 characters).
+    """
+    if not names:
+        return ""
+    return "\n⚠️ Недоступні: " + truncate_text(", ".join(names), max_length)
+
+
 async def generate_product_description(
     name: str, 
     notes: List[str] = None, 
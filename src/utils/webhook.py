@@ -0,0 +1,88 @@
+"""Webhook runtime (aiohttp) used instead of long polling when WEBHOOK_URL is set."""
+import asyncio
+import logging
+from typing import Any, Dict
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class BoundedRequestHandler(SimpleRequestHandler):
+    """Webhook handler that answers Telegram immediately and caps running handlers.
+
+    Telegram gets its 200 as soon as the update is accepted; the update itself
+    is processed in a background task. A semaphore limits how many updates are
+    inside the dispatcher at once so a promo push cannot exhaust the DB pool.
+    """
+
+    def __init__(self, dispatcher: Dispatcher, bot: Bot, max_concurrency: int, **kwargs: Any):
+        super().__init__(dispatcher=dispatcher, bot=bot, handle_in_background=True, **kwargs)
+        self._semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _background_feed_update(self, bot: Bot, update: Dict[str, Any]) -> None:
+        async with self._semaphore:
+            try:
+                await super()._background_feed_update(bot, update)
+            except Exception as e:
+                logger.error(f"Error processing webhook update {update.get('update_id')}: {e}")
+
+    @property
+    def in_flight(self) -> int:
+        """Number of accepted updates that have not finished yet."""
+        return len(self._background_feed_update_tasks)
+
+
+def build_webhook_app(bot: Bot, dp: Dispatcher) -> web.Application:
+    """Create aiohttp application with the webhook route and a health check."""
+    app = web.Application()
+
+    handler = BoundedRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        max_concurrency=settings.webhook_max_concurrency,
+        secret_token=settings.webhook_secret or None,
+    )
+    handler.register(app, path=settings.webhook_path)
+
+    async def health(request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok", "in_flight": handler.in_flight})
+
+    app.router.add_get("/health", health)
+
+    setup_application(app, dp, bot=bot)
+    return app
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher) -> None:
+    """Register the webhook with Telegram and serve updates until cancelled."""
+    webhook_url = settings.webhook_url.rstrip("/") + settings.webhook_path
+
+    # Pending updates are kept: Telegram redelivers them once the server is up
+    await bot.set_webhook(
+        url=webhook_url,
+        secret_token=settings.webhook_secret or None,
+        allowed_updates=dp.resolve_used_update_types(),
+        max_connections=min(max(settings.webhook_max_concurrency, 1), 100),
+        drop_pending_updates=False,
+    )
+    logger.info(f"Webhook set to {webhook_url}")
+
+    if not settings.webhook_secret:
+        logger.warning("WEBHOOK_SECRET is empty - incoming requests are not authenticated!")
+
+    app = build_webhook_app(bot, dp)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host=settings.webhook_host, port=settings.webhook_port)
+    await site.start()
+    logger.info(f"Webhook server listening on {settings.webhook_host}:{settings.webhook_port}")
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()